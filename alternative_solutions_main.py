@@ -26,7 +26,7 @@ def get_arguments() -> dict:
     parser.add_argument("--method", type=str, default="gaussian", help=f"gaussian or local_search")
     parser.add_argument("--threshold", type=int, default=5, help=f"Threshold for local search or standard deviation for gaussian")
     parser.add_argument("--max_iter", type=int, default=100, help=f"Maximum number of iterations")
-    parser.add_argument("--max_evals", type=int, default=100, help=f"Maximum number of evaluations")
+    parser.add_argument("--max_evals", type=int, default=100, help=f"Maximum number of fitness evaluations (fitness cache hits are not counted)")
     parser.add_argument("--verbose", type=int, default=1, help=f"Prints information about the process")
     return vars(parser.parse_args())
 
@@ -71,7 +71,7 @@ def process_arguments():
 # python alternative_solutions_main.py --input_name womhd.jpg --vertex_count 1000 --width 250 --height 250 --method gaussian --threshold 100 --max_iter 5000
 def main(args):
     ip = ImageProcessor(**args)
-    ea = EA(ip)
+    ea = EA(ip, seed=args["seed"])
     alt_solver = LocalSearchSolver(ea)
     seed = args["seed"]
     method = args["method"]
@@ -0,0 +1,98 @@
+import argparse
+import sys
+import os
+
+from src.lib.deap_config import DeapConfig
+from src.evaluation.benchmark import Benchmark, STAGES, DEFAULT_IMAGES, DEFAULT_WIDTHS, \
+                                     DEFAULT_VERTEX_COUNTS, DEFAULT_REPEATS, DEFAULT_POPULATION_SIZE, \
+                                     DEFAULT_GENERATIONS, DEFAULT_TOLERANCE
+
+def get_arguments() -> dict:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=0, help="Seed for random number generator")
+
+    # Matrix of cases
+    parser.add_argument("--input_path", type=str, default="./data/inputs")
+    parser.add_argument("--images", type=str, nargs="+", default=DEFAULT_IMAGES, help="Images of the input path")
+    parser.add_argument("--widths", type=int, nargs="+", default=DEFAULT_WIDTHS, help="Image widths")
+    parser.add_argument("--vertex_counts", type=int, nargs="+", default=DEFAULT_VERTEX_COUNTS, help="Vertex counts")
+    parser.add_argument("--stages", type=str, nargs="+", default=STAGES, help=f"Stages to benchmark ({', '.join(STAGES)})")
+
+    # Measurement
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Timed calls of each stage")
+    parser.add_argument("--population_size", type=int, default=DEFAULT_POPULATION_SIZE, help="MU and LAMBDA of population stages")
+    parser.add_argument("--generations", type=int, default=DEFAULT_GENERATIONS, help="Generations of the generation stage")
+
+    # Report
+    parser.add_argument("--output_path", type=str, default="./data/outputs/benchmarks")
+    parser.add_argument("--output_name", type=str, default="benchmark.json")
+    parser.add_argument("--compare", type=str, default=None, help="Previous report to detect regressions against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Relative slowdown considered a regression")
+    parser.add_argument("--verbose", type=int, default=1, help=f"Prints information about the process")
+    return vars(parser.parse_args())
+
+def check_preconditions(args):
+    # Chek values' domains
+    if any(width < 1 for width in args["widths"]):
+        raise Exception("Invalid image width")
+    if any(vertex_count < 5 for vertex_count in args["vertex_counts"]):
+        raise Exception("Invalid vertex count, must be at least 5")
+    if any(stage not in STAGES for stage in args["stages"]):
+        raise Exception(f"Invalid stage. Try ({', '.join(STAGES)})")
+    if args["repeats"] < 1:
+        raise Exception("Repeats must be at least 1")
+    if args["population_size"] < 1:
+        raise Exception("Population size must be at least 1")
+    if args["generations"] < 1:
+        raise Exception("Generations must be at least 1")
+    if args["tolerance"] < 0:
+        raise Exception("Tolerance must be positive")
+    if args["verbose"] not in [0, 1]:
+        raise Exception("Verbose must be 0 or 1")
+
+    # Check directories
+    if not os.path.isdir(args["input_path"]):
+        raise Exception(f"Input path {args['input_path']} does not exist")
+    for image in args["images"]:
+        if not os.path.isfile(os.path.join(args["input_path"], image)):
+            raise Exception(f"Input file {image} does not exist in {args['input_path']}")
+    if args["compare"] is not None and not os.path.isfile(args["compare"]):
+        raise Exception(f"Report {args['compare']} does not exist")
+    return args
+
+def process_arguments():
+    try:
+        args = get_arguments()
+        args = check_preconditions(args)
+    except Exception as e:
+        print(str(e))
+        sys.exit(1)
+    return args
+
+# Command example:
+# python benchmark_main.py --widths 100 250 --vertex_counts 100 1000 --compare ./data/outputs/benchmarks/baseline.json
+def main(args):
+    DeapConfig.register_fitness()
+    benchmark = Benchmark(image_path=args["input_path"], images=args["images"], widths=args["widths"],
+                          vertex_counts=args["vertex_counts"], repeats=args["repeats"],
+                          population_size=args["population_size"], generations=args["generations"],
+                          stages=args["stages"], seed=args["seed"])
+    report = benchmark.run(verbose=args["verbose"])
+    output_filepath = os.path.join(args["output_path"], args["output_name"])
+    Benchmark.save(report, output_filepath)
+    print(f"Report saved in {output_filepath}")
+
+    if args["compare"] is None:
+        return
+    regressions = Benchmark.compare(Benchmark.load(args["compare"]), report, args["tolerance"])
+    for regression in regressions:
+        print(f"Regression in {regression['image']} {regression['width']}px {regression['vertex_count']} vertices | "
+              f"{regression['stage']}: {regression['previous_median_seconds']*1000:.3f} -> "
+              f"{regression['median_seconds']*1000:.3f} ms/call (+{regression['slowdown']:.0%})")
+    if len(regressions) > 0:
+        sys.exit(1)
+    print(f"No regressions against {args['compare']}")
+
+if __name__ == "__main__":
+    args = process_arguments()
+    main(args)
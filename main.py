@@ -8,6 +8,7 @@ from src.models.evolutionary_algorithm.ea_methods import EA
 from src.models.evolutionary_algorithm.ea_handler import EAHandler
 from src.lib.deap_config import DeapConfig
 from src.utils.image_processor import ImageProcessor
+from src.utils.preprocessing_cache import PreprocessingCache
 
 def get_arguments() -> dict:
     parser = argparse.ArgumentParser()
@@ -22,6 +23,12 @@ def get_arguments() -> dict:
     parser.add_argument("--LAMBDA", type=int, default=50, help="Number of children to produce at each generation")
     parser.add_argument("--selection", type=str, default="best", help="Selection method (best, roulette, tournament)")
     parser.add_argument("--tournament_size", type=int, default=2, help="Tournament size")
+    parser.add_argument("--pyramid_levels", type=int, default=1, help="Resolution levels of coarse-to-fine evolution (each level halves the resolution of the next one)")
+    parser.add_argument("--pyramid_stall", type=int, default=0, help="Generations without improvement before moving to the next resolution level (0 only follows the schedule)")
+    parser.add_argument("--improvement_window", type=int, default=0, help="Stop when the best fitness does not improve more than min_improvement in this number of generations (0 disables it)")
+    parser.add_argument("--min_improvement", type=float, default=0, help="Minimum relative improvement of the best fitness in improvement_window generations")
+    parser.add_argument("--max_seconds", type=float, default=0, help="Wall-clock budget in seconds (0 disables it)")
+    parser.add_argument("--max_evals", type=int, default=0, help="Budget of fitness evaluations, without fitness cache hits (0 disables it)")
     parser.add_argument("--gaussian_rate", type=float, default=0.05, help="Gaussian rate. Multiplied by the max value of the mutated gene (coordinate)")
 
     # Image Processing
@@ -35,8 +42,24 @@ def get_arguments() -> dict:
     # Specific solution parameters
     parser.add_argument("--vertex_count", type=int, default=None, help=f"Number of vertices in result image")
     parser.add_argument("--cpu_count", type=int, default=1, help="Number of CPUs to use")
+    parser.add_argument("--islands", type=int, default=1, help="Number of island subpopulations (one process each, max_evals is split between them)")
+    parser.add_argument("--migration_interval", type=int, default=10, help="Generations between migrations of the island model")
+    parser.add_argument("--migration_size", type=int, default=1, help="Individuals sent by each island in a migration")
+    parser.add_argument("--migration_topology", type=str, default="ring", help="Migration topology (ring, random)")
+    parser.add_argument("--shared_memory", type=int, default=0, help="Share the original image with the worker processes through shared memory")
+    parser.add_argument("--checkpoint_path", type=str, default=None, help="File where the evolutionary state is periodically saved (.npz)")
+    parser.add_argument("--checkpoint_generations", type=int, default=10, help="Generations between checkpoints (0 disables this criterion)")
+    parser.add_argument("--checkpoint_seconds", type=float, default=0, help="Seconds between checkpoints (0 disables this criterion)")
+    parser.add_argument("--resume", type=int, default=0, help="Resume the run saved in checkpoint_path")
+    parser.add_argument("--profile", type=int, default=0, help="Adds the wall time of each stage of every generation to the logbook")
+    parser.add_argument("--profile_generations", type=int, nargs="*", default=[], help="Generations captured by the profiler (requires --profile 1)")
+    parser.add_argument("--profile_mode", type=str, default="cprofile", help="Profiler of profile_generations (cprofile, sampling)")
+    parser.add_argument("--profile_dir", type=str, default="./data/outputs/profiles", help="Directory of the captured profiles")
+    parser.add_argument("--cache_preprocessing", type=int, default=0, help="Reuse the resized, denoised and edge detected image of previous runs (cached on disk)")
     parser.add_argument("--tri_outline", type=str, default=None, help=f"Color of output triangle outline (debugging)")
+    parser.add_argument("--fitness_mode", type=str, default="analytic", help="Fitness from the pixel statistics of the triangles (analytic) or from rendered images (render), with pixel-center coverage and mean colors (values differ from the article)")
     parser.add_argument("--edge_rate", type=float, default=0.5, help=f"Number of edges in initialized individual")
+    parser.add_argument("--init_sampling", type=str, default="uniform", help="Sampling of initial vertices (uniform, stratified, weighted by edge strength)")
 
     # Console
     parser.add_argument("--verbose", type=int, default=1, help=f"Prints information to console")
@@ -54,8 +77,52 @@ def check_preconditions(args):
         raise Exception("Vertex count must be greater than 4")
     if args["cpu_count"] < 1:
         raise Exception("CPU count must be greater than 0")
+    if args["islands"] < 1:
+        raise Exception("Islands must be greater than 0")
+    if args["migration_interval"] < 1:
+        raise Exception("Migration interval must be greater than 0")
+    if args["migration_size"] < 0 or args["migration_size"] >= args["MU"]:
+        raise Exception("Migration size must be between 0 and MU-1")
+    if args["migration_topology"] not in ["ring", "random"]:
+        raise Exception("Migration topology must be one of the following: ring, random")
+    if args["pyramid_levels"] < 1:
+        raise Exception("Pyramid levels must be greater than 0")
+    if args["pyramid_stall"] < 0:
+        raise Exception("Pyramid stall must be greater or equal than 0")
+    if args["improvement_window"] < 0:
+        raise Exception("Improvement window must be greater or equal than 0")
+    if args["min_improvement"] < 0 or args["min_improvement"] >= 1:
+        raise Exception("Min improvement must be between 0 and 1")
+    if args["max_seconds"] < 0:
+        raise Exception("Max seconds must be greater or equal than 0")
+    if args["max_evals"] < 0:
+        raise Exception("Max evals must be greater or equal than 0")
+    if args["checkpoint_generations"] < 0:
+        raise Exception("Checkpoint generations must be greater or equal than 0")
+    if args["checkpoint_seconds"] < 0:
+        raise Exception("Checkpoint seconds must be greater or equal than 0")
+    if args["resume"] != 0 and args["resume"] != 1:
+        raise Exception("resume is a boolean value")
+    if args["checkpoint_path"] is not None and args["islands"] > 1:
+        raise Exception("Checkpoints are not supported by the island model")
     if args["edge_rate"] < 0 or args["edge_rate"] > 1:
         raise Exception("Edge rate must be between 0 and 1")
+    if args["profile"] != 0 and args["profile"] != 1:
+        raise Exception("profile is a boolean value")
+    if len(args["profile_generations"]) > 0 and args["profile"] == 0:
+        raise Exception("Profile generations require --profile 1")
+    if any(gen < 0 for gen in args["profile_generations"]):
+        raise Exception("Profile generations must be greater or equal than 0")
+    if args["profile_mode"] not in ["cprofile", "sampling"]:
+        raise Exception("Profile mode must be one of the following: cprofile, sampling")
+    if args["init_sampling"] not in ["uniform", "stratified", "weighted"]:
+        raise Exception("Init sampling must be one of the following: uniform, stratified, weighted")
+    if args["fitness_mode"] not in ["analytic", "render"]:
+        raise Exception("Fitness mode must be one of the following: analytic, render")
+    if args["cache_preprocessing"] != 0 and args["cache_preprocessing"] != 1:
+        raise Exception("cache_preprocessing is a boolean value")
+    if args["shared_memory"] != 0 and args["shared_memory"] != 1:
+        raise Exception("shared_memory is a boolean value")
     if args["manual_console"] != 0 and args["manual_console"] != 1:
         raise Exception("manual_console is a boolean value")
     if args["verbose"] != 0 and args["verbose"] != 1:
@@ -74,6 +141,8 @@ def check_preconditions(args):
         raise Exception(f"Input file {args['input_name']} does not exist in {args['input_path']}")
     if not os.path.isdir(args["output_path"]):
         raise Exception("Output path does not exist")
+    if args["resume"] == 1 and (args["checkpoint_path"] is None or not os.path.isfile(args["checkpoint_path"])):
+        raise Exception("Resume requires an existing checkpoint_path")
     return args
 
 def process_arguments():
@@ -87,8 +156,9 @@ def process_arguments():
 
 def main(args):
     dc = DeapConfig(**args)
-    ip = ImageProcessor(**args)
-    ea = EA(ip)
+    preprocessing_cache = PreprocessingCache() if args.get("cache_preprocessing") else None
+    ip = ImageProcessor(**args, preprocessing_cache=preprocessing_cache)
+    ea = EA(ip, seed=args["seed"])
     eac = EAHandler(ea, dc)
     eac.build_ea_module(**args)
     eac.build_deap_module()
@@ -115,12 +185,13 @@ if __name__ == "__main__":
     args = process_arguments()
     seed = args["seed"]; random.seed(seed)
     manual_console = args["manual_console"]
+    resume = bool(args["resume"])
     eac = main(args)
 
     if  manual_console == 1:
-        algorithm_thread = Thread(target=eac.run, args=())
+        algorithm_thread = Thread(target=eac.run, kwargs={"resume": resume})
         algorithm_thread.start()
         handle_inputs(algorithm_thread, eac)
         algorithm_thread.join()
     else:
-        eac.run()
\ No newline at end of file
+        eac.run(resume=resume)
\ No newline at end of file
@@ -6,6 +6,16 @@ dotenv.load_dotenv()
 production = os.environ.get("PRODUCTION", True)
 secret_key = os.environ.get("SECRET_KEY", "secret")
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379")
+
+# Transformation scheduler (server/lib/scheduler.py)
+SCHEDULER_SLOTS = int(os.environ.get("SCHEDULER_SLOTS", 2)) # Transformations running at the same time
+MAX_JOB_SECONDS = float(os.environ.get("MAX_JOB_SECONDS", 300)) # Estimated run time budget of a transformation
+MAX_QUEUE_LENGTH = int(os.environ.get("MAX_QUEUE_LENGTH", 100))
+
+# Result cache of finished transformations (server/lib/result_cache.py)
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 24 * 60 * 60))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
 celery_config = {
     "broker_url": REDIS_URL,
     "result_backend": REDIS_URL,
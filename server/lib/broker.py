@@ -4,6 +4,11 @@ from flask_redis import FlaskRedis
 from server import app
 #from flask import g
 
+# Generations of a transformation are streamed to the client (Redis Streams)
+STREAM_MAX_LENGTH = 128
+STREAM_EXPIRE_SECONDS = 60 * 60
+STREAM_BLOCK_SECONDS = 15
+
 def create_broker(app=app):
     return FlaskRedis(app)
 
@@ -31,8 +36,43 @@ def get(key: str, object=True):
 
     return value
 
-def get_added_image_key(user_id: str, i: int):
-    return f"added_image/{user_id}/{i}"
+def add_to_stream(key: str, value, max_length=STREAM_MAX_LENGTH, expire_seconds=STREAM_EXPIRE_SECONDS,
+                  object=True):
+    if object:
+        value = json.dumps(value)
+
+    event_id = broker.xadd(key, {"data": value}, maxlen=max_length, approximate=True)
+    broker.expire(key, expire_seconds)
+    return decode(event_id)
+
+def read_stream(key: str, last_id="0", block_seconds=STREAM_BLOCK_SECONDS):
+    """
+    Blocks until there are entries newer than last_id (or block_seconds pass).
+    Returns a list of (event_id, value) pairs.
+    """
+    streams = broker.xread({key: last_id}, block=int(block_seconds * 1000))
+    events = []
+    for _, entries in streams or []:
+        for event_id, fields in entries:
+            data = fields.get(b"data", fields.get("data"))
+            events.append((decode(event_id), json.loads(data)))
+    return events
+
+def read_stream_range(key: str):
+    """
+    Returns every (event_id, value) pair of the stream without blocking.
+    """
+    return [(decode(event_id), json.loads(fields.get(b"data", fields.get("data"))))
+            for event_id, fields in broker.xrange(key)]
+
+def delete(key: str):
+    broker.delete(key)
+
+def decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+def get_progress_stream_key(user_id: str):
+    return f"progress/{user_id}"
 
 def get_last_connection_key(user_id: str):
     return f"last_connection/{user_id}"
\ No newline at end of file
@@ -1,33 +1,72 @@
+import os
+import json
 import time
+import random
 
 from celery import shared_task
 from celery.contrib.abortable import AbortableTask
 
 from src.lib.deap_config import DeapConfig
+from src.lib.checkpoint import Checkpoint
 from src.models.evolutionary_algorithm.ea_handler import EAHandler
 from src.models.evolutionary_algorithm.ea_methods import EA
 from src.utils.image_processor import ImageProcessor
+from src.utils.preprocessing_cache import PreprocessingCache
+from server import config
 from server.lib import broker
+from server.lib import scheduler
+from server.lib import result_cache
+from server.lib import metrics
 
+PROGRESS_TOP_K = 8 # Individuals sent to the client after each generation
+CHECKPOINT_DIR = os.path.join("data", "outputs", "checkpoints")
+PREPROCESSING_CACHE = PreprocessingCache() # Shared by the tasks of a worker
+
+
+def get_image_callback(ea: EA, user_id: str, top_k=PROGRESS_TOP_K, render_best=False,
+                       is_aborted=lambda: False, events: list = None,
+                       max_events_bytes=config.RESULT_CACHE_MAX_BYTES):
+    # events collects the encoded progress of every generation (the stream is
+    # trimmed), and is cleared once it is too large to be cached
+    progress_stream_key = broker.get_progress_stream_key(user_id)
+    events_bytes = 0
 
-def get_image_callback(ea: EA, user_id: str):
     def image_added_callback(individuals_data: dict, generation: int):
-        encoded_images = {"images": [], "fitness": individuals_data["fitness"]}
-        images = individuals_data["population"]
-
-        for image in images:
-            image = ea.decode(image)
-            image = ea.image_processor.encode_image(image)
-            encoded_images["images"].append(image)
-            
-        added_image_key = broker.get_added_image_key(user_id, generation)
-        broker.set(added_image_key, encoded_images)
+        nonlocal events_bytes
+        if is_aborted(): # The stream belongs to a new transformation of the user
+            return
+        # Only the geometry of the best individuals is sent (rendered by the browser)
+        population = sorted(individuals_data["population"], key=lambda ind: ind.fitness.values[0])[:top_k]
+        progress = {"generation": generation, "individuals": []}
+
+        for individual in population:
+            geometry = ea.encode_geometry(individual)
+            geometry["fitness"] = individual.fitness.values[0]
+            progress["individuals"].append(geometry)
+
+        if render_best and len(population) > 0:
+            image = ea.decode(population[0])
+            progress["image"] = ea.image_processor.encode_image(image)
+
+        payload = json.dumps(progress)
+        metrics.observe(metrics.PAYLOAD_BYTES, len(payload))
+        broker.add_to_stream(progress_stream_key, payload, object=False)
+
+        if events is not None and events_bytes <= max_events_bytes:
+            events_bytes += len(payload)
+            events.append(payload)
+            if events_bytes > max_events_bytes:
+                events.clear()
         return
     
     return image_added_callback
 
-def get_stop_condition_callback(user_id: str, max_iddle_seconds=90):
+def get_stop_condition_callback(user_id: str, max_iddle_seconds=90, is_aborted=lambda: False):
     def stop_condition_callback():
+        if is_aborted():
+            print("Aborted by a new transformation")
+            return True
+
         last_connection_key = broker.get_last_connection_key(user_id)
         last_connection = broker.get(last_connection_key)
         current_time = time.time()
@@ -39,6 +78,7 @@ def get_stop_condition_callback(user_id: str, max_iddle_seconds=90):
         if current_time - last_connection > max_iddle_seconds:
             print("Max iddle time reached")
             broker.set(last_connection_key, None)
+            metrics.inc(metrics.IDLE_KILLS)
             return True
         
         print("Connection is still alive: ", current_time - last_connection, " seconds")
@@ -46,23 +86,58 @@ def get_stop_condition_callback(user_id: str, max_iddle_seconds=90):
     
     return stop_condition_callback
 
-@shared_task(bind=True, base=AbortableTask)
-def transform_image(self, image_processor_args: dict, ea_args: dict, user_id: str):
+# Acknowledged after finishing: a task lost with its worker is redelivered
+# with the same id and resumes from its last checkpoint
+@shared_task(bind=True, base=AbortableTask, acks_late=True, reject_on_worker_lost=True)
+def transform_image(self, image_processor_args: dict, ea_args: dict, user_id: str,
+                    job_id=None, cache_key=None):
+    evaluations, outcome = None, "failed"
+    checkpoint = Checkpoint(os.path.join(CHECKPOINT_DIR, f"{self.request.id}.npz"))
     try:
         image_processor_args["input_image"] = ImageProcessor.decode_image(image_processor_args["input_image"])
-        image_processor = ImageProcessor(**image_processor_args)
-        ea = EA(image_processor)
+        image_processor = ImageProcessor(**image_processor_args, preprocessing_cache=PREPROCESSING_CACHE)
+        random.seed(ea_args["seed"])
+        ea = EA(image_processor, seed=ea_args["seed"])
 
-        image_added_callback = get_image_callback(ea, user_id)
-        stop_condition_callback = get_stop_condition_callback(user_id)
+        # Resumed runs miss the progress of the generations before their checkpoint
+        resume = checkpoint.exists()
+        events = [] if cache_key is not None and not resume else None
+        image_added_callback = get_image_callback(ea, user_id, render_best=bool(ea_args.get("render_best", 0)),
+                                                  is_aborted=self.is_aborted, events=events)
+        stop_condition_callback = get_stop_condition_callback(user_id, is_aborted=self.is_aborted)
 
-        dc = DeapConfig(**ea_args)
+        # Generation timings are only used for the metrics
+        dc = DeapConfig(**ea_args, checkpoint_path=checkpoint.path, profile=True)
+        dc.profiler.add_hook(metrics.get_generation_hook())
         eac = EAHandler(ea, dc)
         eac.build_ea_module(**ea_args)
         eac.build_deap_module()
         eac.run(image_added_callback=image_added_callback,
                 stop_condition_callback=stop_condition_callback,
-                save=False)
+                save=False,
+                resume=resume)
+        evaluations = sum(eac.logbook.select("evals")) # Without fitness cache hits
+        checkpoint.delete()
+        if self.is_aborted(): # Nothing is sent to the stream of the new transformation
+            outcome = "cancelled"
+            return
+        outcome = "stopped" if dc.forced_stop else \
+                  "early_stopped" if dc.termination.reason is not None else "completed"
+
+        # Runs stopped by the client or by the time budget (which depends on
+        # the load of the server) are not reproducible
+        if events is not None and not dc.forced_stop and not dc.termination.out_of_time:
+            result_cache.set(cache_key, events, dc.NGEN)
+        broker.add_to_stream(broker.get_progress_stream_key(user_id), {"finished": True})
 
     except Exception as e:
-        print("Something wrong happened while initializing the EA; ", e)
\ No newline at end of file
+        print("Something wrong happened while initializing the EA; ", e)
+        checkpoint.delete()
+        if not self.is_aborted():
+            broker.add_to_stream(broker.get_progress_stream_key(user_id),
+                                 {"error": "Something went wrong while transforming the image"})
+
+    finally:
+        metrics.inc(metrics.RUNS, outcome=outcome)
+        if job_id is not None: # Frees the slot of the scheduler
+            scheduler.finish(job_id, evaluations)
@@ -0,0 +1,147 @@
+import os
+import socket
+
+from redis.exceptions import RedisError
+
+from server.lib import broker
+from src.lib.profiler import STAGES, GENERATION_COLUMN, CALLBACK_STAGE, get_column
+
+# Metrics of the web server and the Celery workers are aggregated in Redis
+# (counters and histogram buckets are incremented atomically) and exported
+# in the Prometheus text format by the /metrics route
+SAMPLES_KEY = "metrics/samples"
+GAUGES_KEY = "metrics/gauges"
+# Gauges of worker processes are kept in keys that expire, so recycled
+# processes do not leave series behind
+EXPIRING_GAUGE_PREFIX = "metrics/expiring_gauges/"
+EXPIRING_GAUGE_SECONDS = 120
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+EVALUATIONS = "polygonal_evaluations_total"
+EVALUATIONS_PER_SECOND = "polygonal_evaluations_per_second"
+GENERATION_SECONDS = "polygonal_generation_seconds"
+STAGE_SECONDS = "polygonal_stage_seconds_total"
+QUEUE_WAIT_SECONDS = "polygonal_queue_wait_seconds"
+CALLBACK_SECONDS = "polygonal_callback_encode_seconds"
+PAYLOAD_BYTES = "polygonal_redis_payload_bytes"
+ACTIVE_RUNS = "polygonal_active_runs"
+QUEUED_RUNS = "polygonal_queued_runs"
+RUNS = "polygonal_runs_total"
+IDLE_KILLS = "polygonal_idle_kills_total"
+STREAM_TIMEOUTS = "polygonal_stream_timeouts_total"
+
+METRICS = {
+    EVALUATIONS: (COUNTER, "Fitness evaluations computed by the workers of each host (without fitness cache hits)"),
+    EVALUATIONS_PER_SECOND: (GAUGE, "Fitness evaluations per second of the last generation of each worker process"),
+    GENERATION_SECONDS: (HISTOGRAM, "Wall time of a generation"),
+    STAGE_SECONDS: (COUNTER, "Wall time spent by generations in each stage"),
+    QUEUE_WAIT_SECONDS: (HISTOGRAM, "Time between the submission and the dispatch of a transformation"),
+    CALLBACK_SECONDS: (HISTOGRAM, "Time to encode the progress of a generation and add it to Redis"),
+    PAYLOAD_BYTES: (HISTOGRAM, "Size of the progress events added to Redis"),
+    ACTIVE_RUNS: (GAUGE, "Transformations running"),
+    QUEUED_RUNS: (GAUGE, "Transformations waiting in the scheduler queue"),
+    RUNS: (COUNTER, "Finished transformations by outcome (completed, early_stopped, stopped, cancelled, failed, cached)"),
+    IDLE_KILLS: (COUNTER, "Transformations stopped because their client stopped listening"),
+    STREAM_TIMEOUTS: (COUNTER, "Progress streams closed after waiting too long for an event"),
+}
+
+BUCKETS = {
+    GENERATION_SECONDS: [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30],
+    QUEUE_WAIT_SECONDS: [0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800],
+    CALLBACK_SECONDS: [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1],
+    PAYLOAD_BYTES: [1024, 4096, 16384, 65536, 262144, 1048576, 4194304],
+}
+
+def get_host():
+    return socket.gethostname()
+
+def get_worker():
+    return f"{get_host()}:{os.getpid()}"
+
+def format_labels(labels: dict):
+    if len(labels) == 0:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+def inc(name: str, value=1, **labels):
+    _execute(lambda pipeline: pipeline.hincrbyfloat(SAMPLES_KEY, name + format_labels(labels), value))
+
+def set_gauge(name: str, value, **labels):
+    _execute(lambda pipeline: pipeline.hset(GAUGES_KEY, name + format_labels(labels), value))
+
+def observe(name: str, value, **labels):
+    _execute(lambda pipeline: _observe(pipeline, name, value, labels))
+
+def get_generation_hook(host=None, worker=None):
+    """
+    Profiler hook (see src/lib/profiler.py) that records the evaluations and
+    stage times of every generation. Counters are labeled by host and the
+    per-second gauge by worker process.
+    """
+    host = get_host() if host is None else host
+    worker = get_worker() if worker is None else worker
+
+    def record_generation(pipeline, record: dict):
+        evals, seconds = record.get("evals", 0), record[GENERATION_COLUMN]
+        pipeline.hincrbyfloat(SAMPLES_KEY, EVALUATIONS + format_labels({"host": host}), evals)
+        if seconds > 0:
+            pipeline.set(EXPIRING_GAUGE_PREFIX + EVALUATIONS_PER_SECOND + format_labels({"worker": worker}),
+                         evals / seconds, ex=EXPIRING_GAUGE_SECONDS)
+        for stage in STAGES:
+            pipeline.hincrbyfloat(SAMPLES_KEY, STAGE_SECONDS + format_labels({"stage": stage}),
+                                  record[get_column(stage)])
+        _observe(pipeline, GENERATION_SECONDS, seconds, {})
+        _observe(pipeline, CALLBACK_SECONDS, record[get_column(CALLBACK_STAGE)], {})
+
+    return lambda gen, record: _execute(lambda pipeline: record_generation(pipeline, record))
+
+def render():
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    samples = {**broker.broker.hgetall(SAMPLES_KEY), **broker.broker.hgetall(GAUGES_KEY)}
+    samples = {broker.decode(sample): float(broker.decode(value)) for sample, value in samples.items()}
+    expiring_keys = list(broker.broker.scan_iter(match=EXPIRING_GAUGE_PREFIX + "*"))
+    for key, value in zip(expiring_keys, broker.broker.mget(expiring_keys) if expiring_keys else []):
+        if value is not None: # Expired since the scan
+            samples[broker.decode(key)[len(EXPIRING_GAUGE_PREFIX):]] = float(broker.decode(value))
+
+    lines = []
+    for name, (metric_type, description) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        prefixes = [f"{name}_bucket", f"{name}_sum", f"{name}_count"] if metric_type == HISTOGRAM else [name]
+        for prefix in prefixes:
+            family = [sample for sample in samples if sample.split("{")[0] == prefix]
+            for sample in sorted(family, key=_get_sort_key):
+                value = samples[sample]
+                lines.append(f"{sample} {int(value) if value.is_integer() else repr(value)}")
+    return "\n".join(lines) + "\n"
+
+def _observe(pipeline, name: str, value, labels: dict):
+    # Buckets are cumulative: every bucket with le >= value is incremented
+    # (the others are incremented by 0 so that every bucket is exported)
+    for le in BUCKETS[name] + ["+Inf"]:
+        pipeline.hincrby(SAMPLES_KEY, f"{name}_bucket" + format_labels({**labels, "le": le}),
+                         int(le == "+Inf" or value <= le))
+    pipeline.hincrbyfloat(SAMPLES_KEY, f"{name}_sum" + format_labels(labels), value)
+    pipeline.hincrby(SAMPLES_KEY, f"{name}_count" + format_labels(labels), 1)
+
+def _get_sort_key(sample: str):
+    # Histogram buckets are sorted by their upper bound
+    labels, _, le = sample.partition(',le="') if ',le="' in sample else sample.partition('{le="')
+    return (labels, float(le.rstrip('"}')) if le else 0)
+
+def _execute(commands):
+    # Metrics never interrupt a transformation
+    try:
+        pipeline = broker.broker.pipeline(transaction=False)
+        commands(pipeline)
+        pipeline.execute()
+    except RedisError as e:
+        print("Could not record metrics; ", e)
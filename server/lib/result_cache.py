@@ -0,0 +1,91 @@
+import json
+import zlib
+import time
+import hashlib
+
+from server import config
+from server.lib import broker
+
+# Finished transformations are stored by a hash of the image bytes and the
+# arguments they were requested with (before the scheduler's budget lowers
+# NGEN), so identical requests are replayed without a worker if the stored
+# run had at least as many generations as the budget allows. Entries expire
+# after RESULT_CACHE_TTL seconds and the least recently used ones are
+# evicted above RESULT_CACHE_MAX_BYTES
+INDEX_KEY = "result_cache/index"
+SIZES_KEY = "result_cache/sizes"
+# Results do not depend on them
+IGNORED_ARGUMENTS = ["verbose", "show", "manual_console", "cpu_count"]
+
+def get_key(image_data: bytes, args: dict):
+    args = {key: value for key, value in args.items() if key not in IGNORED_ARGUMENTS}
+    key = hashlib.sha256(image_data)
+    key.update(json.dumps(args, sort_keys=True).encode("utf-8"))
+    return key.hexdigest()
+
+def get_entry_key(key: str):
+    return f"result_cache/entry/{key}"
+
+def get(key: str):
+    """
+    Returns {"NGEN", "best", "events"} or None.
+    """
+    entry = broker.get(get_entry_key(key), object=False)
+    if entry is None:
+        _remove(key) # Expired
+        return None
+
+    broker.broker.zadd(INDEX_KEY, {key: time.time()})
+    return json.loads(zlib.decompress(entry))
+
+def set(key: str, events: list, NGEN: int, ttl=config.RESULT_CACHE_TTL,
+        max_bytes=config.RESULT_CACHE_MAX_BYTES):
+    """
+    Stores the progress events of every generation of a finished
+    transformation, as JSON strings (the last one contains the final best
+    individual), and the NGEN it ran with.
+    """
+    if len(events) == 0:
+        return
+    best = json.loads(events[-1])["individuals"][0]
+    entry = f'{{"NGEN": {int(NGEN)}, "best": {json.dumps(best)}, "events": [{",".join(events)}]}}'
+    entry = zlib.compress(entry.encode("utf-8"))
+    if len(entry) > max_bytes:
+        return
+
+    broker.broker.set(get_entry_key(key), entry, ex=int(ttl))
+    broker.broker.zadd(INDEX_KEY, {key: time.time()})
+    broker.broker.hset(SIZES_KEY, key, len(entry))
+    _evict(max_bytes)
+
+def replay(key: str, user_id: str, NGEN: int):
+    """
+    Adds the cached progress of a transformation to the stream of a user
+    (untrimmed). Returns False if the transformation is not cached or ran
+    fewer than NGEN generations.
+    """
+    entry = get(key)
+    if entry is None or entry["NGEN"] < NGEN:
+        return False
+
+    progress_stream_key = broker.get_progress_stream_key(user_id)
+    for event in entry["events"]:
+        broker.add_to_stream(progress_stream_key, event, max_length=None)
+    broker.add_to_stream(progress_stream_key, {"finished": True, "cached": True}, max_length=None)
+    return True
+
+def _remove(key: str):
+    broker.broker.delete(get_entry_key(key))
+    broker.broker.zrem(INDEX_KEY, key)
+    broker.broker.hdel(SIZES_KEY, key)
+
+def _evict(max_bytes: int):
+    sizes = broker.broker.hgetall(SIZES_KEY)
+    total_bytes = sum(int(size) for size in sizes.values())
+    while total_bytes > max_bytes:
+        oldest = broker.broker.zrange(INDEX_KEY, 0, 0)
+        if len(oldest) == 0:
+            return
+        key = broker.decode(oldest[0])
+        total_bytes -= int(sizes.get(oldest[0], sizes.get(key, 0)))
+        _remove(key)
@@ -0,0 +1,219 @@
+import json
+import time
+import uuid
+import base64
+
+from server import config
+from server.lib import broker
+from server.lib import metrics
+
+# Transformations are queued with start-time fair queueing: each job is
+# tagged with max(virtual time, finish tag of its owner's previous job) and
+# jobs are dispatched in tag order whenever one of the slots is free, so
+# owners with many jobs cannot starve the others
+QUEUE_KEY = "scheduler/queue"
+RUNNING_KEY = "scheduler/running"
+JOBS_KEY = "scheduler/jobs"
+OWNER_TAGS_KEY = "scheduler/owner_tags"
+VIRTUAL_TIME_KEY = "scheduler/virtual_time"
+COST_RATE_KEY = "scheduler/cost_rate"
+LOCK_KEY = "scheduler/lock"
+
+DEFAULT_COST_RATE = 2e9 # Pixels x vertices x evaluations per second (before calibration)
+COST_RATE_SMOOTHING = 0.2
+AUTO_VERTEX_COUNT = 2048 # Upper bound of the vertex count chosen from the image entropy
+MIN_NGEN = 5 # Jobs that only fit in the budget with fewer generations are rejected
+STALE_FACTOR = 3 # Running jobs older than this many budgets were lost with their worker
+LOCK_SECONDS = 10
+
+class SchedulerException(Exception):
+    pass
+
+def get_job_pixels(image_width: int, image_height: int, width=None, height=None):
+    # Same size as the one given by the image processor
+    if width is None and height is None:
+        return image_width * image_height
+    if width is None:
+        width = int(height * image_width / image_height)
+    elif height is None:
+        height = int(width * image_height / image_width)
+    return width * height
+
+def get_job_evaluations(ea_args: dict):
+    evaluations = ea_args["MU"] + ea_args["NGEN"] * ea_args["LAMBDA"]
+    if ea_args.get("max_evals"):
+        evaluations = min(evaluations, ea_args["max_evals"])
+    return evaluations
+
+def get_job_cost(pixels: int, ea_args: dict, evaluations=None):
+    vertex_count = ea_args["vertex_count"] or AUTO_VERTEX_COUNT
+    evaluations = get_job_evaluations(ea_args) if evaluations is None else evaluations
+    return pixels * vertex_count * evaluations
+
+def get_cost_rate():
+    cost_rate = broker.get(COST_RATE_KEY)
+    return DEFAULT_COST_RATE if cost_rate is None else cost_rate
+
+def estimate_seconds(cost: float, ea_args: dict):
+    seconds = cost / get_cost_rate()
+    if ea_args.get("max_seconds"):
+        seconds = min(seconds, ea_args["max_seconds"])
+    return seconds
+
+def fit_budget(pixels: int, ea_args: dict, max_seconds=config.MAX_JOB_SECONDS):
+    """
+    Returns a copy of ea_args whose estimated run time fits max_seconds,
+    with fewer generations if needed.
+    """
+    ea_args = dict(ea_args)
+    seconds = get_job_cost(pixels, ea_args) / get_cost_rate()
+    if seconds <= max_seconds:
+        return ea_args
+
+    evaluations = get_job_evaluations(ea_args) * max_seconds / seconds
+    NGEN = int((evaluations - ea_args["MU"]) // ea_args["LAMBDA"])
+    if NGEN < MIN_NGEN:
+        raise SchedulerException("The image is too large for the server, try a smaller size or vertex count")
+    ea_args["NGEN"] = min(NGEN, ea_args["NGEN"])
+    return ea_args
+
+def submit(image_processor_args: dict, ea_args: dict, user_id: str, owner: str,
+           pixels: int, cache_key=None):
+    """
+    Queues a transformation and dispatches jobs if there are free slots.
+    The previous transformation of the user must have been cancelled (see
+    cancel). Returns the status of the job.
+    """
+    image_processor_args = {**image_processor_args,
+                            "input_image": base64.b64encode(image_processor_args["input_image"]).decode("utf-8")}
+    job_id = uuid.uuid4().hex
+    cost = get_job_cost(pixels, ea_args)
+    job = {"user_id": user_id, "owner": owner, "pixels": pixels, "cost": cost,
+           "seconds": estimate_seconds(cost, ea_args), "submitted": time.time(),
+           "image_processor_args": image_processor_args, "ea_args": ea_args,
+           "cache_key": cache_key}
+
+    with broker.broker.lock(LOCK_KEY, timeout=LOCK_SECONDS):
+        if broker.broker.zcard(QUEUE_KEY) >= config.MAX_QUEUE_LENGTH:
+            raise SchedulerException("The server is busy, try again later")
+
+        virtual_time = float(broker.get(VIRTUAL_TIME_KEY) or 0)
+        owner_tag = broker.broker.hget(OWNER_TAGS_KEY, owner)
+        start_tag = max(virtual_time, float(owner_tag or 0))
+        job["start_tag"] = start_tag
+        broker.broker.hset(OWNER_TAGS_KEY, owner, start_tag + job["seconds"])
+        broker.broker.hset(JOBS_KEY, job_id, json.dumps(job))
+        broker.broker.zadd(QUEUE_KEY, {job_id: start_tag})
+        broker.set(get_user_job_key(user_id), job_id)
+        _dispatch()
+
+    status = get_status(user_id)
+    broker.add_to_stream(broker.get_progress_stream_key(user_id), {"queue": status})
+    return status
+
+def cancel(user_id: str):
+    """
+    Removes the queued job of a user or aborts the running one, so that a
+    single transformation of each user writes to its progress stream.
+    """
+    # Local import: the task module imports this one
+    from server.lib.celery.tasks import transform_image
+
+    with broker.broker.lock(LOCK_KEY, timeout=LOCK_SECONDS):
+        job_id = broker.get(get_user_job_key(user_id))
+        if job_id is None:
+            return
+        if broker.broker.zrem(QUEUE_KEY, job_id):
+            broker.broker.hdel(JOBS_KEY, job_id)
+        elif broker.broker.zscore(RUNNING_KEY, job_id) is not None:
+            # Tasks have the id of their job and stop at the end of the generation
+            transform_image.AsyncResult(job_id).abort()
+
+def finish(job_id: str, evaluations=None):
+    """
+    Frees the slot of a job and dispatches the next ones. The cost rate is
+    calibrated with the evaluations actually done by the job.
+    """
+    with broker.broker.lock(LOCK_KEY, timeout=LOCK_SECONDS):
+        started = broker.broker.zscore(RUNNING_KEY, job_id)
+        job = broker.broker.hget(JOBS_KEY, job_id)
+        broker.broker.zrem(RUNNING_KEY, job_id)
+        broker.broker.hdel(JOBS_KEY, job_id)
+
+        if started is not None and job is not None and evaluations is not None:
+            job = json.loads(job)
+            seconds = time.time() - started
+            if seconds > 0:
+                cost_rate = get_job_cost(job["pixels"], job["ea_args"], evaluations) / seconds
+                cost_rate = COST_RATE_SMOOTHING * cost_rate + (1 - COST_RATE_SMOOTHING) * get_cost_rate()
+                broker.set(COST_RATE_KEY, cost_rate)
+        _dispatch()
+
+def _dispatch():
+    # Local import: the task module imports this one
+    from server.lib.celery.tasks import transform_image
+
+    now = time.time()
+    for job_id in broker.broker.zrangebyscore(RUNNING_KEY, 0, now - STALE_FACTOR * config.MAX_JOB_SECONDS):
+        broker.broker.zrem(RUNNING_KEY, job_id)
+        broker.broker.hdel(JOBS_KEY, job_id)
+
+    while broker.broker.zcard(RUNNING_KEY) < config.SCHEDULER_SLOTS:
+        queued = broker.broker.zrange(QUEUE_KEY, 0, 0, withscores=True)
+        if len(queued) == 0:
+            return
+        job_id, start_tag = queued[0]
+        job_id = broker.decode(job_id)
+        job = json.loads(broker.broker.hget(JOBS_KEY, job_id))
+
+        broker.broker.zrem(QUEUE_KEY, job_id)
+        broker.broker.zadd(RUNNING_KEY, {job_id: now})
+        broker.set(VIRTUAL_TIME_KEY, start_tag)
+        metrics.observe(metrics.QUEUE_WAIT_SECONDS, now - job["submitted"])
+
+        image_processor_args = {**job["image_processor_args"],
+                                "input_image": base64.b64decode(job["image_processor_args"]["input_image"])}
+        transform_image.apply_async((image_processor_args, job["ea_args"], job["user_id"]),
+                                    {"job_id": job_id, "cache_key": job["cache_key"]}, task_id=job_id)
+
+def get_status(user_id: str):
+    """
+    State of the last job of a user ("queued", "running" or "unknown"),
+    queue depth and estimated seconds until the job starts.
+    """
+    queue_depth = broker.broker.zcard(QUEUE_KEY)
+    job_id = broker.get(get_user_job_key(user_id))
+    status = {"state": "unknown", "queue_depth": queue_depth}
+    if job_id is None:
+        return status
+
+    if broker.broker.zscore(RUNNING_KEY, job_id) is not None:
+        return {**status, "state": "running"}
+
+    position = broker.broker.zrank(QUEUE_KEY, job_id)
+    if position is None:
+        return status
+
+    # Jobs ahead are spread over the slots once the running ones finish
+    now = time.time()
+    running = [(_get_job(running_id), started)
+               for running_id, started in broker.broker.zrange(RUNNING_KEY, 0, -1, withscores=True)]
+    running_seconds = [max(job["seconds"] - (now - started), 0) for job, started in running if job is not None]
+    queued = [_get_job(queued_id) for queued_id in broker.broker.zrange(QUEUE_KEY, 0, position - 1)] \
+             if position > 0 else []
+    queued_seconds = [job["seconds"] for job in queued if job is not None]
+    eta_seconds = (sum(running_seconds) + sum(queued_seconds)) / config.SCHEDULER_SLOTS
+    return {**status, "state": "queued", "position": position + 1, "eta_seconds": round(eta_seconds)}
+
+def get_queue_length():
+    return broker.broker.zcard(QUEUE_KEY)
+
+def get_running_count():
+    return broker.broker.zcard(RUNNING_KEY)
+
+def _get_job(job_id):
+    job = broker.broker.hget(JOBS_KEY, broker.decode(job_id))
+    return None if job is None else json.loads(job)
+
+def get_user_job_key(user_id: str):
+    return f"scheduler/user_job/{user_id}"
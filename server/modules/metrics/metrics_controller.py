@@ -0,0 +1,10 @@
+from flask import Response
+
+from server.lib import metrics
+from server.lib import scheduler
+
+def get_metrics():
+    # Gauges of the scheduler are read when scraped
+    metrics.set_gauge(metrics.ACTIVE_RUNS, scheduler.get_running_count())
+    metrics.set_gauge(metrics.QUEUED_RUNS, scheduler.get_queue_length())
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
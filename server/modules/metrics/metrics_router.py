@@ -0,0 +1,9 @@
+from flask import Blueprint
+
+from server.modules.metrics import metrics_controller
+
+metrics_blueprint = Blueprint("metrics", __name__)
+
+@metrics_blueprint.route("", methods=['GET'])
+def get_metrics():
+    return metrics_controller.get_metrics()
@@ -1,14 +1,17 @@
 import os
+import json
 import random
 import time
 
-from flask import Request, request, render_template
+from flask import Request, Response, request, render_template, stream_with_context
 
 from src.utils.image_processor import ImageProcessor
 from src.utils.argument_checker import ArgumentChecker
 from server import config
-from server.lib.celery.tasks import transform_image
 from server.lib import broker
+from server.lib import scheduler
+from server.lib import result_cache
+from server.lib import metrics
 
 def parse_value_signature(value, signature):
     try:
@@ -35,7 +38,7 @@ def get_form_arguments(form, production=config.production):
 
     NGEN = form.get("NGEN", 5)
     NGEN = parse_value_signature(NGEN, int)
-    NGEN = None if NGEN is None else min(NGEN, 100) # NGEN > 100 would cause the system to overload
+    NGEN = None if NGEN is None else min(NGEN, 1000) # Lowered by the scheduler when the job does not fit its budget
 
     MU = form.get("MU", 50)
     MU = parse_value_signature(MU, int)
@@ -45,6 +48,18 @@ def get_form_arguments(form, production=config.production):
     LAMBDA = parse_value_signature(LAMBDA, int)
     LAMBDA = None if LAMBDA is None else min(LAMBDA, 100) # LAMBDA > 100 would cause the system to overload
 
+    # Converged runs are stopped early to give the capacity back
+    improvement_window = form.get("improvement_window", 10)
+    improvement_window = parse_value_signature(improvement_window, int)
+    min_improvement = form.get("min_improvement", 0)
+    min_improvement = parse_value_signature(min_improvement, float)
+    max_seconds = form.get("max_seconds", config.MAX_JOB_SECONDS)
+    max_seconds = parse_value_signature(max_seconds, float)
+    max_seconds = None if max_seconds is None else \
+                  min(max_seconds or config.MAX_JOB_SECONDS, config.MAX_JOB_SECONDS) # Every run has a time budget
+    max_evals = form.get("max_evals", 0)
+    max_evals = parse_value_signature(max_evals, int)
+
     selection = form.get("selection", "best")
     tournament_size = form.get("tournament_size", 2)
     tournament_size = parse_value_signature(tournament_size, int)
@@ -64,6 +79,9 @@ def get_form_arguments(form, production=config.production):
     edge_rate = form.get("edge_rate", 0.5)
     edge_rate = parse_value_signature(edge_rate, float)
 
+    render_best = form.get("render_best", 0) # Also send a PNG of the best individual
+    render_best = parse_value_signature(render_best, int)
+
     return {
         "seed": seed,
         "INDPB": INDPB,
@@ -72,6 +90,10 @@ def get_form_arguments(form, production=config.production):
         "NGEN": NGEN,
         "MU": MU,
         "LAMBDA": LAMBDA,
+        "improvement_window": improvement_window,
+        "min_improvement": min_improvement,
+        "max_seconds": max_seconds,
+        "max_evals": max_evals,
         "selection": selection,
         "tournament_size": tournament_size,
         "gaussian_rate": gaussian_rate,
@@ -81,6 +103,7 @@ def get_form_arguments(form, production=config.production):
         "cpu_count": cpu_count,
         "tri_outline": tri_outline,
         "edge_rate": edge_rate,
+        "render_best": render_best,
         "verbose": verbose,
         "show": show,
         "manual_console": manual_console
@@ -89,42 +112,60 @@ def get_form_arguments(form, production=config.production):
 def get_user_id(request: Request):
     return request.remote_addr + request.args['user_id']
 
-def get_transformed_images(request: Request, max_iddle_time=90, sleep_time=1):
+def format_event(data: dict, event_id=None, event=None):
+    message = "" if event_id is None else f"id: {event_id}\n"
+    message += "" if event is None else f"event: {event}\n"
+    return message + f"data: {json.dumps(data)}\n\n"
+
+def get_progress_events(user_id: str, last_event_id="0", max_iddle_time=90):
+    progress_stream_key = broker.get_progress_stream_key(user_id)
+    last_connection_key = broker.get_last_connection_key(user_id)
+    last_event_time = time.time()
+
+    while True:
+        # Keeps the transformation alive while the client is connected
+        broker.set(last_connection_key, time.time())
+        events = broker.read_stream(progress_stream_key, last_event_id)
+
+        for last_event_id, data in events:
+            if "error" in data:
+                yield format_event(data, last_event_id, event="failed")
+                return
+            if data.get("finished"):
+                yield format_event(data, last_event_id, event="finished")
+                return
+            yield format_event(data, last_event_id)
+
+        if len(events) > 0:
+            last_event_time = time.time()
+        elif time.time() - last_event_time > max_iddle_time:
+            error = {"error": f"Image transformation timed out after {max_iddle_time} seconds"}
+            metrics.inc(metrics.STREAM_TIMEOUTS)
+            yield format_event(error, event="failed")
+            return
+        else:
+            yield ": keep-alive\n\n" # Detects closed connections
+
+def get_transformed_images(request: Request):
     try:
         user_id = get_user_id(request)
-        generation = int(request.args['generation'])
-        fail_count = 0
-
-        last_connection = time.time()
-        last_connection_key = broker.get_last_connection_key(user_id)
-        broker.set(last_connection_key, last_connection)
-        initial_time = time.time()
-
-        while True: # TODO: Replace Busy waiting a queue system.
-            current_time = time.time()
-            added_image_key = broker.get_added_image_key(user_id, generation)
-            added_image = broker.get(added_image_key)
-
-            fail_count += 1
-            if fail_count % 10 == 0:
-                print(f"Waiting for image {generation} - {current_time - initial_time} seconds")
-
-            if added_image is not None:
-                broker.set(added_image_key, None)
-                return added_image
-            
-            if current_time - last_connection > max_iddle_time:
-                for i in range(1,generation+1):
-                    added_image_key = broker.get_added_image_key(user_id, i)
-                    broker.set(added_image_key, None)
-                return {"error": f"Image transformation timed out after {fail_count*sleep_time} seconds"}
-            
-            time.sleep(sleep_time)
-
+        last_event_id = request.headers.get("Last-Event-ID", request.args.get("last_event_id", "0"))
     except Exception as e:
-        print(e.with_traceback())
+        print(e)
         return {"error": "Something went wrong while getting the transformed images"}
 
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(get_progress_events(user_id, last_event_id)),
+                    mimetype="text/event-stream", headers=headers)
+
+def get_status(request: Request):
+    try:
+        user_id = get_user_id(request)
+        return scheduler.get_status(user_id)
+    except Exception as e:
+        print(e)
+        return {"error": "Something went wrong while getting the transformation status"}
+
 def transform(request: Request):
     image_file = request.files['image']
     
@@ -142,9 +183,23 @@ def transform(request: Request):
             decoded_image = ImageProcessor.decode_image(image_data)
             base64_image = ImageProcessor.encode_image(decoded_image)
             user_id = get_user_id(request)
-
-            image_processor_args = {**args, 'input_image': image_data}
-            transform_image.delay(image_processor_args, args, user_id)
+            scheduler.cancel(user_id) # Previous transformation of the user (queued or running)
+            broker.delete(broker.get_progress_stream_key(user_id))
+
+            pixels = scheduler.get_job_pixels(decoded_image.width, decoded_image.height,
+                                              args["width"], args["height"])
+            try:
+                # Keyed before the budget, which depends on the calibrated cost rate
+                cache_key = result_cache.get_key(image_data, args)
+                args = scheduler.fit_budget(pixels, args)
+                if result_cache.replay(cache_key, user_id, args["NGEN"]): # Identical requests do not start a worker
+                    metrics.inc(metrics.RUNS, outcome="cached")
+                else:
+                    image_processor_args = {**args, 'input_image': image_data}
+                    scheduler.submit(image_processor_args, args, user_id, request.remote_addr, pixels,
+                                     cache_key=cache_key)
+            except scheduler.SchedulerException as e:
+                return {"error": str(e)}
 
             context = {**args,
                        'user_id': request.args['user_id'],
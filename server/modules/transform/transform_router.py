@@ -10,4 +10,8 @@ def transformed_image():
 
 @transform_blueprint.route("", methods=['GET'])
 def get_transformed_image():
-    return transform_controller.get_transformed_images(request)
\ No newline at end of file
+    return transform_controller.get_transformed_images(request)
+
+@transform_blueprint.route("/status", methods=['GET'])
+def get_transformation_status():
+    return transform_controller.get_status(request)
@@ -2,14 +2,56 @@
 let currentGeneration = 1
 let generations = null
 let userId = null
+const STATUS_INTERVAL_MS = 5000
 
 function initialize(ngen, userId_) {
     generations = ngen
     userId = userId_
-    fetchNextGeneration(userId)
+    fetchGenerations(userId)
 }
 
-function appendImage(imageData, fitness) {
+function decodeArray(base64Data, ArrayType) {
+    const bytes = Uint8Array.from(atob(base64Data), (c) => c.charCodeAt(0))
+    return new ArrayType(bytes.buffer)
+}
+
+function drawGeometry(canvas, geometry) {
+    /* Vertices and triangles are little endian, as sent by the server */
+    const vertices = decodeArray(geometry.vertices, Uint16Array)
+    const triangles = decodeArray(geometry.triangles, geometry.index_bytes == 2 ? Uint16Array : Uint32Array)
+    const colors = decodeArray(geometry.colors, Uint8Array)
+
+    canvas.width = geometry.width
+    canvas.height = geometry.height
+    const context = canvas.getContext('2d')
+    context.clearRect(0, 0, canvas.width, canvas.height)
+
+    for (let t = 0; t < triangles.length / 3; t++) {
+        const color = `rgb(${colors[3*t]}, ${colors[3*t + 1]}, ${colors[3*t + 2]})`
+        context.beginPath()
+        for (let j = 0; j < 3; j++) {
+            const v = triangles[3*t + j]
+            context.lineTo(vertices[2*v], vertices[2*v + 1])
+        }
+        context.closePath()
+        context.fillStyle = color
+        context.strokeStyle = color // Hides seams between triangles
+        context.fill()
+        context.stroke()
+    }
+}
+
+function drawImage(canvas, imageData) {
+    const image = new Image()
+    image.onload = () => {
+        canvas.width = image.width
+        canvas.height = image.height
+        canvas.getContext('2d').drawImage(image, 0, 0)
+    }
+    image.src = 'data:image/png;base64,' + imageData
+}
+
+function appendImage(geometry) {
     const individualContainer = document.getElementById('individual-container');
     let imageContainer = document.getElementById('images-container')
 
@@ -19,13 +61,11 @@ function appendImage(imageData, fitness) {
         individualContainer.appendChild(imageContainer);
     }
     
-    const imageObject = document.createElement('img');
-    imageObject.src = 'data:image/png;base64,' + imageData;
+    const imageObject = document.createElement('canvas');
     imageObject.className = 'individual-image'
 
     const imageOverlay = document.createElement('div');
     imageOverlay.className = 'overlay';
-    imageOverlay.textContent = 'Loss: ' + fitness.toString().slice(0, 6);
     
     const hoverImageContainer = document.createElement('div');
     hoverImageContainer.className = 'hover-image-container';
@@ -60,18 +100,9 @@ function updateProgressBar(currentGeneration) {
     progressLabel.textContent = 'Generation: ' + currentGeneration.toString() + '/' + generations.toString();
 }
 
-function addImage(imageData, currentGeneration) {
-    fitnesses = imageData.fitness.map((x) => x[0])
-    imageData = imageData.images
-
-    /* Sort Data by fitness */
-    const fitnessData = [];
-    for (let i = 0; i < fitnesses.length; i++) {
-        fitnessData.push({fitness: fitnesses[i], image: imageData[i]});
-    }
-    fitnessData.sort(function(a, b) {return a.fitness - b.fitness;});
-    fitnesses = fitnessData.map(a => a.fitness);
-    imageData = fitnessData.map(a => a.image);
+function addImage(data, currentGeneration) {
+    /* Individuals are sorted by fitness by the server */
+    const individuals = data.individuals
 
     /* Create progress bar */
     const imageContainer = document.getElementById('individual-container');
@@ -88,33 +119,55 @@ function addImage(imageData, currentGeneration) {
         updateProgressBar(currentGeneration)
     }
 
-    imageElements = Array.from(imageContainer.getElementsByTagName('img'));
-    if (imageElements.length == 0) {
-        imageData.forEach((img, i) => appendImage(img, fitnesses[i]))
+    let canvasElements = Array.from(imageContainer.getElementsByTagName('canvas'));
+    if (canvasElements.length == 0) {
+        individuals.forEach((geometry) => appendImage(geometry))
+        canvasElements = Array.from(imageContainer.getElementsByTagName('canvas'));
     }
-    else {
-        imageElements.forEach((imageElement, i) => {
-            imageElement.src = 'data:image/png;base64,' + imageData[i];
-        })
-        const overlays = Array.from(imageContainer.getElementsByClassName('overlay'));
-        overlays.forEach((overlay, i) => {
-            overlay.textContent = 'Loss: ' + fitnesses[i].toString().slice(0, 6);
-        })
-    }
-}
 
-function fetchNextGeneration(userId, currentGeneration=1) {
-    fetch(`/transform?generation=${currentGeneration.toString()}&user_id=${userId}`, {
-        method: 'GET',
-        headers: {
-            'Content-Type': 'application/json'
+    const overlays = Array.from(imageContainer.getElementsByClassName('overlay'));
+    individuals.forEach((geometry, i) => {
+        if (i == 0 && data.image) {
+            drawImage(canvasElements[i], data.image)
         }
+        else {
+            drawGeometry(canvasElements[i], geometry)
+        }
+        overlays[i].textContent = 'Loss: ' + geometry.fitness.toString().slice(0, 6);
     })
-    .then(response => response.json())
-    .then(data => addImage(data, currentGeneration))
-    .then(() => {
-        if (currentGeneration <= generations) {
-            fetchNextGeneration(userId, currentGeneration + 1)
+}
+
+function showQueueStatus(status) {
+    /* Shown until the first generation arrives */
+    const title = document.querySelector('#individual-container h2')
+    if (title == null || status.state != 'queued') {
+        return
+    }
+    title.textContent = `Queued: ${status.position}/${status.queue_depth} (about ${status.eta_seconds} seconds left)`
+}
+
+function fetchGenerations(userId) {
+    /* Generations are pushed by the server (Server-Sent Events) */
+    const eventSource = new EventSource(`/transform?user_id=${userId}`)
+    const statusInterval = setInterval(() => {
+        fetch(`/transform/status?user_id=${userId}`)
+            .then((response) => response.json())
+            .then(showQueueStatus)
+    }, STATUS_INTERVAL_MS)
+
+    eventSource.onmessage = (event) => {
+        const data = JSON.parse(event.data)
+        if (data.queue) {
+            showQueueStatus(data.queue)
+            return
         }
+        clearInterval(statusInterval)
+        addImage(data, data.generation)
+    }
+    eventSource.addEventListener('finished', () => eventSource.close())
+    eventSource.addEventListener('failed', (event) => {
+        console.error(JSON.parse(event.data).error)
+        clearInterval(statusInterval)
+        eventSource.close()
     })
 }
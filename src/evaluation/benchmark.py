@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import random
+import platform
+import subprocess
+from time import perf_counter, strftime
+
+import numpy as np
+
+from src.lib.deap_config import DeapConfig
+from src.models.evolutionary_algorithm.ea_handler import EAHandler
+from src.models.evolutionary_algorithm.ea_methods import EA
+from src.utils.image_processor import ImageProcessor
+from src.utils.preprocessing_cache import PreprocessingCache
+from src.utils.triangulation import Triangulation
+
+IMAGE_PATH = os.path.join("data", "inputs")
+DEFAULT_IMAGES = ["fox.jpg"]
+DEFAULT_WIDTHS = [100, 250, 500]
+DEFAULT_VERTEX_COUNTS = [100, 1000, 5000]
+DEFAULT_REPEATS = 20
+DEFAULT_POPULATION_SIZE = 50
+DEFAULT_GENERATIONS = 5
+DEFAULT_TOLERANCE = 0.1 # Slowdown (relative to the previous report) considered a regression
+
+DELAUNAY_STAGE = "delaunay"
+RENDER_STAGE = "create_polygonal_image"
+FITNESS_STAGE = "get_fitness"
+POPULATION_FITNESS_STAGE = "eval_population"
+MUTATION_STAGE = "mut_gaussian_coordinate"
+ORDER_STAGE = "order_individual"
+GENERATION_STAGE = "generation"
+STAGES = [DELAUNAY_STAGE, RENDER_STAGE, FITNESS_STAGE, POPULATION_FITNESS_STAGE,
+          MUTATION_STAGE, ORDER_STAGE, GENERATION_STAGE]
+
+class Benchmark:
+    """
+    Microbenchmarks of the stages of the evaluation hot path over a matrix
+    of images, widths and vertex counts. Images are preprocessed before any
+    stage is timed, so only the evolution is measured.
+
+    Every stage reports the median and minimum seconds per call and its
+    throughput (individuals/s, and evaluations/s and pixels/s where they
+    apply). Reports are JSON documents that can be compared across commits.
+    """
+    def __init__(self, image_path=IMAGE_PATH, images=DEFAULT_IMAGES, widths=DEFAULT_WIDTHS,
+                 vertex_counts=DEFAULT_VERTEX_COUNTS, repeats=DEFAULT_REPEATS,
+                 population_size=DEFAULT_POPULATION_SIZE, generations=DEFAULT_GENERATIONS,
+                 stages=STAGES, seed=0):
+        self.image_path = image_path
+        self.images = images
+        self.widths = widths
+        self.vertex_counts = vertex_counts
+        self.repeats = repeats
+        self.population_size = population_size
+        self.generations = generations
+        self.stages = stages
+        self.seed = seed
+        self.preprocessing_cache = PreprocessingCache(cache_dir=None)
+
+    def get_parameters(self):
+        return {"images": self.images, "widths": self.widths, "vertex_counts": self.vertex_counts,
+                "repeats": self.repeats, "population_size": self.population_size,
+                "generations": self.generations, "stages": self.stages, "seed": self.seed}
+
+    def run(self, verbose=True):
+        results = []
+        for image in self.images:
+            for width in self.widths:
+                for vertex_count in self.vertex_counts:
+                    results += self.__run_case(image, width, vertex_count, verbose)
+        return {"metadata": self.__get_metadata(), "results": results}
+
+    @staticmethod
+    def save(report: dict, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    @staticmethod
+    def load(path: str):
+        with open(path) as report_file:
+            return json.load(report_file)
+
+    @staticmethod
+    def compare(previous: dict, current: dict, tolerance=DEFAULT_TOLERANCE):
+        """
+        Returns the cases of current whose median time per call is more than
+        tolerance slower than in previous (cases missing in any of them are
+        skipped).
+        """
+        get_case = lambda result: (result["image"], result["width"], result["vertex_count"], result["stage"])
+        previous_results = {get_case(result): result for result in previous["results"]}
+
+        regressions = []
+        for result in current["results"]:
+            previous_result = previous_results.get(get_case(result))
+            if previous_result is None:
+                continue
+            slowdown = result["median_seconds"] / previous_result["median_seconds"] - 1
+            if slowdown > tolerance:
+                regressions.append({**dict(zip(["image", "width", "vertex_count", "stage"], get_case(result))),
+                                    "previous_median_seconds": previous_result["median_seconds"],
+                                    "median_seconds": result["median_seconds"],
+                                    "slowdown": slowdown})
+        return regressions
+
+    def __get_metadata(self):
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                                    text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        return {"commit": commit, "date": strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0], "numpy": np.__version__,
+                "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                "parameters": self.get_parameters()}
+
+    def __build_eac(self, image: str, width: int, vertex_count: int):
+        random.seed(self.seed)
+        ip = ImageProcessor(input_name=image, input_path=self.image_path, width=width,
+                            vertex_count=vertex_count, preprocessing_cache=self.preprocessing_cache)
+        ea = EA(ip, seed=self.seed)
+        dc = DeapConfig(cpu_count=1, NGEN=self.generations, MU=self.population_size,
+                        LAMBDA=self.population_size, fitness_cache_size=0)
+        eac = EAHandler(ea, dc)
+        eac.build_ea_module(verbose=False)
+        eac.build_deap_module()
+        return eac
+
+    @staticmethod
+    def __time(function, repeats: int, setup=lambda: None):
+        setup()
+        function() # Warm-up (lazy buffers and caches)
+        seconds = []
+        for _ in range(repeats):
+            setup()
+            start = perf_counter()
+            function()
+            seconds.append(perf_counter() - start)
+        return seconds
+
+    def __get_result(self, stage: str, seconds: list, individuals: int,
+                     pixels=None, evaluations=None):
+        median_seconds = float(np.median(seconds))
+        return {"stage": stage, "calls": len(seconds),
+                "median_seconds": median_seconds, "min_seconds": float(np.min(seconds)),
+                "individuals_per_second": individuals / median_seconds,
+                "evaluations_per_second": None if evaluations is None else evaluations / median_seconds,
+                "pixels_per_second": None if pixels is None else pixels / median_seconds}
+
+    def __run_case(self, image: str, width: int, vertex_count: int, verbose=True):
+        eac = self.__build_eac(image, width, vertex_count)
+        ea, dc = eac.evolutionary_algorithm, eac.deap_configurer
+        ip = ea.image_processor
+        pixels = ip.width * ip.height
+        population = dc.toolbox.population(n=self.population_size)
+        individual = population[0]
+        vertices = ea.get_vertices(individual)
+        triangulation = Triangulation.build(vertices)
+        polygonal_image = ip.create_polygonal_image(vertices, triangulation)
+        sigma_x, sigma_y = (ip.width - 1) * dc.gaussian_rate, (ip.height - 1) * dc.gaussian_rate
+
+        def clear_triangulations(): # Every evaluation triangulates, as new offspring do
+            for ind in population:
+                ind.__dict__.pop("triangulation", None)
+
+        results = []
+        for stage in self.stages:
+            if stage == DELAUNAY_STAGE:
+                seconds = self.__time(lambda: Triangulation.build(vertices), self.repeats)
+                result = self.__get_result(stage, seconds, 1)
+            elif stage == RENDER_STAGE:
+                seconds = self.__time(lambda: ip.create_polygonal_image(vertices, triangulation), self.repeats)
+                result = self.__get_result(stage, seconds, 1, pixels=pixels)
+            elif stage == FITNESS_STAGE:
+                seconds = self.__time(lambda: ea.get_fitness(polygonal_image), self.repeats)
+                result = self.__get_result(stage, seconds, 1, pixels=pixels, evaluations=1)
+            elif stage == POPULATION_FITNESS_STAGE:
+                seconds = self.__time(lambda: ea.eval_population(population), self.repeats,
+                                      setup=clear_triangulations)
+                size = len(population)
+                result = self.__get_result(stage, seconds, size, pixels=pixels * size, evaluations=size)
+            elif stage == MUTATION_STAGE:
+                mutant = dc.toolbox.clone(individual)
+                seconds = self.__time(lambda: ea.mut_gaussian_coordinate(mutant, sigma_x, sigma_y,
+                                                                         indpb=dc.INDPB), self.repeats)
+                result = self.__get_result(stage, seconds, 1)
+            elif stage == ORDER_STAGE:
+                seconds = self.__time(lambda: ea.order_individual(individual), self.repeats)
+                result = self.__get_result(stage, seconds, 1)
+            elif stage == GENERATION_STAGE:
+                # Whole (mu + lambda) runs, without multiprocessing or fitness cache
+                random.seed(self.seed)
+                start = perf_counter()
+                _, logbook, _, _ = dc.run_algorithm(parallel=False, verbose=False)
+                seconds = (perf_counter() - start) / len(logbook)
+                evaluations = sum(logbook.select("evals")) / len(logbook)
+                result = self.__get_result(stage, [seconds], dc.LAMBDA,
+                                           pixels=pixels * evaluations, evaluations=evaluations)
+            else:
+                raise Exception(f"Invalid benchmark stage: {stage}")
+
+            result = {"image": image, "width": ip.width, "height": ip.height,
+                      "vertex_count": vertex_count, **result}
+            results.append(result)
+            if verbose:
+                print(f"{image} {ip.width}x{ip.height} {vertex_count} vertices | {stage}: "
+                      f"{result['median_seconds']*1000:.3f} ms/call, "
+                      f"{result['individuals_per_second']:.1f} individuals/s")
+        return results
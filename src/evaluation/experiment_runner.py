@@ -0,0 +1,124 @@
+import os
+import json
+import random
+import hashlib
+import multiprocessing
+from time import time
+
+from deap import creator
+
+from src.models.alternatives.local_search import LocalSearchSolver
+from src.models.evolutionary_algorithm.ea_handler import EAHandler
+from src.models.evolutionary_algorithm.ea_methods import EA
+from src.utils.image_processor import ImageProcessor
+from src.utils.preprocessing_cache import PreprocessingCache
+from src.lib.deap_config import DeapConfig
+
+CPU_COUNT = os.cpu_count()
+EA_METHOD = "EA"
+CHECKPOINT_DIR = os.path.join("data", "outputs", "experiments", "formal", "analysis", "checkpoints")
+
+# Images already loaded by each worker (denoising and edge detection are slow)
+_worker_eas = {}
+_worker_preprocessing_cache = PreprocessingCache(max_memory_entries=0) # Shared on disk by the workers
+
+def _get_evolutionary_algorithm(job: dict):
+    key = (job["image"], job["image_path"], job["vertex_count"], job["width"])
+    if key not in _worker_eas:
+        ip = ImageProcessor(input_name=job["image"], input_path=job["image_path"],
+                            vertex_count=job["vertex_count"], width=job["width"],
+                            preprocessing_cache=_worker_preprocessing_cache)
+        ea = EA(ip)
+        ea.load_image(verbose=False)
+        _worker_eas[key] = ea
+    return _worker_eas[key]
+
+def _run_job(job: dict):
+    if not hasattr(creator, "Individual"):
+        DeapConfig.register_fitness()
+
+    seed = job["seed"]
+    ea = _get_evolutionary_algorithm(job)
+    random.seed(seed)
+    ea.update_seed(seed)
+
+    if job["method"] == EA_METHOD:
+        dc = DeapConfig(**{**job["config"], "cpu_count": 1}) # Parallelism is given by the jobs
+        eac = EAHandler(ea, dc)
+        eac.build_deap_module()
+
+        start = time()
+        best_fitnesses = eac.run(show_res=False, logs=False, seed=seed, save=False)
+        end = time()
+        best_fitness = min(best_fitnesses)
+    else:
+        alt_solver = LocalSearchSolver(ea)
+        alt_solver.update_seed(seed)
+
+        start = time()
+        _, best_fitness = alt_solver.solve(**job["config"], method=job["method"], verbose=False)
+        end = time()
+
+    return job["id"], {"best_fitness": float(best_fitness), "time": end - start}
+
+class ExperimentRunner:
+    """
+    Runs independent (image, method, config, seed) jobs on a process pool
+    (one job per process). The result of every finished job is saved in
+    checkpoint_dir, so an interrupted sweep only runs the missing jobs.
+    """
+    def __init__(self, cpu_count=CPU_COUNT, checkpoint_dir=CHECKPOINT_DIR):
+        self.cpu_count = cpu_count
+        self.checkpoint_dir = checkpoint_dir
+
+    @staticmethod
+    def get_job(image: str, image_path: str, vertex_count: int, width: int,
+                config: dict, seed: int, method=EA_METHOD):
+        job = {"image": image, "image_path": image_path, "vertex_count": vertex_count,
+               "width": width, "method": method, "config": config, "seed": seed}
+        job_bytes = json.dumps(job, sort_keys=True).encode("utf-8")
+        job["id"] = hashlib.sha1(job_bytes).hexdigest()
+        return job
+
+    def run(self, jobs: list):
+        """
+        Returns a dict from job id to {"best_fitness", "time"}.
+        """
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        results = {}
+        pending_jobs = {}
+        for job in jobs:
+            result = self.__load_result(job["id"])
+            if result is not None:
+                results[job["id"]] = result
+            else:
+                pending_jobs[job["id"]] = job
+        pending_jobs = list(pending_jobs.values())
+
+        print(f"Running {len(pending_jobs)} jobs ({len(results)} already finished)")
+        if len(pending_jobs) == 0:
+            return results
+
+        with multiprocessing.Pool(min(self.cpu_count, len(pending_jobs))) as process_pool:
+            for i, (job_id, result) in enumerate(process_pool.imap_unordered(_run_job, pending_jobs)):
+                self.__save_result(job_id, result)
+                results[job_id] = result
+                print(f"Finished job {i+1}/{len(pending_jobs)}")
+        return results
+
+    def __get_checkpoint_path(self, job_id: str):
+        return os.path.join(self.checkpoint_dir, f"{job_id}.json")
+
+    def __load_result(self, job_id: str):
+        checkpoint_path = self.__get_checkpoint_path(job_id)
+        if not os.path.isfile(checkpoint_path):
+            return None
+        with open(checkpoint_path) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def __save_result(self, job_id: str, result: dict):
+        # Written atomically: an interrupted write never looks like a finished job
+        checkpoint_path = self.__get_checkpoint_path(job_id)
+        with open(checkpoint_path + ".tmp", "w") as checkpoint_file:
+            json.dump(result, checkpoint_file)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
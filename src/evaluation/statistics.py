@@ -12,7 +12,10 @@ import pandas as pd
 from src.models.alternatives.local_search import LocalSearchSolver
 from src.models.evolutionary_algorithm.ea_handler import EAHandler
 from src.utils.image_processor import ImageProcessor
-from src.lib.deap_config import DeapConfig
+from src.utils.preprocessing_cache import PreprocessingCache
+from src.lib.deap_config import DeapConfig, CPU_COUNT
+from src.lib.evaluator_pool import EvaluatorPool
+from src.evaluation.experiment_runner import ExperimentRunner, EA_METHOD
 from src.models.evolutionary_algorithm.ea_methods import EA
 
 CPU_COL = "CPU"
@@ -28,8 +31,26 @@ PVALUE_COL = "p-value"
 METHOD_COL = "method"
 
 class Statistics:
-    def __init__(self):
-        return
+    def __init__(self, runner: ExperimentRunner = None):
+        # Worker pools (one per CPU count) reused by every run of the experiments
+        self.process_pools = {}
+
+        # Runs (config, seed) pairs as parallel jobs instead of one after another
+        self.runner = runner
+
+        # Images are denoised and edge detected once for every experiment
+        self.preprocessing_cache = PreprocessingCache()
+
+    def close(self):
+        for process_pool in self.process_pools.values():
+            process_pool.close()
+        self.process_pools = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
 
     def efficiency_evaluation(
         self, 
@@ -65,7 +86,6 @@ class Statistics:
                 print(f"Testing {img} with {i} CPUs")
                 config = {"cpu_count": i}
                 self.__update_config(eac, config)
-                eac.deap_configurer.register_parallelism()
 
                 start = time()
                 eac.run(show_res=False)
@@ -113,16 +133,26 @@ class Statistics:
         """
         return f_oneway(*samples).pvalue
 
+    def __get_deap_config(self, config: dict):
+        cpu_count = config.get("cpu_count", CPU_COUNT)
+        if cpu_count < 2 or config.get("islands", 1) > 1:
+            return DeapConfig(**config)
+
+        if cpu_count not in self.process_pools:
+            self.process_pools[cpu_count] = EvaluatorPool(cpu_count=cpu_count)
+        return DeapConfig(**config, process_pool=self.process_pools[cpu_count])
+
     def __update_config(self, eac: EAHandler, config: dict):
-        eac.deap_configurer = DeapConfig(**config)
+        eac.deap_configurer = self.__get_deap_config(config)
         eac.build_deap_module()
         return
 
     def __build_eac(self, input_name: str, input_dir: str, 
                     vertex_count: int, width=500):
-        dc = DeapConfig()
+        dc = self.__get_deap_config({})
         ip = ImageProcessor(input_name=input_name, input_dir=input_dir, 
-                            vertex_count=vertex_count, width=width)
+                            vertex_count=vertex_count, width=width,
+                            preprocessing_cache=self.preprocessing_cache)
         ea = EA(ip)
         eac = EAHandler(ea, dc)
         eac.build_ea_module()
@@ -140,7 +170,7 @@ class Statistics:
             for seed in seeds:
                 print(f"Evaluating seed {seed+1}/{len(seeds)} of config {config}")
                 random.seed(seed)
-                eac.deap_configurer.register_parallelism() # Solves pool not running error
+                eac.evolutionary_algorithm.update_seed(seed)
 
                 start = time()
                 best_fitnesses = eac.run(show_res=False, logs=False, seed=seed)
@@ -151,16 +181,35 @@ class Statistics:
                 best_execution_fitness.append(min_loss)
 
             current_values = [eac.deap_configurer.__dict__[at] for at in attributes]
+            self.__append_results(current_values, best_execution_fitness, time_execution,
+                                  results, header_fitness, best_fitness_config)
 
-            results.append([*current_values, 
-                            min(best_execution_fitness),
-                            np.mean(best_execution_fitness), 
-                            np.std(best_execution_fitness),
-                            np.mean(time_execution),
-                            self.normality_test(best_execution_fitness)])
-        
-            header_fitness.append(str(current_values))
-            best_fitness_config.append(best_execution_fitness)
+    def __get_parallel_EA_results(self, image_name: str, image_path: str, vertex_count: int, 
+                                  configs: list, seeds: list, attributes: list, results: list, 
+                                  header_fitness: list, best_fitness_config: list, width=500):
+        jobs = [[ExperimentRunner.get_job(image_name, image_path, vertex_count, width, config, seed)
+                 for seed in seeds] for config in configs]
+        job_results = self.runner.run([job for config_jobs in jobs for job in config_jobs])
+
+        for config, config_jobs in zip(configs, jobs):
+            best_execution_fitness = [job_results[job["id"]]["best_fitness"] for job in config_jobs]
+            time_execution = [job_results[job["id"]]["time"] for job in config_jobs]
+            current_values = [DeapConfig(**config).__dict__[at] for at in attributes]
+            self.__append_results(current_values, best_execution_fitness, time_execution,
+                                  results, header_fitness, best_fitness_config)
+
+    def __append_results(self, current_values: list, best_execution_fitness: list, 
+                         time_execution: list, results: list, header_fitness: list, 
+                         best_fitness_config: list):
+        results.append([*current_values, 
+                        min(best_execution_fitness),
+                        np.mean(best_execution_fitness), 
+                        np.std(best_execution_fitness),
+                        np.mean(time_execution),
+                        self.normality_test(best_execution_fitness)])
+    
+        header_fitness.append(str(current_values))
+        best_fitness_config.append(best_execution_fitness)
 
     def informal_evaluation(
         self, 
@@ -182,16 +231,23 @@ class Statistics:
                                              "best_fitness_execution",
                                              "best_fit_per_config_informal.csv")
     ):
-        eac = self.__build_eac(image_name, image_path, vertex_count)
-
         results = []
         header_fitness = []
         best_fitness_config = []
+        configs = []
 
         for att, values in attributes.items():
             for val in values:
                 current_config = {**best_config}
                 current_config[att] = val
+                configs.append(current_config)
+
+        if self.runner is not None:
+            self.__get_parallel_EA_results(image_name, image_path, vertex_count, configs, seeds, 
+                                           attributes, results, header_fitness, best_fitness_config)
+        else:
+            eac = self.__build_eac(image_name, image_path, vertex_count)
+            for current_config in configs:
                 self.__get_EA_results(eac, seeds, current_config, attributes, results, header_fitness, best_fitness_config)
 
         columns = [*(attributes.keys()), 
@@ -225,11 +281,10 @@ class Statistics:
                                       "best_fitness_execution", 
                                       "best_fit_per_config_parametric.csv")
     ):
-        eac = self.__build_eac(images[0], image_path, vertex_count)
         results = []
         header_fitness = []
         best_fitness_config = []
-        
+        configs = []
         
         ortogonal_combinations = list(product(*(attributes.values())))
 
@@ -238,9 +293,16 @@ class Statistics:
 
             for i, att in enumerate(attributes.keys()):
                 current_config[att] = combination[i]
-
-            self.__get_EA_results(eac, seeds, current_config, attributes, 
-                                  results, header_fitness, best_fitness_config)
+            configs.append(current_config)
+
+        if self.runner is not None:
+            self.__get_parallel_EA_results(images[0], image_path, vertex_count, configs, seeds, 
+                                           attributes, results, header_fitness, best_fitness_config)
+        else:
+            eac = self.__build_eac(images[0], image_path, vertex_count)
+            for current_config in configs:
+                self.__get_EA_results(eac, seeds, current_config, attributes, 
+                                      results, header_fitness, best_fitness_config)
         
         header = [*(attributes.keys()),
                   BEST_HISTORICAL_FITNESS_COL, 
@@ -276,7 +338,14 @@ class Statistics:
         results = []
         header_fitness = []
         best_fitness_config = []
-        EA_ID = "EA"
+        EA_ID = EA_METHOD
+
+        if self.runner is not None:
+            self.__get_parallel_comparison_results(best_config, greedy_config, image_path, images, seeds,
+                                                   results, header_fitness, best_fitness_config)
+            self.__save_comparison(results, header_fitness, best_fitness_config, 
+                                   results_dir, greedy_results_dir)
+            return
 
         for img in images:
             print(f"Evaluating image {img}")
@@ -296,7 +365,7 @@ class Statistics:
                     print(f"Evaluating seed {seed+1}/{len(seeds)} of method {method}")
                     random.seed(seed)
                     if method == EA_ID:
-                        eac.deap_configurer.register_parallelism() # Done to avoid Pool not running error
+                        eac.evolutionary_algorithm.update_seed(seed)
 
                         start = time()
                         best_fitnesses = eac.run(show_res=False, 
@@ -318,26 +387,58 @@ class Statistics:
                         print(f"Best fitness: {best_eval}")
                     time_execution.append(end - start)
                 
-                results.append([
-                    img,
-                    method,
-                    min(best_execution_fitness), 
-                    np.mean(best_execution_fitness), 
-                    np.std(best_execution_fitness),
-                    np.mean(time_execution),
-                    self.normality_test(best_execution_fitness)])
-
-                header_fitness.append(f"{method}-{img}")
-                best_fitness_config.append(best_execution_fitness)
-
-                header = [IMAGE_COL, METHOD_COL, BEST_HISTORICAL_FITNESS_COL,
-                          AVERAGE_BEST_FITNESS_COL, STD_FITNESS_COL,
-                          STD_TIME_COL, PVALUE_COL]
-                pd.DataFrame(results, columns=header).to_csv(results_dir,
-                                                             index=False)
-                pd.DataFrame(np.transpose(np.array(best_fitness_config)), 
-                             columns=header_fitness) \
-                .to_csv(greedy_results_dir, index=False)
+                self.__append_comparison_results(img, method, best_execution_fitness, time_execution,
+                                                 results, header_fitness, best_fitness_config)
+                self.__save_comparison(results, header_fitness, best_fitness_config, 
+                                       results_dir, greedy_results_dir)
+
+    def __get_parallel_comparison_results(self, best_config: dict, greedy_config: dict, 
+                                          image_path: str, images: dict, seeds: list, 
+                                          results: list, header_fitness: list, 
+                                          best_fitness_config: list):
+        jobs = []
+        for img in images:
+            vertex_count = images[img].get("vertex_count", 100)
+            width = images[img].get("width", 500)
+            for method in [EA_METHOD] + list(greedy_config.keys()):
+                config = best_config if method == EA_METHOD else greedy_config[method]
+                method_jobs = [ExperimentRunner.get_job(img, image_path, vertex_count, width, 
+                                                        config, seed, method=method) 
+                               for seed in seeds]
+                jobs.append((img, method, method_jobs))
+
+        job_results = self.runner.run([job for _, _, method_jobs in jobs for job in method_jobs])
+        for img, method, method_jobs in jobs:
+            best_execution_fitness = [job_results[job["id"]]["best_fitness"] for job in method_jobs]
+            time_execution = [job_results[job["id"]]["time"] for job in method_jobs]
+            self.__append_comparison_results(img, method, best_execution_fitness, time_execution,
+                                             results, header_fitness, best_fitness_config)
+
+    def __append_comparison_results(self, img: str, method: str, best_execution_fitness: list, 
+                                    time_execution: list, results: list, header_fitness: list, 
+                                    best_fitness_config: list):
+        results.append([
+            img,
+            method,
+            min(best_execution_fitness), 
+            np.mean(best_execution_fitness), 
+            np.std(best_execution_fitness),
+            np.mean(time_execution),
+            self.normality_test(best_execution_fitness)])
+
+        header_fitness.append(f"{method}-{img}")
+        best_fitness_config.append(best_execution_fitness)
+
+    def __save_comparison(self, results: list, header_fitness: list, best_fitness_config: list,
+                          results_dir: str, greedy_results_dir: str):
+        header = [IMAGE_COL, METHOD_COL, BEST_HISTORICAL_FITNESS_COL,
+                  AVERAGE_BEST_FITNESS_COL, STD_FITNESS_COL,
+                  STD_TIME_COL, PVALUE_COL]
+        pd.DataFrame(results, columns=header).to_csv(results_dir,
+                                                     index=False)
+        pd.DataFrame(np.transpose(np.array(best_fitness_config)), 
+                     columns=header_fitness) \
+        .to_csv(greedy_results_dir, index=False)
 
     def plot_best_historical_fitness(
         self,
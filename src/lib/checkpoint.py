@@ -0,0 +1,148 @@
+import io
+import os
+import json
+from time import time
+
+from deap import creator
+import numpy as np
+
+from src.lib.individual import COORDINATE_DTYPE
+from src.utils.triangulation import Triangulation
+
+DEFAULT_GENERATIONS = 10
+KEY_SIZE = 16 # Bytes of the fitness cache keys
+
+class Checkpoint:
+    """
+    Periodic snapshot of the evolutionary state (population, hall of fame,
+    logbook, fitness cache, triangulations and random generator states),
+    saved every `generations` generations or `seconds` seconds (0 disables
+    each criterion) as a compressed .npz file: individuals and
+    triangulations are packed into arrays and the rest is stored as JSON.
+    """
+    def __init__(self, path: str, generations=DEFAULT_GENERATIONS, seconds=0):
+        self.path = path
+        self.generations = generations
+        self.seconds = seconds
+        self.last_save = time()
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def delete(self):
+        if self.exists():
+            os.remove(self.path)
+
+    def should_save(self, gen: int):
+        by_generations = self.generations > 0 and gen % self.generations == 0
+        by_time = self.seconds > 0 and time() - self.last_save >= self.seconds
+        return by_generations or by_time
+
+    def save(self, state: dict):
+        triangulations = {}
+        arrays = {}
+        arrays.update(self.__pack_individuals("population", state["population"], triangulations))
+        arrays.update(self.__pack_individuals("halloffame", state["halloffame"], triangulations))
+        arrays.update(self.__pack_triangulations(list(triangulations.values())))
+
+        cache_entries = state["fitness_cache_entries"]
+        arrays["cache_keys"] = np.frombuffer(b"".join(key for key, _ in cache_entries), dtype=np.uint8).reshape(-1, KEY_SIZE)
+        arrays["cache_values"] = np.array([fitness[0] for _, fitness in cache_entries], dtype=np.float64)
+
+        logbook = state["logbook"]
+        metadata = {"gen": state["gen"],
+                    "best_fitnesses": [float(fitness) for fitness in state["best_fitnesses"]],
+                    "level": state["level"],
+                    "stalled_generations": state["stalled_generations"],
+                    "elapsed_seconds": state["elapsed_seconds"],
+                    "fitness_cache_stats": list(state["fitness_cache_stats"]),
+                    "logbook_header": logbook.header,
+                    "logbook": [{key: self.__to_json(value) for key, value in record.items()} for record in logbook],
+                    "random_state": state["random_state"],
+                    "rng_state": state["rng_state"]}
+        arrays["metadata"] = np.frombuffer(json.dumps(metadata).encode("utf-8"), dtype=np.uint8)
+
+        # Written atomically: a crash while saving keeps the previous checkpoint
+        checkpoint_bytes = io.BytesIO()
+        np.savez_compressed(checkpoint_bytes, **arrays)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "wb") as checkpoint_file:
+            checkpoint_file.write(checkpoint_bytes.getvalue())
+        os.replace(self.path + ".tmp", self.path)
+        self.last_save = time()
+
+    def load(self):
+        with np.load(self.path) as arrays:
+            arrays = dict(arrays)
+
+        state = json.loads(arrays["metadata"].tobytes().decode("utf-8"))
+        triangulations = self.__unpack_triangulations(arrays)
+        state["population"] = self.__unpack_individuals("population", arrays, triangulations)
+        state["halloffame"] = self.__unpack_individuals("halloffame", arrays, triangulations)
+        state["fitness_cache_entries"] = [(key.tobytes(), (float(fitness),)) for key, fitness
+                                          in zip(arrays["cache_keys"], arrays["cache_values"])]
+        random_version, random_internal_state, random_gauss_next = state["random_state"]
+        state["random_state"] = (random_version, tuple(random_internal_state), random_gauss_next)
+        return state
+
+    @staticmethod
+    def __to_json(value):
+        return value.item() if isinstance(value, np.generic) else value
+
+    @staticmethod
+    def __pack_individuals(name: str, individuals: list, triangulations: dict):
+        coordinates = np.array([np.asarray(ind) for ind in individuals], dtype=COORDINATE_DTYPE)
+        fitness = np.array([ind.fitness.values[0] if ind.fitness.valid else np.nan for ind in individuals])
+
+        # Clones share their triangulation, which is stored once
+        triangulation_indices = []
+        for ind in individuals:
+            triangulation = getattr(ind, "triangulation", None)
+            if triangulation is None:
+                triangulation_indices.append(-1)
+                continue
+            if id(triangulation) not in triangulations:
+                triangulations[id(triangulation)] = triangulation
+            triangulation_indices.append(list(triangulations).index(id(triangulation)))
+
+        return {f"{name}_coordinates": coordinates.reshape(len(individuals), -1, 2),
+                f"{name}_fitness": fitness,
+                f"{name}_triangulations": np.array(triangulation_indices, dtype=np.int32)}
+
+    @staticmethod
+    def __unpack_individuals(name: str, arrays: dict, triangulations: list):
+        individuals = []
+        for coordinates, fitness, triangulation_index in zip(arrays[f"{name}_coordinates"],
+                                                             arrays[f"{name}_fitness"],
+                                                             arrays[f"{name}_triangulations"]):
+            ind = creator.Individual(coordinates)
+            if not np.isnan(fitness):
+                ind.fitness.values = (float(fitness),)
+            if triangulation_index >= 0:
+                ind.triangulation = triangulations[triangulation_index]
+            individuals.append(ind)
+        return individuals
+
+    @staticmethod
+    def __pack_triangulations(triangulations: list):
+        vertices = [np.empty((0, 2), dtype=np.int32)] + [t.vertices for t in triangulations]
+        simplices = [np.empty((0, 3), dtype=np.int32)] + [t.simplices for t in triangulations]
+        neighbors = [np.empty((0, 3), dtype=np.int32)] + [t.neighbors for t in triangulations]
+        return {"triangulation_vertex_counts": np.array([len(t.vertices) for t in triangulations], dtype=np.int64),
+                "triangulation_simplex_counts": np.array([len(t.simplices) for t in triangulations], dtype=np.int64),
+                "triangulation_vertices": np.concatenate(vertices).astype(np.int32),
+                "triangulation_simplices": np.concatenate(simplices).astype(np.int32),
+                "triangulation_neighbors": np.concatenate(neighbors).astype(np.int32)}
+
+    @staticmethod
+    def __unpack_triangulations(arrays: dict):
+        vertex_offsets = np.cumsum(arrays["triangulation_vertex_counts"])
+        simplex_offsets = np.cumsum(arrays["triangulation_simplex_counts"])
+        vertices = np.split(arrays["triangulation_vertices"].astype(np.int64), vertex_offsets)
+        simplices = np.split(arrays["triangulation_simplices"], simplex_offsets)
+        neighbors = np.split(arrays["triangulation_neighbors"], simplex_offsets)
+        # The last split of each array is the empty remainder
+        return [Triangulation(*triangulation)
+                for triangulation in zip(vertices[:-1], simplices[:-1], neighbors[:-1])]
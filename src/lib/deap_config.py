@@ -1,4 +1,5 @@
 import os
+import random
 import multiprocessing
 
 from deap import base
@@ -9,6 +10,15 @@ from deap.tools import HallOfFame
 import pandas
 import numpy as np
 
+from src.lib.evaluator_pool import EvaluatorPool
+from src.lib.individual import IndividualArray
+from src.lib.fitness_cache import FitnessCache, DEFAULT_CACHE_SIZE
+from src.lib.checkpoint import Checkpoint, DEFAULT_GENERATIONS
+from src.lib.termination import Termination
+from src.lib.profiler import Profiler, get_timer, PROFILE_DIR, CPROFILE_MODE, VARIATION_STAGE, \
+                             EVALUATION_STAGE, SELECTION_STAGE, MIGRATION_STAGE, CALLBACK_STAGE, CHECKPOINT_STAGE
+from src.models.evolutionary_algorithm.ea_methods import UNIFORM_SAMPLING
+
 BEST_SELECTION = 'best'
 TOURNAMENT_SELECTION = 'tournament'
 CPU_COUNT = os.cpu_count()
@@ -17,6 +27,15 @@ class DeapConfig:
     def __init__(self, INDPB=0.1, cpu_count=CPU_COUNT, selection=BEST_SELECTION, 
                  tournament_size=3, gaussian_rate=0.05, NGEN=2, 
                  MU=50, LAMBDA=50, CXPB=0.9, MUTPB=0.1, edge_rate=0.5, 
+                 init_sampling=UNIFORM_SAMPLING,
+                 shared_memory=False, fitness_cache_size=DEFAULT_CACHE_SIZE,
+                 pyramid_levels=1, pyramid_stall=0,
+                 islands=1, migration_interval=10, migration_size=1, 
+                 migration_topology='ring', process_pool=None,
+                 checkpoint_path=None, checkpoint_generations=DEFAULT_GENERATIONS,
+                 checkpoint_seconds=0, improvement_window=0, min_improvement=0,
+                 max_seconds=0, max_evals=0, profile=False, profile_generations=(),
+                 profile_mode=CPROFILE_MODE, profile_dir=PROFILE_DIR,
                  log_dir=os.path.join('data', 'outputs', 'executions', 'logs'), 
                  **kwargs):
 
@@ -24,6 +43,51 @@ class DeapConfig:
         self.stats = tools.Statistics()
         self.cpu_count = cpu_count
         self.log_dir = log_dir
+
+        # Workers read the original image from shared memory instead of pickling the EA
+        self.shared_memory = bool(shared_memory)
+        self.evolutionary_algorithm = None
+
+        # A pool given by the caller is reused across runs and never closed here
+        self.process_pool = process_pool
+        self.external_pool = process_pool is not None
+
+        # Fitness of already evaluated genotypes (disabled when size is 0)
+        self.fitness_cache_size = fitness_cache_size
+        self.fitness_cache = FitnessCache(fitness_cache_size) if fitness_cache_size else None
+
+        # Coarse-to-fine evolution: level i evaluates at scale 2^(i+1-pyramid_levels)
+        # and is left on schedule or after pyramid_stall generations without improvement
+        self.pyramid_levels = max(pyramid_levels, 1)
+        self.pyramid_stall = pyramid_stall
+
+        # Island model: independent subpopulations (one process each) that
+        # exchange their best individuals every migration_interval generations
+        self.islands = islands
+        self.migration_interval = migration_interval
+        self.migration_size = migration_size
+        self.migration_topology = migration_topology
+
+        # Evolutionary state saved periodically so that long runs can be resumed
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_generations = checkpoint_generations
+        self.checkpoint_seconds = checkpoint_seconds
+        self.checkpoint = Checkpoint(checkpoint_path, checkpoint_generations, checkpoint_seconds) \
+                          if checkpoint_path else None
+
+        # Convergence and budget criteria that may stop the run before NGEN
+        self.improvement_window = improvement_window
+        self.min_improvement = min_improvement
+        self.max_seconds = max_seconds
+        self.max_evals = max_evals
+        self.termination = Termination(improvement_window, min_improvement, max_seconds, max_evals)
+
+        # Per-generation wall-time breakdown in the logbook (and profiles of profile_generations)
+        self.profile = bool(profile)
+        self.profile_generations = list(profile_generations)
+        self.profile_mode = profile_mode
+        self.profile_dir = profile_dir
+        self.profiler = Profiler(profile_generations, profile_mode, profile_dir) if profile else None
         
         self.NGEN = NGEN
         self.MU = MU
@@ -37,48 +101,94 @@ class DeapConfig:
 
         #rate of edges in initialization
         self.edge_rate = edge_rate
+        self.init_sampling = init_sampling
 
         #force stop from main thread
         self.forced_stop = False
     
-    def __init_coordinates(self, init_coordinates, order_individual):
-        coordinates = init_coordinates(self.edge_rate)
-        coordinates = order_individual(coordinates)
-        coordinates = creator.Individual(coordinates)
-        return coordinates
+    def get_parameters(self):
+        return {"INDPB": self.INDPB, "cpu_count": self.cpu_count, "selection": self.selection,
+                "tournament_size": self.tournament_size, "gaussian_rate": self.gaussian_rate,
+                "NGEN": self.NGEN, "MU": self.MU, "LAMBDA": self.LAMBDA, "CXPB": self.CXPB,
+                "MUTPB": self.MUTPB, "edge_rate": self.edge_rate,
+                "init_sampling": self.init_sampling, "shared_memory": self.shared_memory,
+                "fitness_cache_size": self.fitness_cache_size, "pyramid_levels": self.pyramid_levels,
+                "pyramid_stall": self.pyramid_stall, "islands": self.islands,
+                "migration_interval": self.migration_interval, "migration_size": self.migration_size,
+                "migration_topology": self.migration_topology,
+                "checkpoint_path": self.checkpoint_path,
+                "checkpoint_generations": self.checkpoint_generations,
+                "checkpoint_seconds": self.checkpoint_seconds,
+                "improvement_window": self.improvement_window,
+                "min_improvement": self.min_improvement, "max_seconds": self.max_seconds,
+                "max_evals": self.max_evals, "profile": self.profile,
+                "profile_generations": self.profile_generations,
+                "profile_mode": self.profile_mode, "profile_dir": self.profile_dir,
+                "log_dir": self.log_dir}
+
+    def __init_population(self, init_population, order_individual, n):
+        # Initial vertices of the whole population are sampled at once
+        population = init_population(n, self.edge_rate, self.init_sampling)
+        return [creator.Individual(order_individual(coordinates)) for coordinates in population]
+
+    def __init_individual(self, init_population, order_individual):
+        return self.__init_population(init_population, order_individual, 1)[0]
 
     # Needs to be used before creating the class (DEAP parallelism bug)
     @staticmethod
     def register_fitness():
         creator.create("FitnessMin", base.Fitness, weights=(-1.0,))
-        creator.create("Individual", list, fitness=creator.FitnessMin)
+        creator.create("Individual", IndividualArray, fitness=creator.FitnessMin)
 
-    def register_population(self, init_coordinates, order_individual):
+    def register_population(self, init_population, order_individual):
         self.toolbox.register("individual",
-                              self.__init_coordinates, 
-                              init_coordinates, 
+                              self.__init_individual, 
+                              init_population, 
                               order_individual)
         self.toolbox.register("population", 
-                              tools.initRepeat, 
-                              list, self.toolbox.individual)
+                              self.__init_population, 
+                              init_population, order_individual)
 
     def register_operators(self, 
                            fitness_custom_function, 
                            mutation_custom_function, 
-                           max_x, max_y):
+                           crossover_custom_function,
+                           max_x, max_y,
+                           population_fitness_function=None,
+                           population_mutation_function=None,
+                           population_crossover_function=None,
+                           genotype_key_function=None,
+                           resolution_function=None):
         
         selections = {BEST_SELECTION: {"function": tools.selBest},
                       TOURNAMENT_SELECTION: {"function": tools.selTournament, 
                                             "tournsize": self.tournament_size}}
 
         self.toolbox.register("evaluate", fitness_custom_function)
-        self.toolbox.register("mate", tools.cxTwoPoint)
+        if genotype_key_function is not None:
+            self.toolbox.register("genotype_key", genotype_key_function)
+        if resolution_function is not None:
+            self.toolbox.register("set_resolution", resolution_function)
+        if population_fitness_function is not None:
+            self.toolbox.register("evaluate_population", population_fitness_function)
+        self.toolbox.register("mate", crossover_custom_function)
         self.toolbox.register("mutate", mutation_custom_function, 
                                         sigma_x=max_x*self.gaussian_rate, 
                                         sigma_y=max_y*self.gaussian_rate, 
                                         indpb=self.INDPB)
+        if population_crossover_function is not None:
+            self.toolbox.register("mate_population", population_crossover_function)
+        if population_mutation_function is not None:
+            self.toolbox.register("mutate_population", population_mutation_function,
+                                  sigma_x=max_x*self.gaussian_rate,
+                                  sigma_y=max_y*self.gaussian_rate,
+                                  indpb=self.INDPB)
         self.toolbox.register("select", **selections[self.selection])
     
+    def register_checkpoint(self, get_rng_state, set_rng_state):
+        self.toolbox.register("get_rng_state", get_rng_state)
+        self.toolbox.register("set_rng_state", set_rng_state)
+
     def register_stats(self):
         self.stats = tools.Statistics(lambda ind: ind.fitness.values)
         self.stats.register("avg", np.mean)
@@ -86,7 +196,21 @@ class DeapConfig:
         self.stats.register("min", np.min)
         self.stats.register("max", np.max)
 
-    def register_parallelism(self):
+    def register_parallelism(self, evolutionary_algorithm=None):
+        if evolutionary_algorithm is not None:
+            self.evolutionary_algorithm = evolutionary_algorithm
+
+        if self.external_pool:
+            if isinstance(self.process_pool, EvaluatorPool):
+                self.process_pool.load(self.evolutionary_algorithm)
+            else:
+                self.toolbox.register("map", self.process_pool.map)
+            return
+
+        if self.shared_memory and self.evolutionary_algorithm is not None:
+            self.process_pool = EvaluatorPool(self.evolutionary_algorithm, self.cpu_count)
+            return
+
         self.process_pool = multiprocessing.Pool(self.cpu_count)
         self.toolbox.register("map", self.process_pool.map)
         return
@@ -99,28 +223,44 @@ class DeapConfig:
         df_log.to_csv(log_dir, index=False)
 
         if hall_of_fame:
-            df_hall_of_fame = pandas.DataFrame(hall_of_fame)
+            df_hall_of_fame = pandas.DataFrame([ind.reshape(-1) for ind in hall_of_fame])
             hall_of_fame_dir = os.path.join(self.log_dir, f'{file_name}_{seed}.csv')
             df_hall_of_fame.to_csv(hall_of_fame_dir, index=False)
     
     def run_algorithm(self, 
                       image_added_callback=lambda *_: None, 
                       stop_condition_callback=lambda: False, 
-                      parallel=True):
-        if parallel:
+                      parallel=True,
+                      migration_callback=None,
+                      verbose=True,
+                      resume=False):
+        if resume and (self.checkpoint is None or not self.checkpoint.exists()):
+            raise Exception("There is no checkpoint to resume from")
+
+        if parallel and not self.external_pool:
             with self.process_pool:
                 population, logbook, hof, best_fitnesses = self.__run_algorithm(image_added_callback=image_added_callback,
-                                                                                stop_condition_callback=stop_condition_callback)
+                                                                                stop_condition_callback=stop_condition_callback,
+                                                                                migration_callback=migration_callback,
+                                                                                verbose=verbose,
+                                                                                resume=resume)
         else:
             population, logbook, hof, best_fitnesses = self.__run_algorithm(image_added_callback=image_added_callback,
-                                                                            stop_condition_callback=stop_condition_callback)
+                                                                            stop_condition_callback=stop_condition_callback,
+                                                                            migration_callback=migration_callback,
+                                                                            verbose=verbose,
+                                                                            resume=resume)
 
         return population, logbook, hof, best_fitnesses
 
     def __run_algorithm(self, 
                         image_added_callback=lambda *_: None,
-                        stop_condition_callback=lambda: False):
-            pop = self.toolbox.population(n=self.MU)
+                        stop_condition_callback=lambda: False,
+                        migration_callback=None,
+                        verbose=True,
+                        resume=False):
+            initial_state = self.checkpoint.load() if resume else None
+            pop = initial_state["population"] if resume else self.toolbox.population(n=self.MU)
             pop, logbook, hof, best_fitnesses = self.__eaMuPlusLambda(pop, 
                                                                       self.toolbox, 
                                                                       self.MU, 
@@ -129,9 +269,12 @@ class DeapConfig:
                                                                       self.MUTPB, 
                                                                       self.NGEN, 
                                                                       stats=self.stats, 
+                                                                      halloffame=HallOfFame(1, similar=np.array_equal),
                                                                       image_added_callback=image_added_callback,
                                                                       stop_condition_callback=stop_condition_callback,
-                                                                      verbose=True)
+                                                                      migration_callback=migration_callback,
+                                                                      verbose=verbose,
+                                                                      initial_state=initial_state)
             return pop, logbook, hof, best_fitnesses
 
     def force_stop(self):
@@ -140,60 +283,269 @@ class DeapConfig:
     def __stop_condition(self, 
                          gen: int, 
                          ngen: int, 
-                         stop_condition_callback=lambda: False):
+                         stop_condition_callback=lambda: False,
+                         best_fitnesses=None,
+                         evaluations=0):
+        best_fitnesses = [] if best_fitnesses is None else best_fitnesses
         self.forced_stop = self.forced_stop or stop_condition_callback()
         
         conditions = [
             gen >= ngen,
             self.forced_stop, # User is allowed to stop the algorithm from the main thread,
+            self.termination.should_stop(best_fitnesses, evaluations),
         ]
 
         return any(conditions)
 
+    def __save_checkpoint(self, toolbox: base.Toolbox, population: list,
+                          halloffame: tools.HallOfFame, logbook: tools.Logbook,
+                          gen: int, best_fitnesses: list, level: int,
+                          stalled_generations: int):
+        cache_entries = list(self.fitness_cache.entries.items()) if self.fitness_cache is not None else []
+        rng_state = toolbox.get_rng_state() if hasattr(toolbox, "get_rng_state") else None
+        self.checkpoint.save({"population": population,
+                              "halloffame": list(halloffame) if halloffame is not None else [],
+                              "logbook": logbook,
+                              "gen": gen,
+                              "best_fitnesses": best_fitnesses,
+                              "level": level,
+                              "stalled_generations": stalled_generations,
+                              "elapsed_seconds": self.termination.get_elapsed_seconds(),
+                              "fitness_cache_entries": cache_entries,
+                              "fitness_cache_stats": (self.fitness_cache.hits, self.fitness_cache.misses) \
+                                                     if self.fitness_cache is not None else (0, 0),
+                              "random_state": random.getstate(),
+                              "rng_state": rng_state})
+
+    def __restore_checkpoint(self, toolbox: base.Toolbox, initial_state: dict,
+                             halloffame: tools.HallOfFame, logbook: tools.Logbook):
+        if halloffame is not None:
+            halloffame.update(initial_state["halloffame"])
+        for record in initial_state["logbook"]:
+            logbook.record(**record)
+        if self.fitness_cache is not None:
+            for key, fitness in initial_state["fitness_cache_entries"]:
+                self.fitness_cache.set(key, fitness)
+            self.fitness_cache.hits, self.fitness_cache.misses = initial_state["fitness_cache_stats"]
+
+        random.setstate(initial_state["random_state"])
+        if initial_state["rng_state"] is not None and hasattr(toolbox, "set_rng_state"):
+            toolbox.set_rng_state(initial_state["rng_state"])
+        return initial_state["gen"], initial_state["best_fitnesses"], initial_state["stalled_generations"]
+
+    def __get_converging_fitnesses(self, logbook: tools.Logbook, best_fitnesses: list,
+                                   level: int, multiresolution: bool):
+        if not multiresolution:
+            return best_fitnesses
+        # Coarse levels are left by the pyramid schedule, not by convergence
+        if level != self.pyramid_levels - 1:
+            return []
+        level_start = logbook.select("scale").index(self.get_resolution_scale(level))
+        return best_fitnesses[level_start:]
+
+    def get_resolution_scale(self, level: int):
+        return 0.5 ** (self.pyramid_levels - 1 - level)
+
+    def __next_resolution_level(self, level: int, gen: int, ngen: int, 
+                                stalled_generations: int):
+        if level == self.pyramid_levels - 1:
+            return level
+        scheduled = gen >= ngen * (level + 1) // self.pyramid_levels
+        stalled = self.pyramid_stall > 0 and stalled_generations >= self.pyramid_stall
+        return level + 1 if scheduled or stalled else level
+
+    def __set_resolution_level(self, toolbox: base.Toolbox, level: int):
+        toolbox.set_resolution(self.get_resolution_scale(level))
+        if self.fitness_cache is not None:
+            self.fitness_cache.clear() # Keys do not depend on the resolution
+
+    def __uses_fitness_cache(self, toolbox: base.Toolbox):
+        return self.fitness_cache is not None and hasattr(toolbox, "genotype_key")
+
+    def __get_evaluation_counts(self, toolbox: base.Toolbox):
+        # nevals counts the individuals with invalid fitness (as DEAP does) and
+        # evals the evaluations actually computed (without fitness cache hits)
+        counts = {"nevals": 0, "evals": 0}
+        if self.__uses_fitness_cache(toolbox):
+            counts.update({"cache_hits": 0, "cache_misses": 0})
+        return counts
+
+    def __evaluate(self, toolbox: base.Toolbox, individuals: list, 
+                   parallelism_params: dict, counts: dict):
+        # Every evaluation of a generation is added to its counts
+        counts["nevals"] += len(individuals)
+        if not self.__uses_fitness_cache(toolbox):
+            counts["evals"] += len(individuals)
+            return self.__evaluate_individuals(toolbox, individuals, parallelism_params)
+
+        # Only genotypes missing from the cache are evaluated (once per generation)
+        keys = [toolbox.genotype_key(ind) for ind in individuals]
+        fitnesses, missing_individuals = {}, {}
+        for key, ind in zip(keys, individuals):
+            if key not in fitnesses:
+                fitnesses[key] = self.fitness_cache.get(key)
+                if fitnesses[key] is None:
+                    missing_individuals[key] = ind
+        missing_keys = list(missing_individuals)
+        missing_individuals = list(missing_individuals.values())
+
+        evaluated = self.__evaluate_individuals(toolbox, missing_individuals, parallelism_params)
+        for key, fit in zip(missing_keys, evaluated):
+            fitnesses[key] = fit
+            self.fitness_cache.set(key, fit)
+
+        counts["evals"] += len(missing_keys)
+        counts["cache_hits"] += len(individuals) - len(missing_keys)
+        counts["cache_misses"] += len(missing_keys)
+        return [fitnesses[key] for key in keys]
+
+    def __evaluate_individuals(self, toolbox: base.Toolbox, individuals: list, 
+                               parallelism_params: dict):
+        if isinstance(self.process_pool, EvaluatorPool):
+            return [(float(fit),) for fit in self.process_pool.evaluate(individuals)]
+
+        if not hasattr(toolbox, "evaluate_population"):
+            return list(toolbox.map(toolbox.evaluate, individuals, **parallelism_params))
+
+        # Whole population is evaluated at once (one batch per process)
+        if len(individuals) == 0:
+            return []
+        batch_count = max(min(self.cpu_count, len(individuals)), 1)
+        batches = np.array_split(np.arange(len(individuals)), batch_count)
+        batches = [[individuals[i] for i in batch] for batch in batches]
+        fitnesses = toolbox.map(toolbox.evaluate_population, batches)
+        return [(float(fit),) for fit in np.concatenate(list(fitnesses))]
+
+    def __end_generation(self, logbook: tools.Logbook, verbose=True):
+        # Timings are added to the record of the generation once it is complete
+        if self.profiler is not None:
+            logbook[-1].update(self.profiler.end_generation(logbook[-1]))
+        if verbose:
+            print(logbook.stream)
+
+    # Modified version of original DEAP function: varOr
+    # Crossovers and mutations of all the offspring are applied as one batch each
+    def __varOr(self, population: list, toolbox: base.Toolbox, 
+                lambda_: int, cxpb: float, mutpb: float):
+        if not (hasattr(toolbox, "mate_population") and hasattr(toolbox, "mutate_population")):
+            return algorithms.varOr(population, toolbox, lambda_, cxpb, mutpb)
+
+        offspring = []
+        pairs = []
+        mutants = []
+        for _ in range(lambda_):
+            op_choice = random.random()
+            if op_choice < cxpb:            # Apply crossover
+                ind1, ind2 = [toolbox.clone(i) for i in random.sample(population, 2)]
+                del ind1.fitness.values
+                pairs.append((ind1, ind2))
+                offspring.append(ind1)
+            elif op_choice < cxpb + mutpb:  # Apply mutation
+                ind = toolbox.clone(random.choice(population))
+                del ind.fitness.values
+                mutants.append(ind)
+                offspring.append(ind)
+            else:                           # Apply reproduction
+                offspring.append(random.choice(population))
+
+        toolbox.mate_population(pairs)
+        toolbox.mutate_population(mutants)
+        return offspring
+
     # Modified version of original DEAP function: eaMuPlusLambda 
     # https://deap.readthedocs.io/en/master/_modules/deap/algorithms.html#eaMuPlusLambda
     def __eaMuPlusLambda(self, population: list, toolbox: base.Toolbox, 
                          mu: int, lambda_: int, cxpb: float, 
                          mutpb: float, ngen: int, 
                          stats: tools.Statistics = None, 
-                         halloffame: tools.HallOfFame = HallOfFame(1),
+                         halloffame: tools.HallOfFame = HallOfFame(1, similar=np.array_equal),
                          image_added_callback= lambda *_: None,
                          stop_condition_callback=lambda: False,
-                         verbose=True):
+                         migration_callback=None,
+                         verbose=True,
+                         initial_state=None):
 
         logbook = tools.Logbook()
-        logbook.header = ['gen', 'nevals'] + (stats.fields if stats else [])
+        counts = self.__get_evaluation_counts(toolbox)
+        logbook.header = ['gen', 'nevals', 'evals'] + (stats.fields if stats else []) + \
+                         [field for field in counts if field not in ('nevals', 'evals')]
+        profiler = self.profiler
+        if profiler is not None:
+            logbook.header += profiler.get_columns()
         parallelism_params = {} if self.cpu_count < 2 else \
                              {"chunksize": len(population)//self.cpu_count}
 
-        invalid_ind = [ind for ind in population if not ind.fitness.valid]
-        fitnesses = list(toolbox.map(toolbox.evaluate, invalid_ind, **parallelism_params))
-
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
-
-        if halloffame is not None:
-            halloffame.update(population)
-
-        record = stats.compile(population) if stats is not None else {}
-        logbook.record(gen=0, nevals=len(invalid_ind), **record)
+        multiresolution = self.pyramid_levels > 1 and hasattr(toolbox, "set_resolution")
+        level, stalled_generations = 0, 0
+        resolution_record = {}
+        if multiresolution:
+            logbook.header.append('scale')
+            if initial_state is not None:
+                level = initial_state["level"]
+            self.__set_resolution_level(toolbox, level)
+            resolution_record = {"scale": self.get_resolution_scale(level)}
+
+        checkpoint_gen = None
+        # The time budget also counts the seconds run before the checkpoint
+        self.termination.start(initial_state["elapsed_seconds"] if initial_state is not None else 0)
+        if initial_state is not None:
+            # Resumed runs continue exactly where the checkpoint was saved
+            gen, best_fitnesses, stalled_generations = self.__restore_checkpoint(toolbox, initial_state,
+                                                                                 halloffame, logbook)
+        else:
+            if profiler is not None:
+                profiler.start_generation(0)
+            counts = self.__get_evaluation_counts(toolbox)
+            invalid_ind = [ind for ind in population if not ind.fitness.valid]
+            with get_timer(profiler, EVALUATION_STAGE):
+                fitnesses = self.__evaluate(toolbox, invalid_ind, parallelism_params, counts)
 
-        if verbose:
-            print(logbook.stream)
+            for ind, fit in zip(invalid_ind, fitnesses):
+                ind.fitness.values = fit
 
-        gen = 1
-        best_fitnesses = [record['min']]
-        image_added_callback({"population": population[:],
-                              "fitness": fitnesses[:]},
-                              gen)
+            if halloffame is not None:
+                halloffame.update(population)
 
-        while not self.__stop_condition(gen, ngen, stop_condition_callback):
-            offspring = algorithms.varOr(population, toolbox, 
+            record = stats.compile(population) if stats is not None else {}
+            logbook.record(gen=0, **counts, **resolution_record, **record)
+
+            gen = 1
+            best_fitnesses = [record['min']]
+            with get_timer(profiler, CALLBACK_STAGE):
+                image_added_callback({"population": population[:],
+                                      "fitness": fitnesses[:]},
+                                      gen)
+            self.__end_generation(logbook, verbose)
+
+        while not self.__stop_condition(gen, ngen, stop_condition_callback,
+                                        self.__get_converging_fitnesses(logbook, best_fitnesses,
+                                                                        level, multiresolution),
+                                        sum(logbook.select("evals"))):
+            if profiler is not None:
+                profiler.start_generation(gen)
+            counts, level_changed = self.__get_evaluation_counts(toolbox), False
+            next_level = self.__next_resolution_level(level, gen, ngen, stalled_generations) \
+                         if multiresolution else level
+            if next_level != level:
+                # Fitness values of different levels are not comparable
+                level, level_changed = next_level, True
+                self.__set_resolution_level(toolbox, level)
+                resolution_record = {"scale": self.get_resolution_scale(level)}
+                with get_timer(profiler, EVALUATION_STAGE):
+                    fitnesses = self.__evaluate(toolbox, population, parallelism_params, counts)
+                for ind, fit in zip(population, fitnesses):
+                    ind.fitness.values = fit
+
+                if halloffame is not None:
+                    halloffame.clear()
+                    halloffame.update(population)
+
+            with get_timer(profiler, VARIATION_STAGE):
+                offspring = self.__varOr(population, toolbox, 
                                          lambda_, cxpb, mutpb)
             invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-            fitnesses = list(toolbox.map(toolbox.evaluate, 
-                                         invalid_ind, 
-                                         **parallelism_params))
+            with get_timer(profiler, EVALUATION_STAGE):
+                fitnesses = self.__evaluate(toolbox, invalid_ind, parallelism_params, counts)
 
             for ind, fit in zip(invalid_ind, fitnesses):
                 ind.fitness.values = fit
@@ -201,18 +553,48 @@ class DeapConfig:
             if halloffame is not None:
                 halloffame.update(offspring)
 
-            population[:] = toolbox.select(population + offspring, mu)
-            record = stats.compile(population) if stats is not None else {}
-            logbook.record(gen=gen, nevals=len(invalid_ind), **record)
+            with get_timer(profiler, SELECTION_STAGE):
+                population[:] = toolbox.select(population + offspring, mu)
 
-            if verbose:
-                print(logbook.stream)
+            if migration_callback is not None:
+                # Immigrants arrive without fitness (they may come from another resolution level)
+                with get_timer(profiler, MIGRATION_STAGE):
+                    population[:] = migration_callback(population, gen)
+                immigrants = [ind for ind in population if not ind.fitness.valid]
+                with get_timer(profiler, EVALUATION_STAGE):
+                    immigrant_fitnesses = self.__evaluate(toolbox, immigrants, parallelism_params, counts)
+                for ind, fit in zip(immigrants, immigrant_fitnesses):
+                    ind.fitness.values = fit
+
+                if halloffame is not None:
+                    halloffame.update(immigrants)
+
+            record = stats.compile(population) if stats is not None else {}
+            logbook.record(gen=gen, **counts, **resolution_record, **record)
 
             gen += 1
             min_loss = record['min']
+            improved = level_changed or min_loss < best_fitnesses[-1]
+            stalled_generations = 0 if improved else stalled_generations + 1
             best_fitnesses.append(min_loss)
-            image_added_callback({"population": population[:],
-                                  "fitness": fitnesses[:]},
-                                  gen)
+            with get_timer(profiler, CALLBACK_STAGE):
+                image_added_callback({"population": population[:],
+                                      "fitness": fitnesses[:]},
+                                      gen)
+
+            if self.checkpoint is not None and self.checkpoint.should_save(gen):
+                with get_timer(profiler, CHECKPOINT_STAGE):
+                    self.__save_checkpoint(toolbox, population, halloffame, logbook, gen,
+                                           best_fitnesses, level, stalled_generations)
+                checkpoint_gen = gen
+            self.__end_generation(logbook, verbose)
+
+        if verbose and self.termination.reason is not None:
+            print(f"Stopped early: {self.termination.reason}")
+
+        # Also saved when the run ends or is stopped between periodic checkpoints
+        if self.checkpoint is not None and checkpoint_gen != gen:
+            self.__save_checkpoint(toolbox, population, halloffame, logbook, gen,
+                                   best_fitnesses, level, stalled_generations)
 
         return population, logbook, halloffame, best_fitnesses
\ No newline at end of file
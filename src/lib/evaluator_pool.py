@@ -0,0 +1,135 @@
+import os
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from src.models.evolutionary_algorithm.ea_methods import EA
+from src.lib.individual import COORDINATE_DTYPE
+from src.utils.image_processor import ImageProcessor
+
+CPU_COUNT = os.cpu_count()
+
+# Process-local state of each pool worker
+_worker_shared_image = None
+_worker_ea = None
+_worker_image_version = None
+
+def _attach_shared_image(shared_image_name: str):
+    try:
+        return shared_memory.SharedMemory(name=shared_image_name, track=False)
+    except TypeError: # Python < 3.13 tracks every attached segment
+        shared_image = shared_memory.SharedMemory(name=shared_image_name)
+        resource_tracker.unregister(shared_image._name, "shared_memory") # Unlinked by the pool
+        return shared_image
+
+def _load_image(image_state: tuple):
+    global _worker_shared_image, _worker_ea, _worker_image_version
+    shared_image_name, shape, dtype, image_processor_args, version = image_state
+    if version == _worker_image_version:
+        return
+
+    _worker_ea = None # Releases the views of the previous image
+    if _worker_shared_image is not None:
+        try:
+            _worker_shared_image.close()
+        except BufferError:
+            pass
+    _worker_shared_image = _attach_shared_image(shared_image_name)
+    original_image_matrix = np.ndarray(shape, dtype=dtype, buffer=_worker_shared_image.buf)
+
+    ip = ImageProcessor(**image_processor_args)
+    ip.load_matrix(original_image_matrix)
+    _worker_ea = EA(ip)
+    _worker_image_version = version
+
+def _evaluate_batch(batch: tuple):
+    image_state, coordinates, scale = batch
+    _load_image(image_state)
+    _worker_ea.image_processor.set_scale(scale)
+    return _worker_ea.eval_population(coordinates)
+
+class EvaluatorPool:
+    """
+    Long-lived process pool whose workers read the original image from
+    shared memory. Only packed coordinate arrays are sent to the workers.
+
+    load() replaces the image (and image processor configuration) without
+    respawning the workers: each task carries a version of the image state
+    and workers attach to the new segment the first time they see it.
+    """
+    def __init__(self, evolutionary_algorithm: EA = None, cpu_count=CPU_COUNT):
+        self.cpu_count = cpu_count
+        self.image_processor = None
+        self.shared_image = None
+        self.image_state = None
+        self.version = 0
+        self.process_pool = multiprocessing.Pool(cpu_count)
+
+        if evolutionary_algorithm is not None:
+            self.load(evolutionary_algorithm)
+
+    def load(self, evolutionary_algorithm: EA):
+        ip = evolutionary_algorithm.image_processor
+        original_image_matrix = ip.full_resolution_matrix
+        # Workers take their size from the image and the rest of their
+        # configuration from these arguments
+        image_processor_args = {"input_name": ip.input_name or "",
+                                "tri_outline": ip.triangle_outline,
+                                "fitness_mode": ip.fitness_mode}
+        if self.image_processor is not None and \
+           self.image_processor.full_resolution_matrix is original_image_matrix:
+            self.image_processor = ip
+            if image_processor_args != self.image_state[3]: # Same image, new configuration
+                self.version += 1
+                self.image_state = (*self.image_state[:3], image_processor_args, self.version)
+            return
+
+        shared_image = shared_memory.SharedMemory(create=True,
+                                                  size=original_image_matrix.nbytes)
+        shared_matrix = np.ndarray(original_image_matrix.shape,
+                                   dtype=original_image_matrix.dtype,
+                                   buffer=shared_image.buf)
+        shared_matrix[:] = original_image_matrix
+        del shared_matrix
+
+        self.__release_shared_image()
+        self.shared_image = shared_image
+        self.image_processor = ip
+        self.version += 1
+
+        self.image_state = (self.shared_image.name,
+                            original_image_matrix.shape,
+                            original_image_matrix.dtype.str,
+                            image_processor_args,
+                            self.version)
+
+    def evaluate(self, individuals: list):
+        if len(individuals) == 0:
+            return np.empty(0)
+        if self.image_state is None:
+            raise Exception("No image has been loaded in the evaluator pool")
+
+        coordinates = np.array(individuals, dtype=COORDINATE_DTYPE)
+        batches = np.array_split(coordinates, min(self.cpu_count, len(coordinates)))
+        batches = [(self.image_state, batch, self.image_processor.scale) for batch in batches]
+        fitnesses = self.process_pool.map(_evaluate_batch, batches, chunksize=1)
+        return np.concatenate(fitnesses)
+
+    def __release_shared_image(self):
+        # Workers keep their own mapping until they load the next image
+        if self.shared_image is not None:
+            self.shared_image.close()
+            self.shared_image.unlink()
+            self.shared_image = None
+
+    def close(self):
+        self.process_pool.close()
+        self.process_pool.join()
+        self.__release_shared_image()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
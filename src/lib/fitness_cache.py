@@ -0,0 +1,46 @@
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+DEFAULT_CACHE_SIZE = 10_000
+
+class FitnessCache:
+    """
+    Bounded LRU cache of fitness values keyed by a hash of the integer
+    vertices of an individual (after clipping, corners included).
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(vertices: np.ndarray):
+        vertices = np.ascontiguousarray(vertices, dtype=np.int32)
+        return hashlib.blake2b(vertices.tobytes(), digest_size=16).digest()
+
+    def get(self, key: bytes):
+        fitness = self.entries.get(key)
+        if fitness is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return fitness
+
+    def set(self, key: bytes, fitness: float):
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
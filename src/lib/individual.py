@@ -0,0 +1,28 @@
+import copy
+
+import numpy as np
+
+COORDINATE_DTYPE = np.float32
+
+class IndividualArray(np.ndarray):
+    """
+    Contiguous (V, 2) array of vertex coordinates used as the base class of
+    DEAP individuals. Replaces DEAP's numpy wrapper, which pickles every row
+    as a separate array.
+    """
+    def __new__(cls, iterable):
+        coordinates = np.array(iterable, dtype=COORDINATE_DTYPE).reshape(-1, 2)
+        return coordinates.view(cls)
+
+    def __deepcopy__(self, memo):
+        copy_ = np.ndarray.copy(self)
+        copy_.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return copy_
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def __reduce__(self):
+        # Cached triangulations are not sent to other processes
+        state = {k: v for k, v in self.__dict__.items() if k != "triangulation"}
+        return (self.__class__, (np.asarray(self),), state)
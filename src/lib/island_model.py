@@ -0,0 +1,214 @@
+import random
+import queue
+import multiprocessing
+
+from deap import creator
+from deap import tools
+from deap.tools import HallOfFame
+import numpy as np
+
+from src.lib.deap_config import DeapConfig
+
+RING_TOPOLOGY = 'ring'
+RANDOM_TOPOLOGY = 'random'
+TOPOLOGIES = [RING_TOPOLOGY, RANDOM_TOPOLOGY]
+POLL_SECONDS = 1
+
+class Migration:
+    """
+    Every interval generations each island sends its best individuals to
+    one destination and receives the emigrants of exactly one island, which
+    replace its worst individuals. The ring topology sends to the next
+    island; the random one to the next island of a random ring drawn (with
+    the same seed in every process) for each migration.
+    """
+    def __init__(self, islands: int, interval: int, size: int,
+                 topology=RING_TOPOLOGY, seed=0):
+        if topology not in TOPOLOGIES:
+            raise Exception(f'Invalid migration topology: {topology}')
+        self.islands = islands
+        self.interval = interval
+        self.size = size
+        self.topology = topology
+        self.seed = seed
+
+    def get_destination(self, island: int, gen: int):
+        order = np.arange(self.islands)
+        if self.topology == RANDOM_TOPOLOGY:
+            order = np.random.default_rng((self.seed, gen)).permutation(self.islands)
+        position = int(np.flatnonzero(order == island)[0])
+        return int(order[(position + 1) % self.islands])
+
+    def get_callback(self, island: int, inboxes: list, stop_event):
+        def migration_callback(population: list, gen: int):
+            if gen % self.interval != 0:
+                return population
+
+            emigrants = [creator.Individual(ind) for ind in tools.selBest(population, self.size)]
+            inboxes[self.get_destination(island, gen)].put(emigrants)
+
+            # Immigrants already sent are received even after a stop
+            immigrants = None
+            while immigrants is None:
+                try:
+                    immigrants = inboxes[island].get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    if stop_event.is_set():
+                        break
+            if immigrants is None:
+                return population
+
+            survivors = tools.selBest(population, len(population) - len(immigrants))
+            return survivors + immigrants
+
+        return migration_callback
+
+def get_island_evals(max_evals: int, islands: int, island: int):
+    # Share of the evaluation budget of an island (0 disables it)
+    if max_evals <= 0:
+        return 0
+    return max(max_evals // islands + int(island < max_evals % islands), 1)
+
+def _run_island(island: int, evolutionary_algorithm, deap_parameters: dict, seed: int,
+                migration: Migration, inboxes: list, results, stop_event, verbose: bool):
+    # Local imports: the handler module imports this one
+    from src.models.evolutionary_algorithm.ea_handler import EAHandler
+
+    if not hasattr(creator, "Individual"):
+        DeapConfig.register_fitness()
+
+    random.seed(seed)
+    evolutionary_algorithm.update_seed(seed)
+    dc = DeapConfig(**{**deap_parameters, "cpu_count": 1, "islands": 1, "checkpoint_path": None})
+    eac = EAHandler(evolutionary_algorithm, dc)
+    eac.build_deap_module()
+
+    def image_added_callback(individuals_data: dict, generation: int):
+        if island == 0: # Progress of the first island is reported
+            results.put(("progress", island, individuals_data["population"], generation))
+
+    algorithm_output = dc.run_algorithm(image_added_callback=image_added_callback,
+                                        stop_condition_callback=stop_event.is_set,
+                                        parallel=False,
+                                        migration_callback=migration.get_callback(island, inboxes, stop_event),
+                                        verbose=verbose)
+    population, logbook, hof, best_fitnesses = algorithm_output
+    results.put(("result", island, population, logbook, list(hof), best_fitnesses))
+
+class IslandModel:
+    """
+    Runs deap_configurer.islands (mu + lambda) subpopulations in separate
+    processes, each with its own toolbox, seed and a single CPU, and merges
+    their populations, halls of fame and logbooks.
+
+    Budgets apply to the whole run: max_evals is split between the islands
+    (the run ends when one of them spends its share) and max_seconds is
+    checked here against the wall-clock time of the run.
+    """
+    def __init__(self, evolutionary_algorithm, deap_configurer: DeapConfig):
+        self.evolutionary_algorithm = evolutionary_algorithm
+        self.deap_configurer = deap_configurer
+        self.island_logbooks = []
+
+    def run(self, image_added_callback=lambda *_: None,
+            stop_condition_callback=lambda: False, verbose=True):
+        dc = self.deap_configurer
+        islands = dc.islands
+        seeds = [random.randrange(2**32) for _ in range(islands)]
+        migration = Migration(islands, dc.migration_interval, dc.migration_size,
+                              dc.migration_topology, seed=seeds[0])
+
+        inboxes = [multiprocessing.Queue() for _ in range(islands)]
+        results = multiprocessing.Queue()
+        stop_event = multiprocessing.Event()
+        island_parameters = [{**dc.get_parameters(), "max_seconds": 0,
+                              "max_evals": get_island_evals(dc.max_evals, islands, island)}
+                             for island in range(islands)]
+        processes = [multiprocessing.Process(target=_run_island,
+                                             args=(island, self.evolutionary_algorithm, island_parameters[island],
+                                                   seeds[island], migration, inboxes, results, stop_event, False))
+                     for island in range(islands)]
+        dc.termination.start()
+        for process in processes:
+            process.start()
+
+        island_results = {}
+        while len(island_results) < islands:
+            if stop_condition_callback() or dc.forced_stop:
+                stop_event.set()
+            # Only the time budget is checked here (without fitness values or evaluations)
+            if not stop_event.is_set() and dc.max_seconds > 0 and dc.termination.should_stop([], 0):
+                stop_event.set()
+
+            try:
+                message = results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    raise Exception("Island processes finished without returning their results")
+                continue
+
+            if message[0] == "progress":
+                _, _, population, generation = message
+                image_added_callback({"population": population,
+                                      "fitness": [ind.fitness.values for ind in population]},
+                                     generation)
+            else:
+                _, island, population, logbook, hof, best_fitnesses = message
+                island_results[island] = (population, logbook, hof, best_fitnesses)
+                if len(best_fitnesses) < dc.NGEN: # An island that met a termination criterion ends the run
+                    stop_event.set()
+
+        # Emigrants sent after a forced stop are never received
+        for process in processes:
+            while process.is_alive():
+                for inbox in inboxes:
+                    while not inbox.empty():
+                        inbox.get()
+                process.join(timeout=POLL_SECONDS)
+
+        return self.__merge_results([island_results[island] for island in range(islands)], verbose)
+
+    def __merge_results(self, island_results: list, verbose=True):
+        populations, logbooks, hofs, best_fitnesses = zip(*island_results)
+        self.island_logbooks = list(logbooks)
+
+        population = sorted([ind for population in populations for ind in population],
+                            key=lambda ind: ind.fitness.values[0])
+        halloffame = HallOfFame(1, similar=np.array_equal)
+        halloffame.update([ind for hof in hofs for ind in hof])
+
+        generations = min(len(fitnesses) for fitnesses in best_fitnesses)
+        best_fitnesses = [min(fitnesses[gen] for fitnesses in best_fitnesses) for gen in range(generations)]
+        logbook = self.merge_logbooks(logbooks)
+        if verbose:
+            print(logbook)
+        return population, logbook, halloffame, best_fitnesses
+
+    @staticmethod
+    def merge_logbooks(logbooks: list):
+        """
+        One record per generation with the statistics of the union of the
+        islands (all of them have the same population size).
+        """
+        logbook = tools.Logbook()
+        logbook.header = ['gen', 'island_count'] + [field for field in logbooks[0].header if field != 'gen']
+
+        for records in zip(*logbooks):
+            record = {"gen": records[0]["gen"], "island_count": len(records)}
+            for field in logbooks[0].header:
+                values = np.array([island_record[field] for island_record in records if field in island_record])
+                if field == 'gen' or len(values) == 0:
+                    continue
+                elif field in ('nevals', 'evals', 'cache_hits', 'cache_misses'):
+                    record[field] = int(np.sum(values))
+                elif field == 'min':
+                    record[field] = np.min(values)
+                elif field == 'max' or field.endswith('_time'): # Islands run concurrently
+                    record[field] = np.max(values)
+                elif field == 'std':
+                    averages = np.array([island_record["avg"] for island_record in records])
+                    record[field] = np.sqrt(np.mean(np.square(values) + np.square(averages)) - np.square(np.mean(averages)))
+                else:
+                    record[field] = np.mean(values)
+            logbook.record(**record)
+        return logbook
@@ -0,0 +1,143 @@
+import os
+import sys
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+PROFILE_DIR = os.path.join("data", "outputs", "profiles")
+CPROFILE_MODE = 'cprofile'
+SAMPLING_MODE = 'sampling'
+PROFILE_MODES = [CPROFILE_MODE, SAMPLING_MODE]
+SAMPLING_INTERVAL = 0.005 # Seconds between stack samples
+
+VARIATION_STAGE = 'variation'
+EVALUATION_STAGE = 'evaluation'
+TRIANGULATION_STAGE = 'triangulation' # Part of the evaluation (only measured in-process)
+RASTERIZATION_STAGE = 'rasterization' # Part of the evaluation (only measured in-process)
+SELECTION_STAGE = 'selection'
+MIGRATION_STAGE = 'migration'
+CALLBACK_STAGE = 'callback'
+CHECKPOINT_STAGE = 'checkpoint'
+STAGES = [VARIATION_STAGE, EVALUATION_STAGE, TRIANGULATION_STAGE, RASTERIZATION_STAGE,
+          SELECTION_STAGE, MIGRATION_STAGE, CALLBACK_STAGE, CHECKPOINT_STAGE]
+GENERATION_COLUMN = 'generation_time'
+
+NULL_TIMER = nullcontext()
+
+def get_timer(profiler, stage: str):
+    # Timers cost a single check when profiling is disabled
+    return NULL_TIMER if profiler is None else profiler.timer(stage)
+
+def get_column(stage: str):
+    return f"{stage}_time"
+
+class Profiler:
+    """
+    Wall-time breakdown of each generation by stage, recorded in the
+    logbook as <stage>_time columns (plus generation_time).
+
+    Custom timers can be added with timer(stage) or add_time(stage,
+    seconds), and hooks registered with add_hook are called after every
+    generation with (gen, record), where record extends the logbook record
+    of the generation with its timings. The generations listed in generations
+    are also captured with cProfile (.prof files) or a sampling profiler
+    (collapsed stacks, as read by flame graph tools) in output_dir.
+    """
+    def __init__(self, generations=(), mode=CPROFILE_MODE, output_dir=PROFILE_DIR,
+                 sampling_interval=SAMPLING_INTERVAL):
+        self.generations = set(generations)
+        self.mode = mode
+        self.output_dir = output_dir
+        self.sampling_interval = sampling_interval
+        self.hooks = []
+        self.times = {}
+        self.generation = None
+        self.generation_start = None
+        self.capture = None
+
+    def get_columns(self):
+        return [get_column(stage) for stage in STAGES] + [GENERATION_COLUMN]
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, perf_counter() - start)
+
+    def add_time(self, stage: str, seconds: float):
+        self.times[stage] = self.times.get(stage, 0) + seconds
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def start_generation(self, gen: int):
+        self.times = {}
+        self.generation = gen
+        if gen in self.generations:
+            self.capture = cProfile.Profile() if self.mode == CPROFILE_MODE else \
+                           _StackSampler(self.sampling_interval)
+            self.capture.enable()
+        self.generation_start = perf_counter()
+
+    def end_generation(self, logbook_record=None):
+        """
+        Returns the timing record of the generation.
+        """
+        seconds = perf_counter() - self.generation_start
+        if self.capture is not None:
+            self.capture.disable()
+            self.__save_capture()
+            self.capture = None
+
+        record = {get_column(stage): 0.0 for stage in STAGES}
+        record.update({get_column(stage): stage_seconds for stage, stage_seconds in self.times.items()})
+        record[GENERATION_COLUMN] = seconds
+        for hook in self.hooks:
+            hook(self.generation, {**(logbook_record or {}), **record})
+        return record
+
+    def __save_capture(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        extension = "prof" if self.mode == CPROFILE_MODE else "folded"
+        path = os.path.join(self.output_dir, f"{os.getpid()}_generation_{self.generation}.{extension}")
+        self.capture.dump_stats(path)
+
+class _StackSampler:
+    """
+    Samples the stack of the thread that enabled it from a background thread.
+    """
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def enable(self):
+        self.thread_id = threading.get_ident()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.__sample, daemon=True)
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def dump_stats(self, path: str):
+        with open(path, "w") as stacks_file:
+            for stack, count in self.stacks.most_common():
+                stacks_file.write(f"{stack} {count}\n")
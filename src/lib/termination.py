@@ -0,0 +1,55 @@
+from time import time
+
+class Termination:
+    """
+    Termination criteria checked after every generation besides NGEN (0
+    disables each of them):
+    - improvement_window: the relative improvement of the best fitness over
+      the last improvement_window generations is not greater than
+      min_improvement (with min_improvement=0, no improvement at all).
+    - max_seconds: wall-clock budget of the run.
+    - max_evals: budget of fitness evaluations actually computed (the evals
+      column of the logbook, fitness cache hits are free). LocalSearchSolver
+      applies the same rule through IncrementalEvaluator.evaluations.
+    """
+    def __init__(self, improvement_window=0, min_improvement=0,
+                 max_seconds=0, max_evals=0):
+        self.improvement_window = improvement_window
+        self.min_improvement = min_improvement
+        self.max_seconds = max_seconds
+        self.max_evals = max_evals
+        self.start_time = time()
+        self.reason = None
+        self.out_of_time = False # Stopped by max_seconds
+
+    def start(self, elapsed_seconds=0):
+        # Resumed runs keep the seconds spent before they were interrupted
+        self.start_time = time() - elapsed_seconds
+        self.reason = None
+        self.out_of_time = False
+
+    def get_elapsed_seconds(self):
+        return time() - self.start_time
+
+    def get_relative_improvement(self, best_fitnesses: list):
+        previous, current = best_fitnesses[-1 - self.improvement_window], best_fitnesses[-1]
+        return (previous - current) / previous if previous != 0 else 0
+
+    def is_converged(self, best_fitnesses: list):
+        if self.improvement_window <= 0 or len(best_fitnesses) <= self.improvement_window:
+            return False
+        return self.get_relative_improvement(best_fitnesses) <= self.min_improvement
+
+    def should_stop(self, best_fitnesses: list, evaluations: int):
+        """
+        best_fitnesses must only contain comparable fitness values (e.g.
+        those of the current resolution level).
+        """
+        if self.is_converged(best_fitnesses):
+            self.reason = f"no improvement greater than {self.min_improvement} in {self.improvement_window} generations"
+        elif self.max_seconds > 0 and self.get_elapsed_seconds() >= self.max_seconds:
+            self.reason = f"time budget of {self.max_seconds} seconds reached"
+            self.out_of_time = True
+        elif self.max_evals > 0 and evaluations >= self.max_evals:
+            self.reason = f"budget of {self.max_evals} evaluations reached"
+        return self.reason is not None
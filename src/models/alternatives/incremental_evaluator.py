@@ -0,0 +1,100 @@
+import numpy as np
+
+from src.models.evolutionary_algorithm.ea_methods import EA
+from src.lib.fitness_cache import FitnessCache
+from src.utils.triangulation import Triangulation
+
+class IncrementalEvaluator:
+    """
+    Keeps the triangulation of an individual and the squared error of each
+    of its triangles. Moving a single vertex repairs the triangulation with
+    Lawson flips and only re-scores the triangles around the moved vertex
+    and the flipped ones (from the pixel statistics they cover).
+
+    Usage: propose(gene, value) returns the fitness the individual would have
+    with that gene value; accept() keeps the proposal and undo() discards it.
+    Proposals found in the fitness cache are only triangulated if accepted.
+    evaluations counts the fitness values actually computed (the initial one
+    included): cache hits and proposals that do not move the vertex are free.
+    """
+    def __init__(self, evolutionary_algorithm: EA, individual: list,
+                 fitness_cache: FitnessCache = None):
+        self.ea = evolutionary_algorithm
+        self.fitness_cache = fitness_cache
+        self.evaluations = 0
+        self.reset(individual)
+
+    def reset(self, individual: list):
+        vertices = np.array(self.ea.get_vertices(individual), dtype=np.int64)
+        self.triangulation = Triangulation.build(vertices)
+        self.errors = self.__get_errors(vertices[self.triangulation.simplices])
+        self.total_error = int(np.sum(self.errors))
+        self.pending = None
+        self.evaluations += 1
+
+    @property
+    def vertices(self):
+        return self.triangulation.vertices
+
+    @property
+    def fitness(self):
+        ip = self.ea.image_processor
+        return self.total_error / (ip.width * ip.height)
+
+    def __get_errors(self, triangles: np.ndarray):
+        return self.ea.image_processor.get_triangle_errors(triangles)
+
+    def propose(self, gene: int, value: float):
+        ip = self.ea.image_processor
+        vertex = gene // 2
+        limit = ip.width if gene % 2 == 0 else ip.height
+        coordinate = int(np.clip(value, 0, limit))
+
+        if self.vertices[vertex, gene % 2] == coordinate:
+            self.pending = None
+            return self.fitness
+
+        vertices = self.vertices.copy()
+        vertices[vertex, gene % 2] = coordinate
+        if self.fitness_cache is None:
+            self.pending = self.__update(vertices)
+            self.evaluations += 1
+            return self.pending[-1] / (ip.width * ip.height)
+
+        key = FitnessCache.get_key(vertices)
+        fitness = self.fitness_cache.get(key)
+        if fitness is not None:
+            self.pending = (vertices,)
+            return fitness
+
+        self.pending = self.__update(vertices)
+        self.evaluations += 1
+        fitness = self.pending[-1] / (ip.width * ip.height)
+        self.fitness_cache.set(key, fitness)
+        return fitness
+
+    def __update(self, vertices: np.ndarray):
+        triangulation = Triangulation.update(self.triangulation, vertices, max_moved_rate=1)
+        changed = triangulation.changed
+        if changed is None: # Rebuilt with Qhull, every triangle is re-scored
+            errors = self.__get_errors(vertices[triangulation.simplices])
+            return triangulation, None, errors, int(np.sum(errors))
+
+        # Only the triangles around the moved vertex and the flipped ones change
+        errors = self.__get_errors(vertices[triangulation.simplices[changed]])
+        total_error = self.total_error - int(np.sum(self.errors[changed])) + int(np.sum(errors))
+        return triangulation, changed, errors, total_error
+
+    def accept(self):
+        if self.pending is not None and len(self.pending) == 1:
+            self.pending = self.__update(*self.pending)
+        if self.pending is not None:
+            self.triangulation, changed, errors, self.total_error = self.pending
+            if changed is None:
+                self.errors = errors
+            else:
+                self.errors[changed] = errors
+        self.pending = None
+
+    def undo(self):
+        self.pending = None
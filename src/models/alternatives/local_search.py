@@ -3,18 +3,23 @@ import random
 import numpy as np
 
 from src.models.evolutionary_algorithm.ea_methods import EA
+from src.models.alternatives.incremental_evaluator import IncrementalEvaluator
+from src.lib.fitness_cache import FitnessCache, DEFAULT_CACHE_SIZE
 
 GAUSSIAN_METHOD = 'gaussian'
 LOCAL_SEARCH_METHOD = 'local_search'
 
 class LocalSearchSolver:
-    def __init__(self, evolutionary_algorithm: EA, seed: str = 0):
+    def __init__(self, evolutionary_algorithm: EA, seed: str = 0,
+                 fitness_cache_size: int = DEFAULT_CACHE_SIZE):
         self.ea = evolutionary_algorithm
-        random.seed(seed)
-        pass
+        self.fitness_cache_size = fitness_cache_size
+        self.evaluations = 0 # Evaluations computed by the last solve
+        self.update_seed(seed)
 
     def update_seed(self, seed):
         random.seed(seed)
+        self.ea.update_seed(seed)
 
     def build_ea_module(self):
         self.ea.load_image()
@@ -22,7 +27,7 @@ class LocalSearchSolver:
     def __get_deltas(self, method: str, threshold: int):
         if method == GAUSSIAN_METHOD:
             gaussian_std = threshold
-            deltas = [np.random.normal(0, gaussian_std)]
+            deltas = [self.ea.rng.normal(0, gaussian_std)]
         elif method == LOCAL_SEARCH_METHOD:
             deltas = list(range(-threshold, threshold+1))
         else:
@@ -34,31 +39,36 @@ class LocalSearchSolver:
         ip = self.ea.image_processor
         max_x, max_y = ip.width-1, ip.height-1
         ind_size = ip.vertex_count * 2
-        edges = ip.edges_coordinates
-        min_individual = self.ea.init_coordinates(max_x, max_y, ind_size, edges)
-        min_eval, = self.ea.eval_individual(min_individual)
+        min_individual = self.ea.init_coordinates(max_x, max_y, ind_size, ip.edge_index)
+        min_individual = min_individual.astype(np.float64)
+        genes = min_individual.reshape(-1)
+        fitness_cache = FitnessCache(self.fitness_cache_size) if self.fitness_cache_size else None
+        evaluator = IncrementalEvaluator(self.ea, min_individual, fitness_cache)
+        min_eval = evaluator.fitness
 
         if verbose:
             initial_eval = min_eval
 
+        # Like Termination, max_evals only counts the fitness values actually
+        # computed (see IncrementalEvaluator.evaluations)
         i = 0
-        eval_count = 1
-        while i < max_iter and eval_count < max_evals:
+        while i < max_iter and evaluator.evaluations < max_evals:
             ind_gene = random.randint(0, ind_size-1)
             best_delta = 0
             deltas = self.__get_deltas(method, threshold)
             for delta in deltas:
                 limit = max_x if ind_gene % 2 == 0 else max_y
 
-                shifted_individual = min_individual[ind_gene] + delta
+                shifted_individual = genes[ind_gene] + delta
                 if not (0 <= shifted_individual <= limit) or delta==0: 
                     continue
+                if evaluator.evaluations >= max_evals:
+                    break
 
-                min_individual[ind_gene] += delta
-                eval_candidate, = self.ea.eval_individual(min_individual)
-                eval_count += 1
+                eval_candidate = evaluator.propose(ind_gene, shifted_individual)
                 
                 if eval_candidate < min_eval:
+                    evaluator.accept()
                     min_eval = eval_candidate
                     best_delta = delta
 
@@ -66,13 +76,14 @@ class LocalSearchSolver:
                         print("*"*75)
                         print(f'New best individual found at iteration {i}/{max_iter} with fitness {min_eval}')
                         print("*"*75, end='\n\n')
+                else:
+                    evaluator.undo()
 
-                min_individual[ind_gene] -= delta
-            min_individual[ind_gene] += best_delta 
+            genes[ind_gene] += best_delta 
 
             if verbose:
                 print(f'Iteration {i}/{max_iter} finished with fitness {min_eval}')
-                print(f'Current eval count: {eval_count}')
+                print(f'Current eval count: {evaluator.evaluations}')
                 print()
 
             i += 1
@@ -82,4 +93,5 @@ class LocalSearchSolver:
             print(f'Initial fitness: {initial_eval} - Final fitness: {min_eval}')
             print("#"*60, end='\n\n')
 
+        self.evaluations = evaluator.evaluations
         return min_individual, min_eval
\ No newline at end of file
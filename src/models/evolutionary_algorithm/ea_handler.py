@@ -1,10 +1,12 @@
 from src.models.evolutionary_algorithm.ea_methods import EA
 from src.lib.deap_config import DeapConfig
+from src.lib.island_model import IslandModel
 
 class EAHandler:
     def __init__(self, ea: EA, deap_c: DeapConfig):
         self.evolutionary_algorithm = ea
         self.deap_configurer = deap_c
+        self.logbook = None # Logbook of the last run
 
     def build_ea_module(self, verbose=True, show=False, **kwargs):
         self.evolutionary_algorithm.load_image(verbose=verbose, show=show)
@@ -15,22 +17,37 @@ class EAHandler:
         ip = self.evolutionary_algorithm.image_processor
         dc = self.deap_configurer
         width, height = ip.width, ip.height
-        edges_coordinates = ip.edges_coordinates
+        edge_index = ip.edge_index
         ind_size = ip.vertex_count * 2
         fitness_function = ea.eval_individual
+        population_fitness_function = ea.eval_population
         mutation_function = ea.mut_gaussian_coordinate
-        init_coordinates = lambda edge_rate: ea.init_coordinates(width-1, 
-                                                                 height-1, 
-                                                                 ind_size, 
-                                                                 edges_coordinates, 
-                                                                 edge_rate=edge_rate)
+        crossover_function = ea.cx_two_point
+        init_population = lambda size, edge_rate, sampling: ea.init_population(size,
+                                                                               width-1, 
+                                                                               height-1, 
+                                                                               ind_size, 
+                                                                               edge_index, 
+                                                                               edge_rate=edge_rate,
+                                                                               sampling=sampling)
 
-        dc.register_population(init_coordinates, ea.order_individual)
-        dc.register_operators(fitness_function, mutation_function, width-1, height-1)
+        dc.register_population(init_population, ea.order_individual)
+        dc.register_operators(fitness_function, mutation_function, crossover_function,
+                              width-1, height-1,
+                              population_fitness_function=population_fitness_function,
+                              population_mutation_function=ea.mut_gaussian_population,
+                              population_crossover_function=ea.cx_two_point_population,
+                              genotype_key_function=ea.get_genotype_key,
+                              resolution_function=ip.set_scale)
+        dc.register_checkpoint(ea.get_rng_state, ea.set_rng_state)
         dc.register_stats()
 
-        if dc.cpu_count > 1:
-            dc.register_parallelism() 
+        if dc.cpu_count > 1 and dc.islands < 2: # Each island uses a single process
+            dc.register_parallelism(evolutionary_algorithm=ea)
+
+        # Evaluations are only broken down when they run in this process
+        in_process = dc.cpu_count < 2 and dc.islands < 2
+        ea.profiler = dc.profiler if in_process else None
         
     def run(self, 
             image_added_callback=lambda *_: None, 
@@ -38,12 +55,21 @@ class EAHandler:
             show_res=False, 
             logs=False, 
             seed=0, 
-            save=True):
-        is_parallel = bool(self.deap_configurer.cpu_count > 1)
-        algorithm_output = self.deap_configurer.run_algorithm(image_added_callback=image_added_callback,
-                                                              stop_condition_callback=stop_condition_callback,
-                                                              parallel=is_parallel)
+            save=True,
+            resume=False):
+        if self.deap_configurer.islands > 1:
+            island_model = IslandModel(self.evolutionary_algorithm, self.deap_configurer)
+            algorithm_output = island_model.run(image_added_callback=image_added_callback,
+                                                stop_condition_callback=stop_condition_callback)
+        else:
+            is_parallel = bool(self.deap_configurer.cpu_count > 1)
+            algorithm_output = self.deap_configurer.run_algorithm(image_added_callback=image_added_callback,
+                                                                  stop_condition_callback=stop_condition_callback,
+                                                                  parallel=is_parallel,
+                                                                  resume=resume)
         population, log_info, hall_of_fame, best_fitnesses = algorithm_output
+        self.logbook = log_info
+        self.evolutionary_algorithm.image_processor.set_scale(1) # Results are saved at full resolution
 
         # Save files
         best_individual = population[0]
@@ -1,64 +1,226 @@
-import random
-
 import numpy as np
 
-from src.utils.image_processor import ImageProcessor
+from src.utils.image_processor import ImageProcessor, ANALYTIC_FITNESS
+from src.utils.triangulation import Triangulation
+from src.utils.edge_index import EdgeIndex
+from src.lib.individual import COORDINATE_DTYPE
+from src.lib.fitness_cache import FitnessCache
+from src.lib.profiler import get_timer, TRIANGULATION_STAGE, RASTERIZATION_STAGE
+
+UNIFORM_SAMPLING = 'uniform'
+STRATIFIED_SAMPLING = 'stratified'
+WEIGHTED_SAMPLING = 'weighted'
+INIT_SAMPLINGS = [UNIFORM_SAMPLING, STRATIFIED_SAMPLING, WEIGHTED_SAMPLING]
 
 class EA():
-    def __init__(self, image_processor: ImageProcessor):
+    def __init__(self, image_processor: ImageProcessor, seed=None):
         self.image_processor = image_processor
+        self.rng = np.random.default_rng(seed)
+
+        # Profiler of in-process evaluations (None when disabled)
+        self.profiler = None
+
+    def update_seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def get_rng_state(self):
+        return self.rng.bit_generator.state
+
+    def set_rng_state(self, state: dict):
+        self.rng.bit_generator.state = state
 
     def load_image(self, verbose=False, show=False):
         self.image_processor.read_image(verbose=verbose, show=show)
     
-    def init_coordinates(self, max_x, max_y, n, edges, edge_rate=0.5):
-        genotype = []
-        for _ in range(0, n, 2):
-            if edges and random.random() < edge_rate:
-                edge = random.choice(edges)
-                genotype.extend(edge)
-            else:
-                genotype.append(random.randint(0, max_x))
-                genotype.append(random.randint(0, max_y))
-        return genotype
+    def init_coordinates(self, max_x, max_y, n, edge_index: EdgeIndex = None,
+                         edge_rate=0.5, sampling=UNIFORM_SAMPLING):
+        return self.init_population(1, max_x, max_y, n, edge_index, edge_rate, sampling)[0]
+
+    def init_population(self, size, max_x, max_y, n, edge_index: EdgeIndex = None,
+                        edge_rate=0.5, sampling=UNIFORM_SAMPLING):
+        """
+        Returns the vertices of size individuals of n genes as a (size, n/2, 2)
+        array. Each vertex is an edge pixel with probability edge_rate and a
+        random pixel otherwise, sampled:
+        - uniform: uniformly.
+        - stratified: random pixels in distinct cells of a grid and edges
+          spread over the cells of the edge index.
+        - weighted: edges proportionally to their gradient magnitude.
+        """
+        vertex_count = (n + 1) // 2
+        if sampling == STRATIFIED_SAMPLING:
+            coordinates = self.__sample_stratified(size, vertex_count, max_x, max_y)
+        else:
+            coordinates = np.stack([self.rng.integers(0, max_x + 1, size=(size, vertex_count)),
+                                    self.rng.integers(0, max_y + 1, size=(size, vertex_count))], axis=2)
+        coordinates = coordinates.astype(COORDINATE_DTYPE)
+
+        if edge_index is None or len(edge_index) == 0:
+            return coordinates
+
+        is_edge = self.rng.random((size, vertex_count)) < edge_rate
+        if sampling == STRATIFIED_SAMPLING: # Stratified within each individual
+            for individual, individual_is_edge in zip(coordinates, is_edge):
+                edge_count = np.count_nonzero(individual_is_edge)
+                individual[individual_is_edge] = edge_index.sample_stratified(self.rng, edge_count)
+        elif sampling == WEIGHTED_SAMPLING:
+            coordinates[is_edge] = edge_index.sample_weighted(self.rng, np.count_nonzero(is_edge))
+        else:
+            coordinates[is_edge] = edge_index.sample(self.rng, np.count_nonzero(is_edge))
+        return coordinates
+
+    def __sample_stratified(self, size, vertex_count, max_x, max_y):
+        # One vertex per cell of a grid with at least vertex_count cells of the image's aspect ratio
+        width, height = max_x + 1, max_y + 1
+        grid_width = max(int(np.ceil(np.sqrt(vertex_count * width / height))), 1)
+        grid_height = max(int(np.ceil(vertex_count / grid_width)), 1)
+        cells = np.argsort(self.rng.random((size, grid_width * grid_height)), axis=1)[:, :vertex_count]
+
+        x = (cells % grid_width + self.rng.random(cells.shape)) * width / grid_width
+        y = (cells // grid_width + self.rng.random(cells.shape)) * height / grid_height
+        return np.stack([np.minimum(x.astype(np.int64), max_x),
+                         np.minimum(y.astype(np.int64), max_y)], axis=2)
 
     def order_individual(self, individual):
-        individual = list(zip(individual[0::2], individual[1::2]))
-        individual.sort(key=lambda x: (x[0], x[1]))
-        individual = [item for sublist in individual for item in sublist]
-        return individual
+        individual = np.asarray(individual).reshape(-1, 2)
+        order = np.lexsort((individual[:, 1], individual[:, 0]))
+        return individual[order]
 
     def get_vertices(self, individual):
-        width, height = self.image_processor.width, self.image_processor.height
-        individual[::2] = np.clip(individual[::2], 0, width)
-        individual[1::2] = np.clip(individual[1::2], 0, height)
-        individual = list(map(int, individual))
-        vertices = list(zip(individual[::2], individual[1::2]))
-        vertices.extend([(0,0), (0,height), (width,0), (width,height)]) #Always include the corners
-        return vertices
+        ip = self.image_processor
+        individual = np.asarray(individual).reshape(-1, 2)
+        np.clip(individual[:, 0], 0, ip.full_width, out=individual[:, 0])
+        np.clip(individual[:, 1], 0, ip.full_height, out=individual[:, 1])
+
+        vertices = individual
+        if ip.scale != 1: # Coordinates of the current resolution level
+            vertices = individual * ip.get_level_factors()
+        vertices = vertices.astype(np.int64)
+        width, height = ip.width, ip.height
+        corners = np.array([(0,0), (0,height), (width,0), (width,height)]) #Always include the corners
+        return np.concatenate([vertices, corners])
+
+    def get_genotype_key(self, individual):
+        return FitnessCache.get_key(self.get_vertices(individual))
+
+    def get_triangulation(self, individual, vertices):
+        # Offspring inherit the triangulation of their parent when cloned
+        parent_triangulation = getattr(individual, "triangulation", None)
+        triangulation = Triangulation.update(parent_triangulation, vertices)
+        if hasattr(individual, "__dict__"):
+            individual.triangulation = triangulation
+        return triangulation
 
     def decode(self, individual):
         vertices = self.get_vertices(individual)
-        polygonal_image = self.image_processor.create_polygonal_image(vertices)
+        triangulation = self.get_triangulation(individual, vertices)
+        polygonal_image = self.image_processor.create_polygonal_image(vertices, triangulation)
         return polygonal_image
 
+    def encode_geometry(self, individual):
+        vertices = self.get_vertices(individual)
+        triangulation = self.get_triangulation(individual, vertices)
+        return self.image_processor.encode_geometry(vertices, triangulation)
+
     def get_fitness(self, decoded_individual):
-        individual_image_matrix = np.asarray(decoded_individual, dtype=np.uint64)
-        original_image_matrix = self.image_processor.original_image_matrix
-        diff = individual_image_matrix - original_image_matrix
-        squared_diff = np.sum(diff**2, dtype=np.uint64)
+        squared_diff = self.image_processor.error_kernel.get_squared_error(decoded_individual)
         w, h = self.image_processor.width, self.image_processor.height
         return squared_diff / (w * h)
 
+    def is_analytic(self):
+        ip = self.image_processor
+        return ip.fitness_mode == ANALYTIC_FITNESS and ip.triangle_outline is None
+
     def eval_individual(self, individual):
+        if self.is_analytic():
+            return float(self.eval_population([individual])[0]),
+
         decoded_individual = self.decode(individual)
         fit = self.get_fitness(decoded_individual)
         return fit, # Fitness should be inside a tuple
 
+    def get_population_fitness(self, decoded_population: np.ndarray):
+        squared_diff = self.image_processor.error_kernel.get_population_squared_error(decoded_population)
+        w, h = self.image_processor.width, self.image_processor.height
+        return squared_diff / (w * h)
+
+    def eval_population(self, individuals: list):
+        """
+        Evaluates a whole population in one pass, from the pixel statistics
+        of its triangles or rasterizing every individual into a shared buffer
+        (render fitness mode). Returns an array of fitness values.
+        """
+        if len(individuals) == 0:
+            return np.empty(0)
+
+        # Outlines are drawn by PIL over each image
+        if self.image_processor.triangle_outline is not None:
+            return np.array([self.eval_individual(ind)[0] for ind in individuals])
+
+        with get_timer(self.profiler, TRIANGULATION_STAGE):
+            vertices = [self.get_vertices(ind) for ind in individuals]
+            triangulations = [self.get_triangulation(ind, v) for ind, v in zip(individuals, vertices)]
+
+        # Individuals are evaluated in batches of bounded memory
+        with get_timer(self.profiler, RASTERIZATION_STAGE):
+            batch_size = self.image_processor.get_batch_size()
+            return np.concatenate([self.__eval_batch(vertices[i:i + batch_size], triangulations[i:i + batch_size])
+                                   for i in range(0, len(individuals), batch_size)])
+
+    def __eval_batch(self, vertices: list, triangulations: list):
+        if self.is_analytic(): # No image is rendered
+            squared_diff = self.image_processor.get_squared_errors(vertices, triangulations)
+            w, h = self.image_processor.width, self.image_processor.height
+            return squared_diff / (w * h)
+
+        decoded_population = self.image_processor.create_polygonal_matrices(vertices, triangulations)
+        return self.get_population_fitness(decoded_population)
+
     def mut_gaussian_coordinate(self, individual, sigma_x, sigma_y, indpb=0.2):
-        size = len(individual)
-        for i in range(0,size,2):
-            if random.random() < indpb:
-                individual[i] += random.gauss(0, sigma_x)
-                individual[i+1] += random.gauss(0, sigma_y)
-        return individual,
\ No newline at end of file
+        self.mut_gaussian_population([individual], sigma_x, sigma_y, indpb=indpb)
+        return individual,
+
+    def mut_gaussian_population(self, individuals: list, sigma_x, sigma_y, indpb=0.2):
+        """
+        Gaussian mutation of every individual at once: the mutation mask and
+        the noise of all the vertices are drawn in a single call each.
+        """
+        if len(individuals) == 0:
+            return individuals
+
+        sizes = [len(ind) for ind in individuals]
+        mutated = self.rng.random(sum(sizes)) < indpb
+        noise = np.zeros((len(mutated), 2))
+        noise[mutated] = self.rng.normal(0, (sigma_x, sigma_y), size=(np.count_nonzero(mutated), 2))
+
+        offsets = np.cumsum(sizes) - sizes
+        for ind, offset, size in zip(individuals, offsets, sizes):
+            ind += noise[offset:offset+size].astype(ind.dtype)
+        return individuals
+
+    def cx_two_point(self, ind1, ind2):
+        self.cx_two_point_population([(ind1, ind2)])
+        return ind1, ind2
+
+    def cx_two_point_population(self, pairs: list):
+        """
+        Two point crossover over whole vertices (never splits x from y).
+        The crossover points of every pair are drawn in a single call.
+        Pairs of single-vertex individuals have no crossover points and are
+        left unchanged.
+        """
+        crossed_pairs = [(ind1, ind2) for ind1, ind2 in pairs if min(len(ind1), len(ind2)) >= 2]
+        if len(crossed_pairs) == 0:
+            return pairs
+
+        sizes = np.array([min(len(ind1), len(ind2)) for ind1, ind2 in crossed_pairs])
+        cxpoints1 = self.rng.integers(1, sizes + 1)
+        cxpoints2 = self.rng.integers(1, sizes)
+        cxpoints2 = np.where(cxpoints2 >= cxpoints1, cxpoints2 + 1, cxpoints2)
+        starts, ends = np.minimum(cxpoints1, cxpoints2), np.maximum(cxpoints1, cxpoints2)
+
+        for (ind1, ind2), start, end in zip(crossed_pairs, starts, ends):
+            segment = ind1[start:end].copy()
+            ind1[start:end] = ind2[start:end]
+            ind2[start:end] = segment
+        return pairs
@@ -14,8 +14,18 @@ class ArgumentChecker:
             raise Exception("Vertex count must be greater than 4")
         if args["cpu_count"] < 1:
             raise Exception("CPU count must be greater than 0")
+        if args["improvement_window"] < 0:
+            raise Exception("Improvement window must be greater or equal than 0")
+        if args["min_improvement"] < 0 or args["min_improvement"] >= 1:
+            raise Exception("Min improvement must be between 0 and 1")
+        if args["max_seconds"] < 0:
+            raise Exception("Max seconds must be greater or equal than 0")
+        if args["max_evals"] < 0:
+            raise Exception("Max evals must be greater or equal than 0")
         if args["edge_rate"] < 0 or args["edge_rate"] > 1:
             raise Exception("Edge rate must be between 0 and 1")
+        if args["render_best"] != 0 and args["render_best"] != 1:
+            raise Exception("render_best is a boolean value")
         if args["manual_console"] != 0 and args["manual_console"] != 1:
             raise Exception("manual_console is a boolean value")
         if args["verbose"] != 0 and args["verbose"] != 1:
@@ -0,0 +1,65 @@
+import numpy as np
+
+DEFAULT_CELL_SIZE = 16 # Pixels per side of the grid cells edges are bucketed in
+
+class EdgeIndex():
+    """
+    Edge pixels of an image as an (E, 2) int32 array of x, y coordinates,
+    bucketed by the cells of a regular grid (CSR layout: the edges of cell
+    c are coordinates[cell_starts[c]:cell_starts[c+1]]).
+
+    Edges can be sampled uniformly, weighted by their gradient magnitude or
+    stratified over the non-empty cells, so that vertices are spread over
+    every edge region instead of following the densest ones.
+    """
+    def __init__(self, coordinates: np.ndarray, strengths: np.ndarray = None,
+                 cell_size=DEFAULT_CELL_SIZE):
+        coordinates = np.asarray(coordinates, dtype=np.int32).reshape(-1, 2)
+        self.cell_size = cell_size
+        self.grid_width = int(coordinates[:, 0].max()) // cell_size + 1 if len(coordinates) > 0 else 0
+
+        cells = self.get_cells(coordinates)
+        order = np.argsort(cells, kind="stable")
+        self.coordinates = coordinates[order]
+        self.strengths = None if strengths is None else np.asarray(strengths, dtype=np.float32)[order]
+
+        cell_counts = np.bincount(cells, minlength=1) if len(cells) > 0 else np.zeros(0, dtype=np.int64)
+        self.cells = np.flatnonzero(cell_counts) # Non-empty cells
+        self.cell_starts = np.zeros(len(cell_counts) + 1, dtype=np.int64)
+        np.cumsum(cell_counts, out=self.cell_starts[1:])
+
+        # Cumulative gradient magnitudes for weighted sampling
+        self.cumulative_strengths = None
+        if self.strengths is not None and len(self.strengths) > 0 and np.sum(self.strengths) > 0:
+            self.cumulative_strengths = np.cumsum(self.strengths, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def get_cells(self, coordinates: np.ndarray):
+        cells = coordinates // self.cell_size
+        return cells[:, 1].astype(np.int64) * self.grid_width + cells[:, 0]
+
+    def get_cell_edges(self, cell: int):
+        return self.coordinates[self.cell_starts[cell]:self.cell_starts[cell + 1]]
+
+    def sample(self, rng: np.random.Generator, n: int):
+        return self.coordinates[rng.integers(0, len(self.coordinates), size=n)]
+
+    def sample_weighted(self, rng: np.random.Generator, n: int):
+        # Strong edges are more likely (uniform without gradient magnitudes)
+        if self.cumulative_strengths is None:
+            return self.sample(rng, n)
+        thresholds = rng.random(n) * self.cumulative_strengths[-1]
+        indices = np.searchsorted(self.cumulative_strengths, thresholds, side="right")
+        return self.coordinates[np.minimum(indices, len(self.coordinates) - 1)]
+
+    def sample_stratified(self, rng: np.random.Generator, n: int):
+        # Every non-empty cell gets n // cells samples and the rest go to random cells
+        repeats, remainder = divmod(n, len(self.cells))
+        cells = np.concatenate([np.repeat(self.cells, repeats),
+                                rng.choice(self.cells, size=remainder, replace=False)])
+        starts = self.cell_starts[cells]
+        counts = self.cell_starts[cells + 1] - starts
+        indices = starts + (rng.random(n) * counts).astype(np.int64)
+        return self.coordinates[rng.permutation(indices)]
@@ -0,0 +1,37 @@
+import numpy as np
+
+class ErrorKernel():
+    """
+    Squared error between uint8 images and the original image.
+
+    Differences are computed in int16 and squared into int32 scratch buffers
+    allocated once per image size, so an evaluation only reads the uint8
+    images instead of allocating several 64-bit copies of them. Sums are
+    accumulated in int64.
+    """
+    def __init__(self, original_image_matrix: np.ndarray):
+        self.original_image_matrix = np.ascontiguousarray(original_image_matrix, dtype=np.uint8)
+        self.diff = np.empty(self.original_image_matrix.shape, dtype=np.int16)
+        self.squared_diff = np.empty(self.original_image_matrix.shape, dtype=np.int32)
+
+    def get_squared_error(self, image_matrix: np.ndarray, per_channel=False):
+        """
+        Returns the sum of the squared errors of an (H, W, 3) image, or its
+        (3,) per channel breakdown.
+        """
+        image_matrix = np.asarray(image_matrix, dtype=np.uint8)
+        np.subtract(image_matrix, self.original_image_matrix, out=self.diff, dtype=np.int16)
+        np.multiply(self.diff, self.diff, out=self.squared_diff, dtype=np.int32)
+
+        if per_channel:
+            channels = self.squared_diff.shape[-1]
+            return np.sum(self.squared_diff.reshape(-1, channels), axis=0, dtype=np.int64)
+        return int(np.sum(self.squared_diff, dtype=np.int64))
+
+    def get_population_squared_error(self, image_matrices: np.ndarray, per_channel=False):
+        """
+        Returns the squared error of each image of an (N, H, W, 3) batch as
+        an (N,) array, or (N, 3) per channel.
+        """
+        errors = [self.get_squared_error(image_matrix, per_channel) for image_matrix in image_matrices]
+        return np.array(errors, dtype=np.int64).reshape(len(errors), *((-1,) if per_channel else ()))
@@ -3,10 +3,20 @@ import io
 import base64
 
 from PIL import Image, ImageDraw
-from scipy.spatial import Delaunay
 import numpy as np
 import cv2
 
+from src.utils.rasterizer import Rasterizer
+from src.utils.error_kernel import ErrorKernel
+from src.utils.triangulation import Triangulation
+from src.utils.edge_index import EdgeIndex
+from src.utils.preprocessing_cache import PreprocessingCache
+
+RENDER_FITNESS = 'render'
+ANALYTIC_FITNESS = 'analytic'
+FITNESS_MODES = [ANALYTIC_FITNESS, RENDER_FITNESS]
+BATCH_PIXELS = 1 << 22 # Pixels of the individuals evaluated at once (bounds the rendering buffers)
+
 class ImageProcessor():
     def __init__(self, input_name=None, 
                  vertex_count: int = None, 
@@ -14,7 +24,9 @@ class ImageProcessor():
                  output_path=os.path.join('results', 'experiments', 'formal', 'images'), 
                  output_name="delaunay.jpg",
                  width=None, height=None, tri_outline=None,
-                 input_image: Image.Image=None, **kwargs):
+                 fitness_mode=ANALYTIC_FITNESS,
+                 input_image: Image.Image=None, 
+                 preprocessing_cache: PreprocessingCache = None, **kwargs):
 
         # Image parameters
         self.input_path = input_path
@@ -33,16 +45,53 @@ class ImageProcessor():
         self.vertex_count = vertex_count
         self.triangle_outline = tri_outline
 
+        # Fitness computed from the pixel statistics of the triangles (analytic)
+        # or by rendering and diffing whole images (render). Outlines are only
+        # taken into account by rendering. Both modes give the same values, but
+        # not those of PIL's ImageDraw.polygon used in the article: pixels are
+        # sampled at their centers (borders are not filled twice) and triangles
+        # are painted with their mean color instead of their centroid's
+        self.fitness_mode = fitness_mode
+
         # Matrix of the original image
         self.original_image_matrix = None
+        self.error_kernel = None
+
+        # (H, W+1, 3) prefix sums of the original image along each row, with a
+        # leading zero column: the pixels x0 <= x < x1 of row y add up to
+        # integral_image[y, x1] - integral_image[y, x0]. integral_squares
+        # (H, W+1) holds the prefix sums of the squared channels of each pixel
+        self.integral_image = None
+        self.integral_squares = None
+
+        # Multi-resolution evaluation: original_image_matrix may be a downsampled
+        # copy of full_resolution_matrix (width and height are those of the copy)
+        self.full_resolution_matrix = None
+        self.full_width = None
+        self.full_height = None
+        self.scale = 1
 
-        # Edge detection
+        # Edge detection: (E, 2) int32 array of x, y coordinates, (E,) gradient
+        # magnitudes and the index initial vertices are sampled from
         self.edges_coordinates = None
+        self.edges_strengths = None
+        self.edge_index = None
+
+        # Tuned images, vertex counts and edges of previous runs
+        self.preprocessing_cache = preprocessing_cache
+
+        # Triangle rasterization (depends on the final image dimensions)
+        self.rasterizer = None
 
     def __edge_detection(self, image, show=False):
-        edges_mask = cv2.Canny(np.array(image), 100, 200)
-        self.edges_coordinates = list(np.argwhere(edges_mask > 0))
-        self.edges_coordinates = [tuple(reversed(x)) for x in self.edges_coordinates]
+        image = np.array(image)
+        edges_mask = cv2.Canny(image, 100, 200)
+        self.edges_coordinates = np.argwhere(edges_mask > 0)[:, ::-1].astype(np.int32)
+
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        gradient_x = cv2.Sobel(gray, cv2.CV_32F, 1, 0)[edges_mask > 0]
+        gradient_y = cv2.Sobel(gray, cv2.CV_32F, 0, 1)[edges_mask > 0]
+        self.edges_strengths = np.hypot(gradient_x, gradient_y)
         
         if show:
             cv2.imshow("Edge detection", edges_mask)
@@ -87,13 +136,39 @@ class ImageProcessor():
             image = Image.open(self.img_in_dir)
         image = image.convert("RGB")
 
-        image = self.__tune_image(image, denoise, edge_detection, show=show)
-        self.width, self.height = image.size
-        self.original_image_matrix = np.asarray(image, dtype=np.uint64)
+        cache_key, entry = None, None
+        if self.preprocessing_cache is not None:
+            cache_key = PreprocessingCache.get_key(np.asarray(image), self.width, self.height,
+                                                   denoise, edge_detection)
+            entry = self.preprocessing_cache.get(cache_key)
+
+        if entry is None:
+            image = self.__tune_image(image, denoise, edge_detection, show=show)
+            entry = {"image": np.asarray(image, dtype=np.uint8),
+                     "vertex_count": None,
+                     "entropy": None, # Only computed when the vertex count is derived from it
+                     "edges": self.edges_coordinates,
+                     "edge_strengths": self.edges_strengths}
+            if self.vertex_count is None:
+                self.__set_entropy(entry, image)
+            if self.preprocessing_cache is not None:
+                self.preprocessing_cache.set(cache_key, entry)
+        else:
+            image = Image.fromarray(entry["image"])
+            self.edges_coordinates = entry["edges"]
+            self.edges_strengths = entry["edge_strengths"]
+            if self.vertex_count is None and entry["entropy"] is None: # Cached with a given vertex count
+                entry = {**entry}
+                self.__set_entropy(entry, image)
+                if self.preprocessing_cache is not None:
+                    self.preprocessing_cache.set(cache_key, entry)
+        self.load_matrix(entry["image"])
+        if self.edges_coordinates is not None:
+            self.edge_index = EdgeIndex(self.edges_coordinates, self.edges_strengths)
 
         if self.vertex_count is None:
-            image_entropy = image.entropy()
-            self.vertex_count = max(int(np.power(2, image_entropy+3)), 5) # 5 is the minimum number of vertices
+            image_entropy = entry["entropy"]
+            self.vertex_count = entry["vertex_count"]
 
             if verbose:
                 print(f"Image entropy: {image_entropy}")
@@ -104,18 +179,174 @@ class ImageProcessor():
         if show:
             image.show("Preprocessed image")
 
-    def create_polygonal_image(self, vertices):
-        w, h = self.width, self.height
-        im = Image.new('RGB', (w, h))
-        draw = ImageDraw.Draw(im)
-        tri = Delaunay(vertices)
-        triangles = tri.simplices
-        for t in triangles:
-            triangle = [tuple(vertices[t[i]]) for i in range(3)]
-            vertices_centroid = np.mean(np.array(triangle), axis=0, dtype=int)
-            color = tuple(self.original_image_matrix[vertices_centroid[1], 
-                                                     vertices_centroid[0]])
-            draw.polygon(triangle, fill=color, outline=self.triangle_outline)
+    @staticmethod
+    def __set_entropy(entry: dict, image: Image.Image):
+        image_entropy = image.entropy()
+        entry["entropy"] = image_entropy
+        entry["vertex_count"] = max(int(np.power(2, image_entropy+3)), 5) # 5 is the minimum number of vertices
+
+    def load_matrix(self, original_image_matrix: np.ndarray):
+        self.full_resolution_matrix = original_image_matrix
+        self.full_height, self.full_width = original_image_matrix.shape[:2]
+        self.scale = 1
+        self.__load_level(original_image_matrix)
+
+    def __load_level(self, original_image_matrix: np.ndarray):
+        self.height, self.width = original_image_matrix.shape[:2]
+        self.original_image_matrix = original_image_matrix
+        self.rasterizer = Rasterizer(self.width, self.height)
+        self.error_kernel = ErrorKernel(original_image_matrix)
+        self.integral_image = np.zeros((self.height, self.width + 1, 3), dtype=np.int32)
+        np.cumsum(original_image_matrix, axis=1, dtype=np.int32, out=self.integral_image[:, 1:])
+        self.integral_squares = np.zeros((self.height, self.width + 1), dtype=np.int64)
+        squares = np.sum(np.square(original_image_matrix, dtype=np.int32), axis=2, dtype=np.int64)
+        np.cumsum(squares, axis=1, out=self.integral_squares[:, 1:])
+
+    def set_scale(self, scale: float):
+        """
+        Evaluates individuals against the original image downsampled by scale
+        (1 is full resolution). Vertices are still full resolution coordinates.
+        """
+        if scale == self.scale:
+            return
+
+        matrix = self.full_resolution_matrix
+        if scale != 1:
+            width = max(int(round(self.full_width * scale)), 1)
+            height = max(int(round(self.full_height * scale)), 1)
+            matrix = cv2.resize(np.ascontiguousarray(matrix), (width, height), interpolation=cv2.INTER_AREA)
+        self.scale = scale
+        self.__load_level(matrix)
+
+    def get_level_factors(self):
+        # Factors that map full resolution coordinates to the current level
+        return self.width / self.full_width, self.height / self.full_height
+
+    def get_batch_size(self):
+        # Individuals whose (N, H, W) buffers fit in BATCH_PIXELS
+        return max(BATCH_PIXELS // (self.width * self.height), 1)
+
+    def get_triangles(self, vertices, triangulation: Triangulation = None):
+        if triangulation is None:
+            triangulation = Triangulation.build(vertices)
+        return triangulation.vertices[triangulation.simplices]
+
+    def __get_triangle_moments(self, triangles: np.ndarray, spans: tuple = None):
+        """
+        Returns a (T, 5) int64 array with the color sums (3), pixel count and
+        sum of squared channels of the pixels covered by each triangle.
+        Triangles are summed scanline by scanline with the integral images,
+        so the cost depends on the rows they cross instead of their area.
+        """
+        if spans is None:
+            spans = self.rasterizer.get_spans(triangles)
+        triangle_ids, rows, starts, ends = spans
+
+        integral_image = self.integral_image.reshape(-1, 3)
+        integral_squares = self.integral_squares.reshape(-1)
+        starts, ends = rows * (self.width + 1) + starts, rows * (self.width + 1) + ends
+        span_moments = np.zeros((len(rows) + 1, 5), dtype=np.int64)
+        np.subtract(np.take(integral_image, ends, axis=0), np.take(integral_image, starts, axis=0),
+                    out=span_moments[1:, :3])
+        np.subtract(ends, starts, out=span_moments[1:, 3])
+        np.subtract(np.take(integral_squares, ends), np.take(integral_squares, starts),
+                    out=span_moments[1:, 4])
+
+        # Spans are grouped by triangle: totals are differences of their cumulative sums
+        np.cumsum(span_moments, axis=0, out=span_moments)
+        bounds = np.zeros(len(triangles) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(triangle_ids, minlength=len(triangles)), out=bounds[1:])
+        return span_moments[bounds[1:]] - span_moments[bounds[:-1]]
+
+    def __get_colors(self, triangles: np.ndarray, moments: np.ndarray):
+        sums, areas = moments[:, :3], moments[:, 3:4]
+        colors = ((sums + areas // 2) // np.maximum(areas, 1)).astype(np.uint8)
+        uncovered = areas[:, 0] == 0
+        if np.any(uncovered): # Triangles without pixels take the color at their centroid
+            colors[uncovered] = self.__get_centroid_colors(triangles[uncovered])
+        return colors
+
+    def get_triangle_colors(self, triangles: np.ndarray, spans: tuple = None):
+        """
+        Mean color of the pixels covered by each triangle. spans may be given
+        if they were already computed by the rasterizer.
+        """
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3, 2)
+        return self.__get_colors(triangles, self.__get_triangle_moments(triangles, spans))
+
+    def get_triangle_errors(self, triangles: np.ndarray, spans: tuple = None):
+        """
+        Squared error of the pixels covered by each triangle when painted with
+        its color, sum((x - c)^2) = sum(x^2) - 2 c sum(x) + n c^2, without
+        rendering it.
+        """
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3, 2)
+        moments = self.__get_triangle_moments(triangles, spans)
+        colors = self.__get_colors(triangles, moments).astype(np.int64)
+        sums, areas, squares = moments[:, :3], moments[:, 3], moments[:, 4]
+        return squares - np.sum(colors * (2 * sums - areas[:, None] * colors), axis=1)
+
+    def get_squared_errors(self, vertices_batch: list, triangulations: list = None):
+        """
+        Squared error of each individual of a batch as an (N,) int64 array,
+        computed from the triangles' moments instead of rendering them (same
+        values as the error kernel over create_polygonal_matrices).
+        """
+        if triangulations is None:
+            triangulations = [None] * len(vertices_batch)
+        triangles_batch = [self.get_triangles(vertices, triangulation) 
+                           for vertices, triangulation in zip(vertices_batch, triangulations)]
+        if len(triangles_batch) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        # Pixels outside every triangle are black: their error is their sum of squares
+        triangles = np.concatenate([np.asarray(t).reshape(-1, 3, 2) for t in triangles_batch])
+        moments = self.__get_triangle_moments(triangles)
+        colors = self.__get_colors(triangles, moments).astype(np.int64)
+        sums, areas = moments[:, :3], moments[:, 3]
+        triangle_errors = -np.sum(colors * (2 * sums - areas[:, None] * colors), axis=1)
+
+        cumulative_errors = np.concatenate([[0], np.cumsum(triangle_errors)])
+        bounds = np.concatenate([[0], np.cumsum([len(triangles) for triangles in triangles_batch])])
+        errors = cumulative_errors[bounds[1:]] - cumulative_errors[bounds[:-1]]
+        return errors + int(self.integral_squares[:, -1].sum())
+
+    def __get_centroid_colors(self, triangles: np.ndarray):
+        # Color of the pixel at the (truncated) centroid of each triangle
+        centroids = np.sum(triangles, axis=1) // 3
+        centroids_x = np.clip(centroids[:, 0], 0, self.width - 1)
+        centroids_y = np.clip(centroids[:, 1], 0, self.height - 1)
+        return self.original_image_matrix[centroids_y, centroids_x]
+
+    def create_polygonal_matrices(self, vertices_batch: list, triangulations: list = None):
+        """
+        Renders a batch of individuals at once into an (N, H, W, 3) uint8 array
+        (see get_batch_size for batches of bounded memory).
+        """
+        if triangulations is None:
+            triangulations = [None] * len(vertices_batch)
+        triangles_batch = [self.get_triangles(vertices, triangulation) 
+                           for vertices, triangulation in zip(vertices_batch, triangulations)]
+        if len(triangles_batch) == 0:
+            return np.zeros((0, self.height, self.width, 3), dtype=np.uint8)
+
+        # Spans are shared by the labeling and the colors of the triangles
+        triangles = np.concatenate([np.asarray(t).reshape(-1, 3, 2) for t in triangles_batch])
+        spans = self.rasterizer.get_spans(triangles)
+        labels = self.rasterizer.label(triangles_batch, spans=spans)
+
+        colors = np.zeros((len(triangles) + 1, 3), dtype=np.uint8) # Uncovered pixels are black
+        colors[:-1] = self.get_triangle_colors(triangles, spans)
+        return colors[labels]
+
+    def create_polygonal_image(self, vertices, triangulation: Triangulation = None):
+        polygonal_matrix = self.create_polygonal_matrices([vertices], [triangulation])[0]
+        im = Image.fromarray(polygonal_matrix, 'RGB')
+
+        if self.triangle_outline is not None:
+            draw = ImageDraw.Draw(im)
+            for triangle in self.get_triangles(vertices, triangulation):
+                draw.polygon([tuple(v) for v in triangle], outline=self.triangle_outline)
         return im
     
     @staticmethod
@@ -126,6 +357,28 @@ class ImageProcessor():
         image_base64 = base64.b64encode(image_bytes).decode('utf-8')
         return image_base64
 
+    def encode_geometry(self, vertices, triangulation: Triangulation = None):
+        """
+        Compact alternative to encode_image: vertices (uint16), triangle vertex
+        indices (uint16, uint32 for huge individuals) and triangle colors
+        (uint8) as little endian base64 strings, to be rendered by the client.
+        """
+        if triangulation is None:
+            triangulation = Triangulation.build(vertices)
+        index_dtype = np.dtype('<u2') if len(triangulation.vertices) <= np.iinfo(np.uint16).max else np.dtype('<u4')
+        colors = self.get_triangle_colors(triangulation.vertices[triangulation.simplices])
+        return {"width": self.width,
+                "height": self.height,
+                "index_bytes": index_dtype.itemsize,
+                "vertices": self.__encode_array(triangulation.vertices, np.dtype('<u2')),
+                "triangles": self.__encode_array(triangulation.simplices, index_dtype),
+                "colors": self.__encode_array(colors, np.dtype(np.uint8))}
+
+    @staticmethod
+    def __encode_array(array: np.ndarray, dtype: np.dtype):
+        array_bytes = np.ascontiguousarray(array, dtype=dtype).tobytes()
+        return base64.b64encode(array_bytes).decode('utf-8')
+
     @staticmethod
     def decode_image(image_data: str, base64_=False):
         if base64_:
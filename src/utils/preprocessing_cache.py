@@ -0,0 +1,135 @@
+import io
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_DIR = os.path.join("data", "outputs", "preprocessing_cache")
+DEFAULT_MEMORY_ENTRIES = 8
+DEFAULT_DISK_BYTES = 512 * 1024 * 1024
+
+class PreprocessingCache:
+    """
+    Results of ImageProcessor.read_image (tuned image, entropy and the vertex
+    count derived from it, None if the image was read with a given vertex
+    count, edge coordinates as an (E, 2) int32 array of x, y and their (E,)
+    gradient magnitudes) keyed by the pixels of the input image and the
+    preprocessing parameters.
+
+    Entries are kept in memory (LRU, max_memory_entries) and on disk as
+    .npz files (least recently used files are evicted above max_disk_bytes).
+    cache_dir=None only keeps the entries in memory.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def get_key(image: np.ndarray, width=None, height=None, denoise=True, edge_detection=True):
+        image = np.ascontiguousarray(image)
+        key = hashlib.blake2b(image.tobytes(), digest_size=20)
+        parameters = {"shape": image.shape, "width": width, "height": height,
+                      "denoise": denoise, "edge_detection": edge_detection}
+        key.update(json.dumps(parameters, sort_keys=True).encode("utf-8"))
+        return key.hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns {"image", "vertex_count", "entropy", "edges", "edge_strengths"} or None.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        entry = self.__read(key)
+        if entry is not None:
+            self.__set_memory_entry(key, entry)
+        return entry
+
+    def set(self, key: str, entry: dict):
+        self.__set_memory_entry(key, entry)
+        self.__write(key, entry)
+
+    def invalidate(self, key: str = None):
+        """
+        Removes one entry (or every entry when key is None).
+        """
+        keys = [key] if key is not None else list(self.entries) + [path[:-len(".npz")] for path in self.__get_files()]
+        for key in keys:
+            self.entries.pop(key, None)
+            if self.cache_dir is not None and os.path.isfile(self.__get_path(key)):
+                os.remove(self.__get_path(key))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __set_memory_entry(self, key: str, entry: dict):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_memory_entries:
+            self.entries.popitem(last=False)
+
+    def __get_path(self, key: str):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def __get_files(self):
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return []
+        return [file_name for file_name in os.listdir(self.cache_dir) if file_name.endswith(".npz")]
+
+    def __read(self, key: str):
+        if self.cache_dir is None or not os.path.isfile(self.__get_path(key)):
+            return None
+
+        path = self.__get_path(key)
+        try:
+            with np.load(path) as arrays:
+                entropy = float(arrays["entropy"]) # NaN when it was not computed
+                entry = {"image": arrays["image"],
+                         "vertex_count": None if np.isnan(entropy) else int(arrays["vertex_count"]),
+                         "entropy": None if np.isnan(entropy) else entropy,
+                         "edges": arrays["edges"] if arrays["has_edges"] else None,
+                         "edge_strengths": arrays["edge_strengths"] if "edge_strengths" in arrays.files else None}
+            os.utime(path) # Recently used files are evicted last
+        except FileNotFoundError: # Evicted by another process
+            return None
+        return entry
+
+    def __write(self, key: str, entry: dict):
+        if self.cache_dir is None:
+            return
+
+        edges = entry["edges"] if entry["edges"] is not None else np.empty((0, 2), dtype=np.int32)
+        strengths = {} if entry.get("edge_strengths") is None else {"edge_strengths": entry["edge_strengths"]}
+        entry_bytes = io.BytesIO()
+        entropy = {"vertex_count": -1, "entropy": np.nan} if entry["entropy"] is None else \
+                  {"vertex_count": entry["vertex_count"], "entropy": entry["entropy"]}
+        np.savez_compressed(entry_bytes, image=entry["image"], **entropy,
+                            edges=edges, has_edges=entry["edges"] is not None,
+                            **strengths)
+
+        # Written atomically: concurrent readers never see a partial file
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.__get_path(key)
+        with open(path + f".{os.getpid()}.tmp", "wb") as entry_file:
+            entry_file.write(entry_bytes.getvalue())
+        os.replace(path + f".{os.getpid()}.tmp", path)
+        self.__evict()
+
+    def __evict(self):
+        paths = [os.path.join(self.cache_dir, file_name) for file_name in self.__get_files()]
+        try:
+            files = sorted((os.path.getmtime(path), os.path.getsize(path), path) for path in paths)
+            total_bytes = sum(size for _, size, _ in files)
+            for _, size, path in files[:-1]: # The newest entry is kept
+                if total_bytes <= self.max_disk_bytes:
+                    return
+                total_bytes -= size
+                os.remove(path)
+        except FileNotFoundError: # Evicted by another process
+            return
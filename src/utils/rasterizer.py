@@ -0,0 +1,100 @@
+import numpy as np
+
+class Rasterizer():
+    """
+    Vectorized scanline rasterizer for triangulations.
+
+    Pixel (x, y) is sampled at its center (x + 0.5, y + 0.5) and spans are
+    half-open ([left, right) and [top, bottom)), so every pixel inside a
+    triangulation of the image rectangle is covered by exactly one triangle.
+    """
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+
+    def get_spans(self, triangles: np.ndarray):
+        """
+        triangles: (T, 3, 2) integer array of vertex coordinates.
+
+        Returns (triangle_ids, rows, starts, ends) with one entry per
+        scanline crossed by each triangle. Pixels starts <= x < ends belong
+        to the triangle in that row (the span may be empty).
+        """
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3, 2)
+
+        # Sort the vertices of each triangle by y: a (top), b (middle), c (bottom)
+        order = np.argsort(triangles[:, :, 1], axis=1, kind="stable")
+        sorted_triangles = np.take_along_axis(triangles, order[:, :, None], axis=1)
+        ax, ay = sorted_triangles[:, 0, 0], sorted_triangles[:, 0, 1]
+        bx, by = sorted_triangles[:, 1, 0], sorted_triangles[:, 1, 1]
+        cx, cy = sorted_triangles[:, 2, 0], sorted_triangles[:, 2, 1]
+
+        # Inverse slopes are always computed from the upper endpoint,
+        # so edges shared by two triangles give identical intersections
+        long_slope = self.__inverse_slope(ax, ay, cx, cy)
+        upper_slope = self.__inverse_slope(ax, ay, bx, by)
+        lower_slope = self.__inverse_slope(bx, by, cx, cy)
+
+        row_counts = cy - ay
+        row_total = int(np.sum(row_counts))
+        triangle_ids = np.repeat(np.arange(len(triangles)), row_counts)
+        row_offsets = np.arange(row_total) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+        rows = np.repeat(ay, row_counts) + row_offsets
+        row_centers = rows + 0.5
+
+        long_x = np.repeat(ax, row_counts) + (row_centers - np.repeat(ay, row_counts)) * np.repeat(long_slope, row_counts)
+        upper = row_centers < np.repeat(by, row_counts)
+        short_x = np.where(upper,
+                           np.repeat(ax, row_counts) + (row_centers - np.repeat(ay, row_counts)) * np.repeat(upper_slope, row_counts),
+                           np.repeat(bx, row_counts) + (row_centers - np.repeat(by, row_counts)) * np.repeat(lower_slope, row_counts))
+
+        starts = np.ceil(np.minimum(long_x, short_x) - 0.5).astype(np.int64)
+        ends = np.ceil(np.maximum(long_x, short_x) - 0.5).astype(np.int64)
+        np.clip(starts, 0, self.width, out=starts)
+        np.clip(ends, starts, self.width, out=ends)
+        return triangle_ids, rows, starts, ends
+
+    @staticmethod
+    def __inverse_slope(px: np.ndarray, py: np.ndarray, qx: np.ndarray, qy: np.ndarray):
+        dy = qy - py
+        return (qx - px) / np.where(dy == 0, 1, dy)
+
+    def get_pixel_indices(self, triangles: np.ndarray, spans: tuple = None):
+        """
+        Returns (triangle_ids, pixel_indices) for every covered pixel, where
+        pixel_indices are flat indices into an (height, width) image. spans
+        may be given if they were already computed by get_spans.
+        """
+        triangle_ids, rows, starts, ends = self.get_spans(triangles) if spans is None else spans
+        lengths = ends - starts
+        pixel_triangle_ids = np.repeat(triangle_ids, lengths)
+        span_offsets = np.arange(len(pixel_triangle_ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pixel_indices = np.repeat(rows * self.width + starts, lengths) + span_offsets
+        return pixel_triangle_ids, pixel_indices
+
+    def label(self, triangles_batch: list, labels: np.ndarray = None, spans: tuple = None):
+        """
+        Rasterizes a batch of triangulations into a shared (N, H, W) buffer
+        holding, for each pixel, the global index of the triangle covering it.
+        Global indices follow the concatenation of the batch; uncovered pixels
+        are labeled with the total triangle count. spans may be given if they
+        were already computed for the concatenated triangles.
+        """
+        n = len(triangles_batch)
+        triangle_counts = [len(triangles) for triangles in triangles_batch]
+        triangle_total = int(np.sum(triangle_counts))
+
+        if labels is None:
+            labels = np.empty((n, self.height, self.width), dtype=np.int32)
+        labels.fill(triangle_total)
+
+        if n == 0 or triangle_total == 0:
+            return labels
+
+        triangles = np.concatenate([np.asarray(t).reshape(-1, 3, 2) for t in triangles_batch])
+        triangle_ids, pixel_indices = self.get_pixel_indices(triangles, spans)
+
+        image_size = self.width * self.height
+        triangle_images = np.repeat(np.arange(n), triangle_counts)
+        labels.reshape(-1)[triangle_images[triangle_ids] * image_size + pixel_indices] = triangle_ids
+        return labels
@@ -0,0 +1,163 @@
+import numpy as np
+from scipy.spatial import Delaunay
+
+MAX_MOVED_RATE = 0.1 # Above this rate of moved vertices the triangulation is rebuilt
+MAX_FLIPS_PER_VERTEX = 16
+
+class Triangulation():
+    """
+    Immutable Delaunay triangulation of an individual's vertices.
+
+    A child can be triangulated from its parent's triangulation: if only a
+    few vertices moved, the parent's simplices are kept and the edges around
+    the moved vertices are repaired with Lawson flips. The triangulation is
+    rebuilt with Qhull whenever the update cannot be done safely (too many
+    moved vertices, inverted or degenerate triangles or moved hull vertices).
+    Cocircular points keep the parent's diagonal, which is as valid a
+    Delaunay triangulation as the one Qhull would choose.
+
+    A repaired triangulation keeps the slots of its parent's triangles and
+    lists in `changed` the slots whose triangles moved or were flipped
+    (None when it was built with Qhull).
+    """
+    def __init__(self, vertices: np.ndarray, simplices: np.ndarray, neighbors: np.ndarray,
+                 changed: np.ndarray = None):
+        self.vertices = vertices
+        self.simplices = simplices
+        self.neighbors = neighbors
+        self.changed = changed
+
+    @classmethod
+    def build(cls, vertices: np.ndarray):
+        vertices = np.asarray(vertices, dtype=np.int64)
+        tri = Delaunay(vertices)
+        return cls(vertices,
+                   tri.simplices.astype(np.int32),
+                   tri.neighbors.astype(np.int32))
+
+    @classmethod
+    def update(cls, parent, vertices: np.ndarray, max_moved_rate=MAX_MOVED_RATE):
+        vertices = np.asarray(vertices, dtype=np.int64)
+        if parent is None or parent.vertices.shape != vertices.shape:
+            return cls.build(vertices)
+
+        moved = np.flatnonzero(np.any(parent.vertices != vertices, axis=1))
+        if len(moved) == 0:
+            return parent
+        if len(moved) > max_moved_rate * len(vertices) or not parent.__can_move(moved):
+            return cls.build(vertices)
+
+        triangulation = parent.__repair(vertices, moved)
+        if triangulation is None:
+            return cls.build(vertices)
+        return triangulation
+
+    def __deepcopy__(self, memo):
+        return self # Immutable, shared between parents and clones
+
+    def __can_move(self, moved: np.ndarray):
+        # Moved vertices must be interior vertices of the triangulation
+        hull_vertices = self.__get_hull_vertices()
+        triangulated = np.zeros(len(self.vertices), dtype=bool)
+        triangulated[self.simplices] = True
+        if np.any(hull_vertices[moved]) or not np.all(triangulated[moved]):
+            return False
+
+        # Points dropped by Qhull (duplicates) could reappear
+        dropped = self.vertices[~triangulated]
+        if len(dropped) > 0:
+            moved_positions = self.vertices[moved]
+            if np.any(np.all(dropped[:, None] == moved_positions[None], axis=2)):
+                return False
+        return True
+
+    def __get_hull_vertices(self):
+        hull_vertices = np.zeros(len(self.vertices), dtype=bool)
+        hull_triangles, hull_indices = np.nonzero(self.neighbors == -1)
+        for offset in (1, 2):
+            hull_vertices[self.simplices[hull_triangles, (hull_indices + offset) % 3]] = True
+        return hull_vertices
+
+    @staticmethod
+    def __orientation(a: np.ndarray, b: np.ndarray, c: np.ndarray):
+        return (b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) - \
+               (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0])
+
+    @staticmethod
+    def __incircle(a: np.ndarray, b: np.ndarray, c: np.ndarray, d: np.ndarray):
+        # Exact integer determinant (for images up to ~20000 pixels wide),
+        # positive when d is inside the circumcircle of the positively
+        # oriented triangle (a, b, c)
+        ad, bd, cd = a - d, b - d, c - d
+        ad2 = np.sum(ad * ad, axis=-1)
+        bd2 = np.sum(bd * bd, axis=-1)
+        cd2 = np.sum(cd * cd, axis=-1)
+        return ad[..., 0] * (bd[..., 1] * cd2 - bd2 * cd[..., 1]) - \
+               ad[..., 1] * (bd[..., 0] * cd2 - bd2 * cd[..., 0]) + \
+               ad2 * (bd[..., 0] * cd[..., 1] - bd[..., 1] * cd[..., 0])
+
+    def __repair(self, vertices: np.ndarray, moved: np.ndarray):
+        simplices = self.simplices
+        neighbors = self.neighbors
+        parent_triangles = self.vertices[simplices]
+        parent_orientations = self.__orientation(parent_triangles[:, 0], parent_triangles[:, 1], parent_triangles[:, 2])
+        sign = np.sign(np.sum(parent_orientations)) # Orientation used by Qhull
+
+        incident = np.flatnonzero(np.any(np.isin(simplices, moved), axis=1))
+        triangles = vertices[simplices[incident]]
+        if np.any(sign * self.__orientation(triangles[:, 0], triangles[:, 1], triangles[:, 2]) <= 0):
+            return None
+
+        # Edges of the incident triangles that are not locally Delaunay
+        edges = []
+        for j in range(3):
+            opposite = neighbors[incident, j]
+            inner = opposite >= 0
+            t, n = incident[inner], opposite[inner]
+            b, c = simplices[t, (j + 1) % 3], simplices[t, (j + 2) % 3]
+            d = np.sum(simplices[n], axis=1) - b - c
+            incircle = sign * self.__incircle(vertices[simplices[t, j]], vertices[b], vertices[c], vertices[d])
+            edges.extend((int(triangle), j) for triangle in t[incircle > 0])
+
+        if len(edges) == 0:
+            return Triangulation(vertices, simplices, neighbors, incident)
+
+        simplices, neighbors = simplices.copy(), neighbors.copy()
+        max_flips = MAX_FLIPS_PER_VERTEX * len(moved)
+        flips = 0
+        flipped = []
+        while edges:
+            t, j = edges.pop()
+            n = neighbors[t, j]
+            if n < 0:
+                continue
+
+            k = int(np.flatnonzero(neighbors[n] == t)[0])
+            a, b, c = simplices[t, j], simplices[t, (j + 1) % 3], simplices[t, (j + 2) % 3]
+            d = simplices[n, k]
+            if sign * self.__incircle(vertices[a], vertices[b], vertices[c], vertices[d]) <= 0:
+                continue
+
+            flips += 1
+            if flips > max_flips:
+                return None
+            flipped.extend((t, n))
+
+            # Flip edge (b, c) of triangles t = (a, b, c) and n = (d, c, b)
+            # into t = (a, b, d) and n = (a, d, c)
+            t_ca, t_ab = neighbors[t, (j + 1) % 3], neighbors[t, (j + 2) % 3]
+            n_bd, n_dc = neighbors[n, (k + 1) % 3], neighbors[n, (k + 2) % 3]
+            simplices[t] = (a, b, d)
+            neighbors[t] = (n_bd, n, t_ab)
+            simplices[n] = (a, d, c)
+            neighbors[n] = (n_dc, t_ca, t)
+
+            if n_bd >= 0:
+                neighbors[n_bd][neighbors[n_bd] == n] = t
+            if t_ca >= 0:
+                neighbors[t_ca][neighbors[t_ca] == t] = n
+
+            edges.extend([(t, 0), (t, 2), (n, 0), (n, 1)])
+
+        changed = np.union1d(incident, np.array(flipped, dtype=incident.dtype))
+        return Triangulation(vertices, simplices, neighbors, changed)
@@ -0,0 +1,33 @@
+import random
+
+import numpy as np
+
+from main import main
+
+def run(tmp_path, stop_generation=None, resume=False):
+    args = dict(seed=1, INDPB=0.1, CXPB=0.9, MUTPB=0.1, NGEN=12, MU=10, LAMBDA=10,
+                selection='best', tournament_size=2, gaussian_rate=0.05,
+                input_path='data/inputs', input_name='fox.jpg', width=60, height=None,
+                vertex_count=50, cpu_count=1, verbose=0,
+                checkpoint_path=str(tmp_path / "checkpoint.npz"), checkpoint_generations=3)
+    random.seed(args["seed"])
+    dc = main(args).deap_configurer
+    generation = [0]
+    image_added_callback = lambda _, gen: generation.__setitem__(0, gen)
+    stop_condition_callback = lambda: stop_generation is not None and generation[0] >= stop_generation
+    return dc.run_algorithm(image_added_callback, stop_condition_callback,
+                            parallel=False, verbose=False, resume=resume)
+
+def test_resumed_run_matches_uninterrupted_run(tmp_path):
+    _, logbook, hall_of_fame, best_fitnesses = run(tmp_path)
+    _, stopped_logbook, _, _ = run(tmp_path, stop_generation=7) # Checkpointed when it stops
+    assert len(stopped_logbook) < len(logbook)
+    assert list(stopped_logbook) == list(logbook)[:len(stopped_logbook)]
+    _, resumed_logbook, resumed_hall_of_fame, resumed_best_fitnesses = run(tmp_path, resume=True)
+
+    assert resumed_best_fitnesses == best_fitnesses
+    assert list(resumed_logbook) == list(logbook)
+    assert len(resumed_hall_of_fame) == len(hall_of_fame)
+    for individual, resumed_individual in zip(hall_of_fame, resumed_hall_of_fame):
+        assert np.array_equal(resumed_individual, individual)
+        assert resumed_individual.fitness.values == individual.fitness.values
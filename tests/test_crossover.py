@@ -0,0 +1,28 @@
+import numpy as np
+
+from src.lib.individual import IndividualArray
+from src.models.evolutionary_algorithm.ea_methods import EA
+
+def get_individuals(vertex_count: int):
+    ind1 = IndividualArray(np.zeros((vertex_count, 2)))
+    ind2 = IndividualArray(np.ones((vertex_count, 2)))
+    return ind1, ind2
+
+def test_cx_two_point_single_vertex():
+    ea = EA(None, seed=0)
+    ind1, ind2 = ea.cx_two_point(*get_individuals(1))
+    assert np.all(ind1 == 0) and np.all(ind2 == 1)
+
+def test_cx_two_point_swaps_whole_vertices():
+    ea = EA(None, seed=0)
+    ind1, ind2 = ea.cx_two_point(*get_individuals(10))
+    assert np.all(ind1[:, 0] == ind1[:, 1])
+    assert np.array_equal(ind1 + ind2, np.ones((10, 2)))
+
+def test_cx_two_point_population_single_vertex():
+    ea = EA(None, seed=0)
+    pairs = [get_individuals(1), get_individuals(10), get_individuals(1)]
+    ea.cx_two_point_population(pairs)
+    for ind1, ind2 in pairs:
+        assert np.array_equal(ind1 + ind2, np.ones((len(ind1), 2)))
+    assert np.all(pairs[0][0] == 0) and np.all(pairs[2][1] == 1)
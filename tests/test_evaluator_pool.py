@@ -0,0 +1,24 @@
+import numpy as np
+from PIL import Image
+
+from src.lib.evaluator_pool import EvaluatorPool
+from src.models.evolutionary_algorithm.ea_methods import EA
+from src.utils.image_processor import ImageProcessor, RENDER_FITNESS
+
+def get_ea(original_image_matrix: np.ndarray, **kwargs):
+    ip = ImageProcessor(input_image=Image.fromarray(original_image_matrix), vertex_count=24, **kwargs)
+    ip.load_matrix(original_image_matrix)
+    return EA(ip, seed=0)
+
+def test_load_reconfigures_workers_of_the_same_image():
+    original_image_matrix = np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8)
+    ea = get_ea(original_image_matrix)
+    population = ea.init_population(4, 39, 29, 40)
+    with EvaluatorPool(ea, cpu_count=1) as pool:
+        assert np.allclose(pool.evaluate(population), ea.eval_population(population))
+
+        outlined_ea = get_ea(original_image_matrix, tri_outline="black", fitness_mode=RENDER_FITNESS)
+        pool.load(outlined_ea)
+        expected = [outlined_ea.eval_individual(individual)[0] for individual in population]
+        assert np.allclose(pool.evaluate(population), expected)
+        assert not np.allclose(expected, ea.eval_population(population))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from src.utils.image_processor import ImageProcessor
+
+WIDTH, HEIGHT = 40, 30
+CORNERS = np.array([(0, 0), (0, HEIGHT), (WIDTH, 0), (WIDTH, HEIGHT)])
+
+def get_image_processor(seed=0):
+    ip = ImageProcessor(input_name="random.png")
+    ip.load_matrix(np.random.default_rng(seed).integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8))
+    return ip
+
+def get_random_vertices(rng, vertex_count=30):
+    vertices = np.stack([rng.integers(0, WIDTH+1, vertex_count),
+                         rng.integers(0, HEIGHT+1, vertex_count)], axis=1)
+    return np.concatenate([vertices, CORNERS])
+
+def get_duplicated_vertices(rng):
+    vertices = get_random_vertices(rng, 15)
+    return np.concatenate([vertices, vertices[rng.integers(0, len(vertices), 10)]])
+
+def get_collinear_vertices(rng):
+    x = rng.integers(0, WIDTH+1, 10)
+    y = rng.integers(0, HEIGHT+1, 10)
+    lines = [np.stack([x, np.full(10, HEIGHT // 2)], axis=1), # Horizontal
+             np.stack([np.full(10, WIDTH // 3), y], axis=1), # Vertical
+             np.stack([y, y], axis=1)] # Diagonal
+    return np.concatenate(lines + [CORNERS])
+
+@pytest.mark.parametrize("get_vertices", [get_random_vertices, get_duplicated_vertices, get_collinear_vertices])
+def test_analytic_errors_match_rendered_errors(get_vertices):
+    ip = get_image_processor()
+    rng = np.random.default_rng(1)
+    vertices_batch = [get_vertices(rng) for _ in range(8)]
+
+    rendered = ip.error_kernel.get_population_squared_error(ip.create_polygonal_matrices(vertices_batch))
+    assert np.array_equal(ip.get_squared_errors(vertices_batch), rendered)
@@ -0,0 +1,38 @@
+import pytest
+from PIL import Image
+
+from src.utils.image_processor import ImageProcessor
+from src.utils.preprocessing_cache import PreprocessingCache
+
+@pytest.fixture
+def entropy_calls(monkeypatch):
+    calls = []
+    entropy = Image.Image.entropy
+
+    def counted_entropy(image, *args, **kwargs):
+        calls.append(image)
+        return entropy(image, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "entropy", counted_entropy)
+    return calls
+
+def read_image(preprocessing_cache: PreprocessingCache, vertex_count=None):
+    ip = ImageProcessor(input_name="fox.jpg", width=60, vertex_count=vertex_count,
+                        preprocessing_cache=preprocessing_cache)
+    ip.read_image()
+    return ip
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_entropy_is_only_computed_for_the_vertex_count(entropy_calls, tmp_path, on_disk):
+    expected = read_image(None).vertex_count
+    entropy_calls.clear()
+
+    cache = PreprocessingCache(cache_dir=str(tmp_path) if on_disk else None)
+    assert read_image(cache, vertex_count=100).vertex_count == 96
+    assert len(entropy_calls) == 0
+
+    if on_disk:
+        cache = PreprocessingCache(cache_dir=str(tmp_path)) # Read from the file
+    assert read_image(cache).vertex_count == expected
+    assert read_image(cache).vertex_count == expected
+    assert len(entropy_calls) == 1 # Cached once computed
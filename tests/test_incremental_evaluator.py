@@ -0,0 +1,47 @@
+import copy
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.lib.fitness_cache import FitnessCache
+from src.lib.individual import IndividualArray
+from src.models.alternatives.incremental_evaluator import IncrementalEvaluator
+from src.models.evolutionary_algorithm.ea_methods import EA
+from src.utils.image_processor import ImageProcessor
+
+def get_ea(seed=0):
+    rng = np.random.default_rng(seed)
+    image = Image.fromarray(rng.integers(0, 256, (30, 40, 3), dtype=np.uint8))
+    ea = EA(ImageProcessor(input_image=image, width=40, height=30, vertex_count=34), seed=seed)
+    ea.load_image()
+    return ea
+
+@pytest.mark.parametrize("fitness_cache_size", [0, 64])
+def test_propose_accept_undo_matches_eval_individual(fitness_cache_size):
+    ea = get_ea()
+    ip = ea.image_processor
+    coordinates = ea.init_coordinates(ip.width-1, ip.height-1, ip.vertex_count*2)
+    fitness_cache = FitnessCache(fitness_cache_size) if fitness_cache_size else None
+    evaluator = IncrementalEvaluator(ea, coordinates.astype(np.float64), fitness_cache)
+    # Candidates inherit the triangulation of the individual as in the EA,
+    # so cocircular points are split by the same diagonal
+    individual = IndividualArray(coordinates)
+    assert evaluator.fitness == ea.eval_individual(individual)[0]
+
+    rng = np.random.default_rng(1)
+    for _ in range(300):
+        gene = int(rng.integers(ip.vertex_count*2))
+        value = individual.reshape(-1)[gene] + rng.integers(-8, 9)
+        limit = ip.width if gene % 2 == 0 else ip.height
+        candidate = copy.deepcopy(individual)
+        candidate.reshape(-1)[gene] = np.clip(value, 0, limit)
+
+        fitness = evaluator.propose(gene, value)
+        assert fitness == ea.eval_individual(candidate)[0]
+        if rng.random() < 0.5:
+            evaluator.accept()
+            individual = candidate
+        else:
+            evaluator.undo()
+        assert evaluator.fitness == ea.eval_individual(individual)[0]
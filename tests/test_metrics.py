@@ -0,0 +1,68 @@
+import fakeredis
+import pytest
+
+from server.lib import broker
+from server.lib import metrics
+from src.lib.profiler import STAGES, GENERATION_COLUMN, EVALUATION_STAGE, get_column
+
+@pytest.fixture(autouse=True)
+def fake_broker(monkeypatch):
+    monkeypatch.setattr(broker, "broker", fakeredis.FakeRedis())
+
+def get_samples():
+    # Sample lines of the exposition, by name and labels
+    lines = [line for line in metrics.render().splitlines() if not line.startswith("#")]
+    return dict(line.rsplit(" ", 1) for line in lines)
+
+def test_counters_and_gauges():
+    metrics.inc(metrics.RUNS, outcome="completed")
+    metrics.inc(metrics.RUNS, outcome="completed")
+    metrics.inc(metrics.RUNS, outcome="cached")
+    metrics.inc(metrics.IDLE_KILLS)
+    metrics.set_gauge(metrics.QUEUED_RUNS, 3)
+    metrics.set_gauge(metrics.QUEUED_RUNS, 2)
+
+    samples = get_samples()
+    assert samples['polygonal_runs_total{outcome="completed"}'] == "2"
+    assert samples['polygonal_runs_total{outcome="cached"}'] == "1"
+    assert samples["polygonal_idle_kills_total"] == "1"
+    assert samples["polygonal_queued_runs"] == "2"
+
+def test_histograms_are_cumulative():
+    for value in [0.05, 3, 100]:
+        metrics.observe(metrics.QUEUE_WAIT_SECONDS, value)
+
+    samples = get_samples()
+    buckets = [(le, samples[f'polygonal_queue_wait_seconds_bucket{{le="{le}"}}'])
+               for le in metrics.BUCKETS[metrics.QUEUE_WAIT_SECONDS] + ["+Inf"]]
+    assert [count for _, count in buckets] == ["1"] * 3 + ["2"] * 4 + ["3"] * 5
+    assert samples["polygonal_queue_wait_seconds_sum"] == "103.05"
+    assert samples["polygonal_queue_wait_seconds_count"] == "3"
+
+def test_generation_hook():
+    hook = metrics.get_generation_hook(host="host", worker="host:1")
+    record = {"evals": 40, GENERATION_COLUMN: 0.5, **{get_column(stage): 0.0 for stage in STAGES}}
+    hook(1, {**record, get_column(EVALUATION_STAGE): 0.25})
+    hook(2, {**record, "evals": 10, GENERATION_COLUMN: 0.25})
+
+    samples = get_samples()
+    assert samples['polygonal_evaluations_total{host="host"}'] == "50"
+    assert samples['polygonal_evaluations_per_second{worker="host:1"}'] == "40"
+    assert samples['polygonal_stage_seconds_total{stage="evaluation"}'] == "0.25"
+    assert samples["polygonal_generation_seconds_count"] == "2"
+    assert samples['polygonal_generation_seconds_bucket{le="0.25"}'] == "1"
+    key = metrics.EXPIRING_GAUGE_PREFIX + 'polygonal_evaluations_per_second{worker="host:1"}'
+    assert 0 < broker.broker.ttl(key) <= metrics.EXPIRING_GAUGE_SECONDS
+
+def test_exposition_format():
+    metrics.observe(metrics.PAYLOAD_BYTES, 2000)
+    lines = metrics.render().splitlines()
+    for name, (metric_type, description) in metrics.METRICS.items():
+        assert lines.index(f"# HELP {name} {description}") + 1 == lines.index(f"# TYPE {name} {metric_type}")
+
+    # Buckets of a histogram are sorted by their upper bound, before its sum and count
+    start = lines.index(f"# TYPE {metrics.PAYLOAD_BYTES} histogram") + 1
+    family = [line.split(" ")[0] for line in lines[start:start + len(metrics.BUCKETS[metrics.PAYLOAD_BYTES]) + 3]]
+    assert family == [f'{metrics.PAYLOAD_BYTES}_bucket{{le="{le}"}}'
+                      for le in metrics.BUCKETS[metrics.PAYLOAD_BYTES] + ["+Inf"]] + \
+                     [f"{metrics.PAYLOAD_BYTES}_sum", f"{metrics.PAYLOAD_BYTES}_count"]
@@ -0,0 +1,48 @@
+import json
+
+import fakeredis
+import pytest
+
+from server.lib import broker
+from server.modules.transform import transform_controller
+
+USER_ID = "127.0.0.1user"
+
+@pytest.fixture(autouse=True)
+def fake_broker(monkeypatch):
+    monkeypatch.setattr(broker, "broker", fakeredis.FakeRedis())
+
+def parse_event(message: str):
+    fields = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+    return fields.get("id"), fields.get("event"), json.loads(fields["data"])
+
+def test_read_stream():
+    key = broker.get_progress_stream_key(USER_ID)
+    event_ids = [broker.add_to_stream(key, {"generation": gen}) for gen in range(3)]
+    broker.add_to_stream(key, json.dumps({"generation": 3}), object=False)
+
+    events = broker.read_stream(key, block_seconds=0.01)
+    assert [event_id for event_id, _ in events] == event_ids + [events[-1][0]]
+    assert [data["generation"] for _, data in events] == [0, 1, 2, 3]
+    assert broker.read_stream(key, events[-1][0], block_seconds=0.01) == []
+    assert broker.read_stream_range(key) == events
+
+def test_progress_events_until_finished():
+    key = broker.get_progress_stream_key(USER_ID)
+    first_id = broker.add_to_stream(key, {"generation": 1})
+    broker.add_to_stream(key, {"generation": 2})
+    broker.add_to_stream(key, {"finished": True})
+
+    events = [parse_event(message) for message in transform_controller.get_progress_events(USER_ID)]
+    assert [data for _, _, data in events] == [{"generation": 1}, {"generation": 2}, {"finished": True}]
+    assert events[-1][1] == "finished"
+    assert broker.get(broker.get_last_connection_key(USER_ID)) is not None
+
+    # Reconnections continue after the last received event
+    events = [parse_event(message) for message in transform_controller.get_progress_events(USER_ID, first_id)]
+    assert [data for _, _, data in events] == [{"generation": 2}, {"finished": True}]
+
+def test_progress_events_error():
+    broker.add_to_stream(broker.get_progress_stream_key(USER_ID), {"error": "Something went wrong"})
+    (event_id, event, data), = [parse_event(message) for message in transform_controller.get_progress_events(USER_ID)]
+    assert event == "failed" and data == {"error": "Something went wrong"}
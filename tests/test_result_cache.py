@@ -0,0 +1,87 @@
+import json
+import time
+import itertools
+
+import fakeredis
+import pytest
+
+from server.lib import broker
+from server.lib import result_cache
+from server.lib.celery import tasks
+from server.modules.transform import transform_controller
+
+USER_ID = "127.0.0.1user"
+
+class FakeTime():
+    # Distinct access times, so entries are evicted in a known order
+    def __init__(self):
+        self.counter = itertools.count()
+
+    def time(self):
+        return float(next(self.counter))
+
+@pytest.fixture(autouse=True)
+def fake_broker(monkeypatch):
+    monkeypatch.setattr(broker, "broker", fakeredis.FakeRedis())
+
+def get_events(generations: int, fitness=1.0):
+    return [json.dumps({"generation": gen, "individuals": [{"fitness": fitness, "gen": gen}]})
+            for gen in range(generations)]
+
+def test_set_and_replay():
+    events = get_events(5)
+    result_cache.set("key", events, 5, ttl=60)
+    entry = result_cache.get("key")
+    assert entry["NGEN"] == 5 and entry["best"] == json.loads(events[-1])["individuals"][0]
+    assert entry["events"] == [json.loads(event) for event in events]
+    assert 0 < broker.broker.ttl(result_cache.get_entry_key("key")) <= 60
+
+    assert not result_cache.replay("key", USER_ID, 6) # The request allows more generations
+    assert not result_cache.replay("other", USER_ID, 5)
+    assert broker.read_stream_range(broker.get_progress_stream_key(USER_ID)) == []
+
+    assert result_cache.replay("key", USER_ID, 4)
+    replayed = [data for _, data in broker.read_stream_range(broker.get_progress_stream_key(USER_ID))]
+    assert replayed == entry["events"] + [{"finished": True, "cached": True}]
+
+def test_expired_entries_are_removed():
+    result_cache.set("key", get_events(5), 5)
+    broker.broker.delete(result_cache.get_entry_key("key")) # Expired by Redis
+    assert result_cache.get("key") is None
+    assert broker.broker.zcard(result_cache.INDEX_KEY) == 0
+    assert broker.broker.hlen(result_cache.SIZES_KEY) == 0
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    monkeypatch.setattr(result_cache, "time", FakeTime())
+    result_cache.set("first", get_events(5), 5)
+    max_bytes = 2 * int(broker.broker.hget(result_cache.SIZES_KEY, "first")) + 16
+    result_cache.set("second", get_events(5, fitness=2.0), 5, max_bytes=max_bytes)
+    assert result_cache.get("first") is not None # Used after the second one
+
+    result_cache.set("third", get_events(5, fitness=3.0), 5, max_bytes=max_bytes)
+    assert result_cache.get("second") is None
+    assert result_cache.get("first") is not None and result_cache.get("third") is not None
+
+    result_cache.set("large", get_events(5000), 5000, max_bytes=max_bytes) # Larger than the cache
+    assert result_cache.get("large") is None and result_cache.get("first") is not None
+
+def run_task(monkeypatch, tmp_path, cache_key: str, last_connection: float):
+    monkeypatch.setattr(tasks, "CHECKPOINT_DIR", str(tmp_path))
+    monkeypatch.setattr(tasks, "PREPROCESSING_CACHE", None)
+    monkeypatch.setattr(tasks.transform_image, "is_aborted", lambda **kwargs: False)
+    args = {**transform_controller.get_form_arguments({"NGEN": 3, "MU": 4, "LAMBDA": 4,
+                                                       "vertex_count": 20, "width": 30}),
+            "verbose": 0}
+    with open("data/inputs/fox.jpg", "rb") as image_file:
+        image_processor_args = {**args, "input_image": image_file.read()}
+    broker.set(broker.get_last_connection_key(USER_ID), last_connection)
+    tasks.transform_image.run(image_processor_args, args, USER_ID, cache_key=cache_key)
+
+def test_runs_stopped_by_the_client_are_not_cached(monkeypatch, tmp_path):
+    run_task(monkeypatch, tmp_path, "disconnected", last_connection=time.time() - 1000)
+    events = broker.read_stream_range(broker.get_progress_stream_key(USER_ID))
+    assert events[-1][1] == {"finished": True} and len(events) < 5 # Stopped, not failed
+    assert result_cache.get("disconnected") is None
+
+    run_task(monkeypatch, tmp_path, "connected", last_connection=time.time())
+    assert result_cache.get("connected")["NGEN"] == 3
@@ -0,0 +1,79 @@
+import fakeredis
+import pytest
+
+from server import config
+from server.lib import broker
+from server.lib import scheduler
+from server.lib.celery import tasks
+
+EA_ARGS = {"MU": 10, "LAMBDA": 10, "NGEN": 50, "vertex_count": 100, "max_seconds": 0, "max_evals": 0}
+PIXELS = 100 * 100
+
+class FakeTask():
+    def __init__(self):
+        self.dispatched = []
+        self.aborted = []
+
+    def apply_async(self, args, kwargs, task_id=None):
+        self.dispatched.append(args[2]) # user_id
+
+    def AsyncResult(self, task_id):
+        aborted = self.aborted
+        class AsyncResult():
+            def abort(self):
+                aborted.append(task_id)
+        return AsyncResult()
+
+@pytest.fixture(autouse=True)
+def fake_broker(monkeypatch):
+    monkeypatch.setattr(broker, "broker", fakeredis.FakeRedis())
+    monkeypatch.setattr(config, "SCHEDULER_SLOTS", 1)
+
+@pytest.fixture
+def fake_task(monkeypatch):
+    task = FakeTask()
+    monkeypatch.setattr(tasks, "transform_image", task)
+    return task
+
+def submit(user_id: str, owner: str):
+    return scheduler.submit({"input_image": b"image"}, EA_ARGS, user_id, owner, PIXELS)
+
+def finish(user_id: str):
+    scheduler.finish(broker.get(scheduler.get_user_job_key(user_id)), EA_ARGS["MU"] + 10 * EA_ARGS["LAMBDA"])
+
+def test_owners_share_the_slots(fake_task):
+    for user_id in ["a1", "a2", "a3"]:
+        submit(user_id, "owner_a")
+    assert submit("b1", "owner_b") == {"state": "queued", "queue_depth": 3, "position": 1,
+                                       "eta_seconds": round(scheduler.get_job_cost(PIXELS, EA_ARGS) /
+                                                            scheduler.DEFAULT_COST_RATE)}
+    assert fake_task.dispatched == ["a1"]
+
+    # The job of the second owner goes before the queued ones of the first
+    for user_id in ["a1", "b1", "a2"]:
+        finish(user_id)
+    assert fake_task.dispatched == ["a1", "b1", "a2", "a3"]
+    assert scheduler.get_status("a3")["state"] == "running"
+    assert scheduler.get_queue_length() == 0 and scheduler.get_running_count() == 1
+    assert scheduler.get_cost_rate() != scheduler.DEFAULT_COST_RATE # Calibrated by finished jobs
+
+def test_cancel_removes_queued_jobs_and_aborts_running_ones(fake_task):
+    submit("a1", "owner_a")
+    submit("a2", "owner_a")
+    scheduler.cancel("a2")
+    assert scheduler.get_queue_length() == 0 and scheduler.get_status("a2")["state"] == "unknown"
+
+    scheduler.cancel("a1")
+    assert fake_task.aborted == [broker.get(scheduler.get_user_job_key("a1"))]
+
+def test_fit_budget():
+    seconds = scheduler.get_job_cost(PIXELS, EA_ARGS) / scheduler.DEFAULT_COST_RATE
+    assert scheduler.fit_budget(PIXELS, EA_ARGS, max_seconds=seconds) == EA_ARGS
+
+    fitted = scheduler.fit_budget(PIXELS, EA_ARGS, max_seconds=seconds / 2)
+    assert scheduler.MIN_NGEN <= fitted["NGEN"] < EA_ARGS["NGEN"]
+    assert scheduler.get_job_cost(PIXELS, fitted) / scheduler.DEFAULT_COST_RATE <= seconds / 2
+    assert EA_ARGS["NGEN"] == 50 # Not modified
+
+    with pytest.raises(scheduler.SchedulerException):
+        scheduler.fit_budget(PIXELS, EA_ARGS, max_seconds=seconds / 20)
@@ -0,0 +1,77 @@
+import random
+
+import numpy as np
+from PIL import Image
+
+from main import main
+from src.lib.fitness_cache import FitnessCache
+from src.lib.island_model import get_island_evals
+from src.lib.termination import Termination
+from src.models.alternatives.incremental_evaluator import IncrementalEvaluator
+from src.models.alternatives.local_search import LocalSearchSolver, LOCAL_SEARCH_METHOD
+from src.models.evolutionary_algorithm.ea_methods import EA
+from src.utils.image_processor import ImageProcessor
+
+def get_ea(seed=0):
+    rng = np.random.default_rng(seed)
+    image = Image.fromarray(rng.integers(0, 256, (30, 40, 3), dtype=np.uint8))
+    ea = EA(ImageProcessor(input_image=image, width=40, height=30, vertex_count=34), seed=seed)
+    ea.load_image()
+    return ea
+
+def test_incremental_evaluator_counts_computed_evaluations():
+    ea = get_ea()
+    ip = ea.image_processor
+    individual = ea.init_coordinates(ip.width-1, ip.height-1, ip.vertex_count*2).astype(np.float64)
+    evaluator = IncrementalEvaluator(ea, individual, FitnessCache(64))
+    assert evaluator.evaluations == 1
+
+    evaluator.propose(0, individual[0, 0]) # The vertex does not move
+    evaluator.undo()
+    assert evaluator.evaluations == 1
+
+    value = 0 if individual[0, 0] > 0 else 1
+    for _ in range(2): # The second proposal is a cache hit
+        evaluator.propose(0, value)
+        evaluator.undo()
+    assert evaluator.evaluations == 2
+
+def test_local_search_stops_at_max_evals():
+    solver = LocalSearchSolver(get_ea(), seed=0)
+    solver.solve(LOCAL_SEARCH_METHOD, max_iter=1000, threshold=3, max_evals=50, verbose=False)
+    assert solver.evaluations == 50
+
+def get_args(**kwargs):
+    return dict(seed=1, INDPB=0.1, CXPB=0.9, MUTPB=0.1, NGEN=100, MU=10, LAMBDA=10,
+                selection='best', tournament_size=2, gaussian_rate=0.05,
+                input_path='data/inputs', input_name='fox.jpg', width=60, height=None,
+                vertex_count=50, cpu_count=1, verbose=0, **kwargs)
+
+def test_evolutionary_algorithm_stops_at_max_evals():
+    args = get_args(max_evals=45)
+    random.seed(args["seed"])
+    dc = main(args).deap_configurer
+    _, logbook, _, _ = dc.run_algorithm(parallel=False, verbose=False)
+    evals = np.cumsum(logbook.select("evals"))
+    # The budget is checked after every generation
+    assert evals[-1] >= 45 and evals[-2] < 45
+    assert dc.termination.reason == "budget of 45 evaluations reached"
+
+def test_time_budget_is_distinguished():
+    termination = Termination(max_seconds=10, max_evals=100)
+    termination.start(elapsed_seconds=0)
+    assert termination.should_stop([1.0], 100) and not termination.out_of_time
+    termination.start(elapsed_seconds=10)
+    assert termination.should_stop([1.0], 0) and termination.out_of_time
+
+def test_islands_split_max_evals():
+    assert [get_island_evals(10, 3, island) for island in range(3)] == [4, 3, 3]
+    assert [get_island_evals(1, 2, island) for island in range(2)] == [1, 1]
+    assert get_island_evals(0, 2, 0) == 0
+
+    args = get_args(max_evals=60, islands=2, migration_interval=2)
+    random.seed(args["seed"])
+    eac = main(args)
+    eac.run(save=False)
+    # The run ends when the first island spends its share
+    assert 60 <= sum(eac.logbook.select("evals")) < 60 + 2 * args["LAMBDA"]
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from src.utils.triangulation import Triangulation
+
+def get_triangle_keys(triangulation: Triangulation):
+    # Coordinates instead of indices: duplicated points may be triangulated
+    # with either of their indices
+    triangles = triangulation.vertices[triangulation.simplices].tolist()
+    return set(tuple(sorted(map(tuple, triangle))) for triangle in triangles)
+
+def get_areas(triangulation: Triangulation):
+    a, b, c = np.moveaxis(triangulation.vertices[triangulation.simplices], 1, 0)
+    return np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]))
+
+def get_incircles(triangulation: Triangulation):
+    # Exact incircle determinant of every triangle and the opposite vertex
+    # of each of its neighbors (positive when it is inside the circumcircle)
+    vertices, simplices, neighbors = triangulation.vertices, triangulation.simplices, triangulation.neighbors
+    triangles, sides = np.nonzero(neighbors >= 0)
+    opposite = neighbors[triangles, sides]
+    d = np.sum(simplices[opposite], axis=1) - np.sum(simplices[triangles], axis=1) + simplices[triangles, sides]
+    a, b, c = np.moveaxis(vertices[simplices[triangles]], 1, 0)
+    d = vertices[d]
+    orientation = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    ad, bd, cd = a - d, b - d, c - d
+    ad2, bd2, cd2 = np.sum(ad * ad, axis=1), np.sum(bd * bd, axis=1), np.sum(cd * cd, axis=1)
+    incircle = ad[:, 0] * (bd[:, 1] * cd2 - bd2 * cd[:, 1]) - \
+               ad[:, 1] * (bd[:, 0] * cd2 - bd2 * cd[:, 0]) + \
+               ad2 * (bd[:, 0] * cd[:, 1] - bd[:, 1] * cd[:, 0])
+    return np.sign(orientation) * incircle
+
+def get_vertices(rng, vertex_count, size):
+    vertices = rng.integers(1, size, (vertex_count, 2))
+    corners = np.array([(0, 0), (0, size), (size, 0), (size, size)])
+    return np.concatenate([vertices, corners])
+
+# Small grids have many cocircular points
+@pytest.mark.parametrize("size, vertex_count, step", [(10_000, 200, 100), (40, 60, 2)])
+def test_update_matches_qhull(size, vertex_count, step):
+    rng = np.random.default_rng(0)
+    vertices = get_vertices(rng, vertex_count, size)
+    triangulation = Triangulation.build(vertices)
+    for _ in range(50):
+        vertices = vertices.copy()
+        moved = rng.integers(0, vertex_count, 3)
+        vertices[moved] = np.clip(vertices[moved] + rng.integers(-step, step + 1, (3, 2)), 1, size - 1)
+        triangulation = Triangulation.update(triangulation, vertices)
+        expected = Triangulation.build(vertices)
+
+        assert np.array_equal(triangulation.vertices, vertices)
+        assert np.all(get_incircles(triangulation) <= 0) # Delaunay
+        assert len(triangulation.simplices) == len(expected.simplices)
+        assert get_areas(triangulation).sum() == get_areas(expected).sum()
+        if np.all(get_incircles(expected) < 0): # No cocircular points
+            assert get_triangle_keys(triangulation) == get_triangle_keys(expected)
+
+def test_update_lists_changed_triangles():
+    rng = np.random.default_rng(1)
+    vertices = get_vertices(rng, 100, 10_000)
+    parent = Triangulation.build(vertices)
+    assert parent.changed is None
+
+    vertices = vertices.copy()
+    vertices[0] += (300, -200)
+    triangulation = Triangulation.update(parent, vertices)
+    changed = np.zeros(len(parent.simplices), dtype=bool)
+    changed[triangulation.changed] = True
+    assert np.array_equal(triangulation.simplices[~changed], parent.simplices[~changed])
+    assert np.all(np.any(triangulation.simplices[changed] == 0, axis=1) |
+                  np.any(triangulation.simplices[changed] != parent.simplices[changed], axis=1))